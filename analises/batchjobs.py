@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sharded, resumable OpenAI batch jobs for classifying large sets of academic works
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import uuid
+import pandas as pd
+from itertools import islice
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import datausage as du
+
+
+# Limits of each shard (OpenAI's batch limits, with some margin for tokens):
+MAX_REQUESTS = 50_000           # Requests per batch.
+MAX_BYTES = 190 * 1024 ** 2     # Size of the input file (the limit is 200 MB).
+MAX_TOKENS = 2_000_000          # Input tokens enqueued per batch (depends on the model and tier).
+MAX_SUBMITS = 4                 # Shards uploaded and submitted at once.
+MAX_ATTEMPTS = 3                # Submissions of a shard before giving up.
+POLL_INTERVAL = 60              # Seconds between checks of the batches' statuses.
+
+# Shard states:
+PLANNED, SUBMITTED, COMPLETED, FAILED = 'planned', 'submitted', 'completed', 'failed'
+# OpenAI batch statuses that end a batch without results:
+FAILED_STATUSES = {'failed', 'expired', 'cancelled'}
+
+
+def now() -> str:
+    """
+    Return the current date and time (str).
+    """
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def in_jobs_dir(works_csv, prompt_template) -> str:
+    """
+    Return the default job folder for classifying the works in
+    `works_csv` (str) with `prompt_template` (str): a folder next
+    to the CSV, named after both.
+    """
+    works_csv = Path(works_csv)
+    return str(works_csv.parent / f'{works_csv.stem}_{Path(prompt_template).stem}_jobs')
+
+
+def plan_shards(detector: du.PublicDataUsageDetector, data_records: list, max_requests=MAX_REQUESTS,
+                max_bytes=MAX_BYTES, max_tokens=MAX_TOKENS, id_prefix='request-', output_tokens=du.OUTPUT_TOKENS) -> list:
+    """
+    Split `data_records` (iterable of dicts) into consecutive shards
+    that respect the batch limits on the number of requests
+    `max_requests` (int), the input file size `max_bytes` (int) and
+    the input tokens `max_tokens` (int, counted by the `detector`'s
+    token estimator, in chunks, see `count_prompt_tokens()`).
+
+    Returns
+    -------
+    shards : list of dicts
+        Each shard's position, the range of records it holds
+        ('start' and 'end'), its size, its input tokens and expected
+        output tokens (`output_tokens` per request) and its cost in
+        USD (None if the model's prices are unknown).
+    """
+    shards = []
+    start, n_bytes, n_tokens, i = 0, 0, 0, 0
+    for chunk in du.iter_chunks(data_records, du.COUNT_CHUNK):
+        chunk_tokens = detector.count_prompt_tokens(chunk)
+        for d, i_tokens in zip(chunk, chunk_tokens.tolist()):
+            instance = detector.build_batch_instance(id_prefix + str(i), d, serialize=True)
+            i_bytes = len(instance.encode('utf-8')) + 1
+            if i > start and (i - start >= max_requests or n_bytes + i_bytes > max_bytes or n_tokens + i_tokens > max_tokens):
+                shards.append({'start': start, 'end': i, 'bytes': n_bytes, 'tokens': n_tokens})
+                start, n_bytes, n_tokens = i, 0, 0
+            n_bytes += i_bytes
+            n_tokens += i_tokens
+            i += 1
+    if i > start:
+        shards.append({'start': start, 'end': i, 'bytes': n_bytes, 'tokens': n_tokens})
+
+    for k, shard in enumerate(shards):
+        shard_output = output_tokens * (shard['end'] - shard['start'])
+        shard.update({'index': k, 'output_tokens': shard_output,
+                      'cost': du.estimate_cost(shard['tokens'], shard_output, detector.model_name),
+                      'state': PLANNED, 'batch_id': None, 'input_file': None, 'output_file': None,
+                      'attempts': 0, 'error': None})
+    return shards
+
+
+class BatchJob:
+    """
+    A classification of the works in a CSV file split into shards,
+    each sent as an OpenAI batch. The state of every shard is kept
+    in a local job file (JSON), saved after every change, so the
+    job can be resumed after a crash: shards already submitted are
+    only checked, and only failed shards are submitted again. Each
+    batch is tagged with the job's key and the shard's index, so a
+    batch created right before a crash (and missing from the job
+    file) is found, not submitted twice.
+    """
+    def __init__(self, detector: du.PublicDataUsageDetector, works_csv, job_dir=None, max_requests=MAX_REQUESTS,
+                 max_bytes=MAX_BYTES, max_tokens=MAX_TOKENS, id_prefix='request-', output_tokens=du.OUTPUT_TOKENS):
+        """
+        Parameters
+        ----------
+        detector : PublicDataUsageDetector
+            The classifier (model, prompt and OpenAI client).
+        works_csv : str
+            Path to a CSV file of academic works (one per row) with
+            (at least) the columns 'titulo', 'resumo' and
+            'palavras_chave'.
+        job_dir : str, Path or None
+            Folder for the job file and the shards' input and output
+            JSONL files. If None, a folder named after `works_csv`
+            and the prompt template is used. If it already holds a
+            job file, the job is resumed from it (if it is for the
+            same works, model, prompt template and `id_prefix`).
+        max_requests, max_bytes, max_tokens : int
+            Limits of each shard (see `plan_shards()`).
+        id_prefix : str
+            Prefix for the 'custom_id' of each request.
+        output_tokens : int
+            Expected output tokens per request, for the estimates.
+        """
+        self.detector = detector
+        self.works_csv = str(works_csv)
+        if job_dir == None:
+            job_dir = in_jobs_dir(works_csv, detector.prompt_template)
+        self.job_dir = Path(job_dir)
+        self.job_file = self.job_dir / 'job.json'
+        self.id_prefix = id_prefix
+
+        # The works are streamed from the CSV file, never loaded all at once:
+        if self.job_file.exists():
+            self.job = json.loads(self.job_file.read_text())
+            n_records = sum(1 for _ in du.iter_csv_records(works_csv))
+            expected = {'works_csv': self.works_csv, 'n_records': n_records, 'model': detector.model_name,
+                        'prompt_template': str(detector.prompt_template), 'id_prefix': id_prefix}
+            different = [k for k, v in expected.items() if self.job[k] != v]
+            if len(different) > 0:
+                raise ValueError(f'Job file {self.job_file} belongs to another job (different {", ".join(different)}).')
+            # Job files from before batches were tagged:
+            if 'key' not in self.job:
+                self.job['key'] = uuid.uuid4().hex
+                self.save()
+        else:
+            self.job_dir.mkdir(parents=True, exist_ok=True)
+            shards = plan_shards(detector, du.iter_csv_records(works_csv), max_requests, max_bytes, max_tokens, id_prefix,
+                                 output_tokens)
+            self.job = {'works_csv': self.works_csv, 'n_records': shards[-1]['end'] if len(shards) > 0 else 0,
+                        'model': detector.model_name, 'token_estimator': detector.token_estimator.name, 'prompt_template': str(detector.prompt_template),
+                        'id_prefix': id_prefix, 'key': uuid.uuid4().hex, 'created_at': now(), 'shards': shards}
+            self.save()
+
+    @property
+    def shards(self) -> list:
+        return self.job['shards']
+
+    def save(self):
+        """
+        Write the job file (atomically, so a crash while writing
+        does not corrupt it).
+        """
+        temp_file = self.job_file.with_suffix('.tmp')
+        temp_file.write_text(json.dumps(self.job, indent=1, ensure_ascii=False))
+        os.replace(temp_file, self.job_file)
+
+    def input_file(self, shard: dict) -> str:
+        """
+        Return the path to the input JSONL file of `shard` (dict).
+        """
+        return str(self.job_dir / f"shard-{shard['index']:04d}_gpt-in.jsonl")
+
+    def submit_shard(self, shard: dict) -> dict:
+        """
+        Build the input JSONL of `shard` (dict), upload it and start
+        its batch, tagged with the job's key and the shard's index.
+        A shard with nothing to send (all works found in the 
+        detector's cache) is completed right away.
+        """
+        shard['attempts'] += 1
+        shard['input_file'] = self.input_file(shard)
+        try:
+            description = 'PROMPT: {:} / DATA: {:} / SHARD: {:}/{:}'.format(Path(self.job['prompt_template']).stem,
+                                                                          Path(self.works_csv).stem, shard['index'] + 1,
+                                                                          len(self.shards))
+            records = islice(du.iter_csv_records(self.works_csv), shard['start'], shard['end'])
+            batch_file = self.detector.upload_batch(records, save_to=shard['input_file'], id_prefix=self.id_prefix,
+                                                    id_offset=shard['start'])
+            if batch_file == None:
+                shard['state'], shard['batch_id'], shard['error'] = COMPLETED, None, None
+            else:
+                batch_obj = self.detector.run_batch(batch_file, batch_description=description,
+                                                    metadata={'job_key': self.job['key'], 'shard': str(shard['index'])})
+                shard['state'], shard['batch_id'], shard['error'] = SUBMITTED, batch_obj.id, None
+        except Exception as e:
+            shard['state'], shard['error'] = FAILED, f'{type(e).__name__}: {e}'
+        return shard
+
+    def reconcile(self, shards: list) -> int:
+        """
+        Look for batches of `shards` (list of dicts) created in OpenAI 
+        but missing from the job file (e.g. after a crash between the
+        batch creation and the save), by the job key and shard index
+        in their metadata, and record them as submitted. Returns the
+        number of shards recovered.
+        """
+        # Latest batch of each shard (batches are listed newest first):
+        since = datetime.strptime(self.job['created_at'], '%Y-%m-%d %H:%M:%S').timestamp()
+        latest = dict()
+        for batch in self.detector.client.batches.list(limit=100):
+            if batch.created_at < since:
+                break
+            metadata = batch.metadata if batch.metadata != None else dict()
+            if metadata.get('job_key') == self.job['key']:
+                latest.setdefault(int(metadata['shard']), batch)
+
+        # Batches newer than the one recorded were never saved:
+        recovered = 0
+        for shard in shards:
+            batch = latest.get(shard['index'])
+            if batch != None and batch.id != shard['batch_id']:
+                shard['attempts'] += 1
+                shard['input_file'] = self.input_file(shard)
+                shard['state'], shard['batch_id'], shard['error'] = SUBMITTED, batch.id, None
+                recovered += 1
+        if recovered > 0:
+            self.save()
+        return recovered
+
+    def submit(self, max_submits=MAX_SUBMITS, max_attempts=MAX_ATTEMPTS) -> int:
+        """
+        Submit, in parallel (`max_submits` threads), the shards not
+        submitted yet and the failed ones (up to `max_attempts`
+        submissions each), unless their batch already exists (see
+        `reconcile()`). Returns the number of shards submitted.
+        """
+        pending = [s for s in self.shards if s['state'] == PLANNED or (s['state'] == FAILED and s['attempts'] < max_attempts)]
+        if len(pending) > 0 and self.reconcile(pending) > 0:
+            pending = [s for s in pending if s['state'] != SUBMITTED]
+        with ThreadPoolExecutor(max_workers=max_submits) as pool:
+            for shard in pool.map(self.submit_shard, pending):
+                self.save()
+        return len(pending)
+
+    def refresh_shard(self, shard: dict) -> dict:
+        """
+        Check the batch of a submitted `shard` (dict) and, if it is
+        finished, download its output (storing the answers in the
+        detector's cache, if any).
+        """
+        try:
+            batch = self.detector.client.batches.retrieve(shard['batch_id'])
+            if batch.status in FAILED_STATUSES:
+                shard['state'], shard['error'] = FAILED, f'Batch {batch.status}.'
+            elif batch.status == 'completed':
+                if batch.output_file_id == None:
+                    shard['state'], shard['error'] = FAILED, 'Batch completed without an output file.'
+                    return shard
+                shard['output_file'] = du.in2out_name(shard['input_file'])
+                self.detector.client.files.content(batch.output_file_id).write_to_file(shard['output_file'])
+                if self.detector.cache != None:
+                    self.detector.cache.add_batch_results(du.read_jsonl(shard['input_file']),
+                                                          du.read_jsonl(shard['output_file']))
+                if batch.request_counts.failed > 0:
+                    shard['state'], shard['error'] = FAILED, f'{batch.request_counts.failed} requests failed.'
+                else:
+                    shard['state'], shard['error'] = COMPLETED, None
+        except Exception as e:
+            shard['error'] = f'{type(e).__name__}: {e}'
+        return shard
+
+    def refresh(self) -> dict:
+        """
+        Check all submitted shards and return the number of shards
+        in each state.
+        """
+        for shard in self.shards:
+            if shard['state'] == SUBMITTED:
+                self.refresh_shard(shard)
+                self.save()
+        return self.summary()
+
+    def summary(self) -> dict:
+        """
+        Return the number of shards in each state.
+        """
+        counts = {state: 0 for state in [PLANNED, SUBMITTED, COMPLETED, FAILED]}
+        for shard in self.shards:
+            counts[shard['state']] += 1
+        return counts
+
+    def estimate(self):
+        """
+        Return a DataFrame with the planned requests, input tokens,
+        expected output tokens and cost (USD) of each shard, and
+        their totals (in the last row), to size the job before 
+        submitting it.
+        """
+        df = pd.DataFrame([{'shard': s['index'], 'n_requests': s['end'] - s['start'], 'bytes': s['bytes'],
+                            'input_tokens': s['tokens'], 'output_tokens': s['output_tokens'], 'cost': s['cost']}
+                           for s in self.shards])
+        total = {col: df[col].sum() for col in ['n_requests', 'bytes', 'input_tokens', 'output_tokens']}
+        total.update({'shard': 'total', 'cost': df['cost'].sum() if df['cost'].notnull().all() else None})
+        return pd.concat([df, pd.DataFrame([total])], ignore_index=True)
+
+    def is_done(self, max_attempts=MAX_ATTEMPTS) -> bool:
+        """
+        Return whether no shard is waiting for results or for
+        another submission.
+        """
+        return all(s['state'] == COMPLETED or (s['state'] == FAILED and s['attempts'] >= max_attempts) for s in self.shards)
+
+    def run(self, poll_interval=POLL_INTERVAL, max_submits=MAX_SUBMITS, max_attempts=MAX_ATTEMPTS, verbose=True) -> dict:
+        """
+        Submit the pending shards and check them every `poll_interval`
+        (float) seconds, re-submitting the failed ones, until all are
+        done. It can be stopped at any time and called again (on a
+        new `BatchJob` for the same folder) to resume. Returns the
+        number of shards in each state.
+        """
+        while True:
+            self.submit(max_submits, max_attempts)
+            summary = self.refresh()
+            if verbose == True:
+                print(f'[{now()}] Shards: {summary}')
+            if self.is_done(max_attempts):
+                return summary
+            time.sleep(poll_interval)
+
+    def merge_outputs(self) -> tuple:
+        """
+        Concatenate the input and output JSONL files of all shards,
+        in order, into a single pair of files in the job folder
+        (requires all shards to be completed).
+
+        Returns
+        -------
+        jsonl_in, jsonl_out : str
+            Paths to the merged input and output files.
+        """
+        missing = [s['index'] for s in self.shards if s['state'] != COMPLETED]
+        if len(missing) > 0:
+            raise ValueError(f'Shards not completed: {missing}.')
+
+        jsonl_in, jsonl_out = str(self.job_dir / 'merged_gpt-in.jsonl'), str(self.job_dir / 'merged_gpt-out.jsonl')
+        for merged, key in [(jsonl_in, 'input_file'), (jsonl_out, 'output_file')]:
+            with open(merged, 'w', encoding='utf-8') as f:
+                for shard in self.shards:
+                    if shard[key] != None and Path(shard[key]).exists():
+                        for record in du.read_jsonl(shard[key]):
+                            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return jsonl_in, jsonl_out
+
+    def build_results_csv(self, save_to=None, application='usecase_detection'):
+        """
+        Merge the shards' outputs and join them to the works (see
+        `datausage.build_results_csv()`).
+        """
+        jsonl_in, jsonl_out = self.merge_outputs()
+        detector = self.detector if self.detector.cache != None else None
+        return du.build_results_csv(self.works_csv, jsonl_in, jsonl_out, save_to, application, detector, self.id_prefix)
+
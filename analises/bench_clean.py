@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Equivalence checks and timing of the form-cleaning functions in CORDATA
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import argparse
+import pandas as pd
+import numpy as np
+
+import clean as cc
+import xavy.dataframes as xd
+
+
+### Reference (row-wise) implementations ###
+
+def ref_std_date_series(series):
+    """
+    Former `clean.std_date_series()`, looping over date patterns.
+    """
+    date_regexes = [r'(?:^[1-9]|\D[1-9]|0[1-9]|1[0-2])\/(?:19|20)[0-9]{2}',
+                    r'(?:19|20)[0-9]{2}-(?:[1-9]|0[1-9]|1[0-2])']
+    date_formats = ['%m/%Y', '%Y-%m']
+    cleaned = series.str.strip()
+    output  = pd.Series(np.NaN, index=series.index, name=series.name)
+    for r, f in zip(date_regexes, date_formats):
+        pos = cleaned.str.contains(r, regex=True).fillna(False)
+        output.loc[pos] = pd.to_datetime(cleaned.loc[pos], format=f).dt.strftime('%Y-%m')
+    return output
+
+
+def ref_options_to_list(df, col_names):
+    """
+    Former `clean.options_to_list()`, joining options row by row.
+    """
+    temp_df = pd.DataFrame()
+    for c in col_names.keys():
+        mapper = {0:'', 1:col_names[c]}
+        temp_df[c] = df[c].map(mapper)
+    result = temp_df.apply(lambda row: list(filter(lambda s: len(s) > 0, row.tolist())), axis=1)
+    return result
+
+
+def ref_build_hash_id(df):
+    """
+    Former `clean.build_hash_id()`, hashing row by row.
+    """
+    return df.astype(str).sum(axis=1).apply(cc.hash_string)
+
+
+def ref_sel_usecase_dataset(df, i):
+    """
+    Former `clean.sel_usecase_dataset()`.
+    """
+    cols = xd.sel_col_by_regex(df, '_{}$'.format(i))
+    std_df = xd.rename_columns(df[cols], '(_{})$'.format(i), '')
+    return std_df
+
+
+def ref_data_info_dict_list(usecase_df, max_datasets):
+    """
+    Former `clean.data_info_dict_list()`, building one DataFrame per
+    dataset index (through the former `clean.parse_usecase_datasets()`).
+    """
+    required_data_info = ['data_name', 'data_institution', 'data_url']
+    periodical_labels  = {0: None, 1:True, 2:False}
+    datasets_df = pd.concat([ref_sel_usecase_dataset(usecase_df, i + 1) for i in range(max_datasets)], ignore_index=True)
+    datasets_df.dropna(how='all', subset=required_data_info, inplace=True)
+    datasets_df['data_periodical'] = (datasets_df['data_periodical']).fillna(0).astype(int).map(periodical_labels)
+    datasets_df['data_license'] = None
+    dict_list = datasets_df.to_dict(orient='records')
+    return dict_list
+
+
+def ref_datasets_by_usecase(df, max_datasets):
+    """
+    Former way of parsing the datasets of all usecases, row by row.
+    """
+    return df.apply(lambda row: ref_data_info_dict_list(cc.series2transposed_df(row), max_datasets), axis=1)
+
+
+### Synthetic data ###
+
+# Date strings accepted by the former implementation (it raises on partial matches):
+DATE_SAMPLES = ['03/2021', '3/2021', '12/1999', ' 07/2015 ', '2020-05', '2020-5', '1998-11', '13/2020', '1899-05',
+                '05/1850', 'sem data', '', None]
+
+
+def synthetic_form(n_rows=100_000, seed=42):
+    """
+    Create a DataFrame with `n_rows` (int) fake form answers, with
+    the dummy columns for topics and types, publication dates and
+    text fields.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({c: rng.integers(0, 2, n_rows) for c in list(cc.topic_names) + list(cc.type_names)})
+    df['pub_date'] = rng.choice(np.array(DATE_SAMPLES, dtype=object), n_rows)
+    df['name'] = pd.Series(rng.integers(0, 10**9, n_rows)).astype(str).radd('Caso de uso nº ')
+    df['url'] = pd.Series(rng.integers(0, 10**6, n_rows)).astype(str).radd('https://exemplo.gov.br/')
+    df.loc[rng.random(n_rows) < 0.05, 'url'] = np.NaN
+    return df
+
+
+def synthetic_datasets(n_rows=2_000, max_datasets=10, seed=42):
+    """
+    Create a DataFrame with `n_rows` (int) fake form answers about
+    the datasets used, with up to `max_datasets` (int) datasets per
+    usecase and missing values as None (as in the cleaning process).
+    """
+    rng = np.random.default_rng(seed)
+    n_used = rng.integers(0, max_datasets + 1, n_rows)
+    df = pd.DataFrame(index=pd.RangeIndex(n_rows))
+    for i in range(1, max_datasets + 1):
+        used = n_used >= i
+        for field in ['data_name', 'data_institution', 'data_url']:
+            values = pd.Series(rng.integers(0, 1000, n_rows)).astype(str).radd(f'{field} ')
+            df[f'{field}_{i}'] = values.where(used & (rng.random(n_rows) < 0.9))
+        df[f'data_periodical_{i}'] = pd.Series(rng.integers(0, 3, n_rows)).where(used)
+    df = df.replace({np.nan: None})
+    return df
+
+
+### Checks ###
+
+def timeit(func, *args):
+    """
+    Return the output of `func(*args)` and the time it took, in seconds.
+    """
+    t0 = time.perf_counter()
+    output = func(*args)
+    return output, time.perf_counter() - t0
+
+
+def compare(name, ref_func, new_func, *args):
+    """
+    Run the reference and the new implementations of a function,
+    assert they return equal Series and return their timings.
+    """
+    ref, t_ref = timeit(ref_func, *args)
+    new, t_new = timeit(new_func, *args)
+    pd.testing.assert_series_equal(new, ref, check_dtype=False, check_names=False)
+    return {'function': name, 'n_rows': len(ref), 't_reference': t_ref, 't_vectorized': t_new, 'speedup': t_ref / t_new}
+
+
+def run_checks(n_rows=100_000, n_datasets_rows=2_000, seed=42):
+    """
+    Check that the vectorized functions in `clean` reproduce the
+    reference implementations on a synthetic form export with
+    `n_rows` rows (`n_datasets_rows` for the parsing of datasets,
+    since its reference implementation is much slower), and time 
+    both.
+
+    Returns
+    -------
+    report : list of dicts
+        Timings (in seconds) and speedup of each function.
+    """
+    df = synthetic_form(n_rows, seed)
+    report = [compare('std_date_series', ref_std_date_series, cc.std_date_series, df['pub_date']),
+              compare('options_to_list (topics)', ref_options_to_list, cc.options_to_list, df, cc.topic_names),
+              compare('options_to_list (type)', ref_options_to_list, cc.options_to_list, df, cc.type_names),
+              compare('build_hash_id', ref_build_hash_id, cc.build_hash_id, df[['name', 'url', 'pub_date']]),
+              compare('datasets_by_usecase', ref_datasets_by_usecase, cc.datasets_by_usecase,
+                      synthetic_datasets(n_datasets_rows, seed=seed), 10)]
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the vectorized form-cleaning functions.')
+    parser.add_argument('--n-rows', type=int, default=100_000, help='Number of rows in the synthetic form export.')
+    parser.add_argument('--n-datasets-rows', type=int, default=2_000, help='Number of rows for parsing datasets.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic data.')
+    args = parser.parse_args()
+
+    print(json.dumps(run_checks(args.n_rows, args.n_datasets_rows, args.seed), indent=1))
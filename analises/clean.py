@@ -23,11 +23,14 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import pandas as pd
 import numpy as np
 import json
+import re
+import datetime as dt
 from zlib import crc32
-from glob import glob
 from collections import defaultdict
 
 import xavy.dataframes as xd
+import institutions as ins
+import vocabulary as voc
 
 
 # Tags associated to dummy columns:
@@ -66,6 +69,18 @@ type_names = {'type_artigo': 'artigo científico ou publicação acadêmica',
  'type_bot': 'bot',
  'type_outro': 'outro'}
 
+# Controlled terms of each translated field (countries are those in the translation table):
+controlled_terms = {'type': list(type_names.values()), 'topics': list(topic_names.values()), 'countries': None}
+
+# Fields of a usecase, in the order used by the CMS (see codigo/data/entry_model.json):
+usecase_fields = ['hash_id', 'name', 'url', 'url_archive', 'description', 'pub_date', 'authors', 'authors_id', 'geo_level',
+                  'countries', 'fed_units', 'municipalities', 'email', 'type', 'topics', 'tags', 'url_source', 'url_image',
+                  'comment', 'datasets', 'record_date', 'modified_date', 'status_published', 'status_review', 'type_es',
+                  'topics_es', 'countries_es']
+
+# Image used when none is provided:
+generic_image_url = 'https://raw.githubusercontent.com/cewebbr/cordata/main/imagens/generic_usecase_banner.png'
+
 
 # Functions:
 
@@ -87,26 +102,24 @@ def rename_first_data_cols(df):
     
 def std_date_series(series):
     """
-    Standardize date `series` (of str). Unespecified patterns, 
-    dates prior to 1900-01 and unexistent dates become NaNs.
+    Standardize date `series` (of str) in the formats MM/YYYY or
+    YYYY-MM to YYYY-MM. Unespecified patterns, dates prior to 1900-01
+    and unexistent dates become NaNs.
     
     Returns a string series as well.
     """
     
-    # Regex patterns for identifying dates:
-    date_regexes = [r'(?:^[1-9]|\D[1-9]|0[1-9]|1[0-2])\/(?:19|20)[0-9]{2}', 
-                    r'(?:19|20)[0-9]{2}-(?:[1-9]|0[1-9]|1[0-2])']
-    # Date formats associated to the patterns above:
-    date_formats = ['%m/%Y', '%Y-%m']
-    
-    # Strip data from whitespaces:
-    cleaned = series.str.strip()
-    output  = pd.Series(np.NaN, index=series.index, name=series.name)
-    # Loop over date patterns:
-    for r, f in zip(date_regexes, date_formats):
-        # Standardize these dates:
-        pos = cleaned.str.contains(r, regex=True).fillna(False)
-        output.loc[pos] = pd.to_datetime(cleaned.loc[pos], format=f).dt.strftime('%Y-%m')
+    # Regex identifying dates in both formats (MM/YYYY and YYYY-MM), in a single pass:
+    date_regex = (r'^(?:(?P<month1>0?[1-9]|1[0-2])\/(?P<year1>(?:19|20)[0-9]{2})'
+                  r'|(?P<year2>(?:19|20)[0-9]{2})-(?P<month2>0?[1-9]|1[0-2]))$')
+    
+    # Strip data from whitespaces and extract year and month:
+    parts = series.str.strip().str.extract(date_regex)
+    year  = parts['year1'].fillna(parts['year2'])
+    month = parts['month1'].fillna(parts['month2']).str.zfill(2)
+    
+    # Standardize dates:
+    output = (year + '-' + month).rename(series.name)
         
     return output
 
@@ -180,59 +193,106 @@ def options_to_list(df, col_names):
         each one represented by its name in `col_names`.
     """    
     
-    # Replace dummy variables by strings:
-    temp_df = pd.DataFrame()
-    for c in col_names.keys():
-        mapper = {0:'', 1:col_names[c]}
-        temp_df[c] = df[c].map(mapper)
-
-    # Join options into lists:
-    result = temp_df.apply(lambda row: list(filter(lambda s: len(s) > 0, row.tolist())), axis=1)
+    # Boolean matrix of selected options (usecases x options):
+    names    = np.array(list(col_names.values()), dtype=object)
+    selected = (df[list(col_names.keys())].to_numpy() == 1)
+    
+    # Names of the selected options, split by usecase:
+    rows, cols = np.nonzero(selected)
+    splits = np.cumsum(selected.sum(axis=1))
+    result = pd.Series([a.tolist() for a in np.split(names[cols], splits)[:-1]], index=df.index, dtype=object)
     
     return result
 
 
-def sel_usecase_dataset(df, i):
+def stack_datasets(df, max_datasets):
     """
-    Select columns from `df` (DataFrame) with a given dataset index 
-    `i` (int) and standardize the columns names by removing the
-    index.
+    Reshape the information about used datasets from wide (one usecase
+    per row, with each dataset identified by an index at the end of the
+    column names, e.g. 'data_name_2') to long (one dataset per row).
     
-    Returns a DataFrame.
+    Parameters
+    ----------
+    df : DataFrame
+        Table with the data used by the usecases, one usecase
+        per row.
+    max_datasets : int
+        Maximum number of datasets allowed for each usecase.
+    
+    Returns
+    -------
+    long_df : DataFrame
+        Table with one row per non-empty dataset, indexed by the 
+        usecase position in `df` ('usecase') and the dataset index
+        ('dataset'), with the columns names without the index.
     """
     
-    # Select columns associated to one dataset:
-    cols = xd.sel_col_by_regex(df, '_{}$'.format(i))
+    # Select columns associated to datasets and split their names into field and index:
+    cols, keys = [], []
+    for c in df.columns:
+        match = re.fullmatch(r'(.+)_([1-9][0-9]*)', c)
+        if match != None and int(match.group(2)) <= max_datasets:
+            cols.append(c)
+            keys.append((match.group(1), int(match.group(2))))
+    fields = list(dict.fromkeys([k[0] for k in keys]))
     
-    # Remove index from column name:
-    std_df = xd.rename_columns(df[cols], '(_{})$'.format(i), '')
+    # Reshape in one go (empty datasets are dropped):
+    wide_df = df[cols].reset_index(drop=True)
+    wide_df.columns = pd.MultiIndex.from_tuples(keys, names=[None, 'dataset'])
+    long_df = wide_df.stack(level='dataset')[fields]
+    long_df.index.names = ['usecase', 'dataset']
     
-    return std_df
+    return long_df
 
 
-def parse_usecase_datasets(usecase_df, max_datasets):
+def datasets_by_usecase(df, max_datasets):
     """
-    Given a single-row DataFrame about one usecase, returns a 
-    DataFrame with the used datasets stacked.
+    Parse the information about used datasets for all usecases
+    into lists of dictionaries, where each entry in a list is 
+    an used dataset.
     
     Parameters
     ----------
-    usecase_df : DataFrame
-        Table with the data used by one usecase, all in one line 
-        (the info associated to each dataset is identified by 
-        an index in the column name).
+    df : DataFrame
+        Table with the data used by the usecases, one usecase
+        per row (the info associated to each dataset is 
+        identified by an index in the column name).
     max_datasets : int
         Maximum number of datasets allowed for each usecase.
     
     Returns
     -------
-    df : DataFrame
-        Table with information about all datasets used by the 
-        usecase.
+    dict_lists : Series of lists of dicts
+        For each usecase in `df`, a list with information about 
+        all datasets it used.
     """
     
-    df = pd.concat([sel_usecase_dataset(usecase_df, i + 1) for i in range(max_datasets)], ignore_index=True)
-    return df
+    # Hard-coded:
+    required_data_info = ['data_name', 'data_institution', 'data_url']
+    periodical_labels  = {0: None, 1:True, 2:False}
+    
+    # Get table of used datasets (all usecases):
+    datasets_df = stack_datasets(df, max_datasets)
+    # Remove empty rows:
+    datasets_df = datasets_df.dropna(how='all', subset=required_data_info)
+
+    # Translation of the periodicity of the data collection:
+    datasets_df['data_periodical'] = (datasets_df['data_periodical']).fillna(0).astype(int).map(periodical_labels)
+
+    # Add missing column (data_license):
+    datasets_df['data_license'] = None
+
+    # Format as dicts, with None for missing values:
+    datasets_df = datasets_df.astype(object).where(datasets_df.notnull(), None)
+    records = datasets_df.to_dict(orient='records')
+    
+    # Group datasets by usecase (in dataset index order):
+    grouped = defaultdict(list)
+    for usecase, record in zip(datasets_df.index.get_level_values('usecase'), records):
+        grouped[usecase].append(record)
+    dict_lists = pd.Series([grouped[i] for i in range(len(df))], index=df.index, dtype=object)
+    
+    return dict_lists
 
 
 def data_info_dict_list(usecase_df, max_datasets):
@@ -257,25 +317,7 @@ def data_info_dict_list(usecase_df, max_datasets):
         usecase.
     """
     
-    # Hard-coded:
-    required_data_info = ['data_name', 'data_institution', 'data_url']
-    periodical_labels  = {0: None, 1:True, 2:False}
-    
-    # Get table of used datasets:
-    datasets_df = parse_usecase_datasets(usecase_df, max_datasets)
-    # Remove empty rows:
-    datasets_df.dropna(how='all', subset=required_data_info, inplace=True)
-
-    # Translation of the periodicity of the data collection:
-    datasets_df['data_periodical'] = (datasets_df['data_periodical']).fillna(0).astype(int).map(periodical_labels)
-
-    # Add missing column (data_license):
-    datasets_df['data_license'] = None
-    
-    # Format as a list of dicts:
-    dict_list = datasets_df.to_dict(orient='records')
-    
-    return dict_list
+    return datasets_by_usecase(usecase_df, max_datasets).iloc[0]
 
 
 def series2transposed_df(series):
@@ -339,7 +381,16 @@ def build_hash_id(df):
     content in each line in `df`.
     """
     
-    return df.astype(str).sum(axis=1).apply(hash_string)
+    # Concatenate the columns as strings (column-wise):
+    values = df.astype(str).to_numpy(dtype=object)
+    joined = values[:, 0]
+    for j in range(1, values.shape[1]):
+        joined = joined + values[:, j]
+    
+    # Hash the UTF-8 encoded lines:
+    hashes = np.fromiter((crc32(s.encode('utf-8')) for s in joined), dtype=np.int64, count=len(joined))
+    
+    return pd.Series(hashes, index=df.index)
 
 
 def embed_metadata(data, metadata, data_key="data", meta_key="metadata"):
@@ -395,6 +446,18 @@ def add_translation(case_json, type_map, topic_map, country_map):
     return case_json
 
 
+def load_vocabularies(path='../codigo/data/translations.csv'):
+    """
+    Compile the controlled vocabularies of types, topics and
+    countries (see `controlled_terms`) with their translations
+    from the CSV file at `path` (str) used by the CMS. It fails
+    if a type or topic lacks a translation.
+    
+    Returns a dict from field to `vocabulary.Vocabulary`.
+    """
+    return voc.compile_vocabularies(controlled_terms, path)
+
+
 def load_json(filename):
     """
     Load a JSON stored in `filename`.
@@ -406,11 +469,12 @@ def load_json(filename):
     return data
 
 
-def load_institution_identifier(json_pattern):
+def load_institution_identifier(json_pattern, min_confidence=ins.MIN_CONFIDENCE):
     """
-    Creates a default dict that translates institution
-    names listed in CGU's Portal Brasileiro de Dados 
-    Abertos to their IDs.
+    Creates a dict-like translator of institution names
+    to their IDs in CGU's Portal Brasileiro de Dados 
+    Abertos, backed by an index with exact, accent-folded
+    and fuzzy matching (see `institutions.py`).
     
     Parameters
     ----------
@@ -418,30 +482,161 @@ def load_institution_identifier(json_pattern):
         File pattern for glob function indicating 
         JSON files containing a list of institution
         data, including their name and ID.
+    min_confidence : float
+        Minimum confidence (between 0 and 1) of a match
+        for the name to be translated.
     
     Returns
     -------
-    inst2id : defaultdict
-        The translator.  If the name is not found,
-        the default dict returns None.    
+    inst2id : InstitutionResolver
+        The translator. If the name is not found (with
+        enough confidence), it returns None.
     """
+    index = ins.InstitutionIndex.from_cgu_files(json_pattern)
+    return ins.InstitutionResolver(index, min_confidence)
+
+
+def parse_pub_date(date):
+    """
+    Parse a publication `date` (str) in the formats DD/MM/YYYY,
+    MM/YYYY or YYYY into MM/YYYY (str). If `date` is None or in
+    another format, return None.
+    """
+    if date == None:
+        return None
+    for date_format in ['%d/%m/%Y', '%m/%Y', '%Y']:
+        try:
+            return dt.datetime.strptime(date.strip(), date_format).strftime('%m/%Y')
+        except ValueError:
+            pass
+    return None
+
+
+def clean_form_data(raw_df, vocabularies, inst2id, max_datasets=10, hash_ids=None):
+    """
+    Transforms raw data from CORDATA's form (a table read from 
+    a CSV file) into a list of cleaned usecases, in the final 
+    Website format. The images provided are not processed: their
+    source URLs are kept in 'url_image' (see `imagebatch.py`).
     
-    # Load institution names:
-    inst_files = glob(json_pattern)
-    institutions = []
-    ids = []
-    for f in inst_files:
-        institutions += [(i['titulo'], i['id']) for i in load_json(f)]
+    Parameters
+    ----------
+    raw_df : DataFrame
+        Data table read directly from the CSV file output by 
+        CORDATA's form.
+    vocabularies : dict or None
+        The compiled vocabularies of types, topics and countries,
+        used to translate them to Spanish (see 
+        `load_vocabularies()`). If None, the translations are
+        not added.
+    inst2id : InstitutionResolver or defaultdict
+        A mapper from institutions' names (authors and datasets'
+        institutions) to IDs. If the name is not found, `inst2id` 
+        should return None.
+    max_datasets : int
+        The maximum number of datasets allowed to be mentioned in 
+        CORDATA's form.
+    hash_ids : Series of ints or None
+        The IDs of the rows in `raw_df` (aligned by index), e.g.
+        the hashes of the rows before curation patches were applied
+        (see `curation.apply_patches()`). If None, hash the rows
+        of `raw_df`.
     
-    # Sort list:
-    institutions = sorted(institutions)
+    Returns
+    -------
+    usecases : list of dicts
+        The cleaned usecases, in the same order as in `raw_df`.
+    """
+    
+    # Start cleaning process by copying data and creating an ID:
+    cleaned_df = raw_df.copy()
+    if hash_ids is None:
+        hash_ids = build_hash_id(raw_df)
+    else:
+        hash_ids = hash_ids.loc[raw_df.index]
+    cleaned_df.insert(0, 'hash_id', hash_ids)
+
+    # Change NaN for None:
+    cleaned_df = cleaned_df.replace({np.nan: None})
+
+    # Standardize used dataset column names:
+    rename_first_data_cols(cleaned_df)
+
+    # Rename columns:
+    col_renamer = {'cobertura-geografica': 'geo_level', 'federatives': 'fed_units', 'cities': 'municipalities'}
+    cleaned_df.rename(col_renamer, axis=1, inplace=True)
+    
+    # Basic cleaning of strings:
+    str_cols = ['name', 'url', 'description', 'authors', 'countries', 'email', 'tags', 'url_source', 'url_image', 'comment', 'fed_units', 'municipalities']
+    data_str_cols = ['data_name', 'data_institution', 'data_url']
+    str_cols += ['{}_{}'.format(c, i) for i in range(1, max_datasets + 1) for c in data_str_cols]
+    for c in str_cols:
+        cleaned_df[c] = cleaned_df[c].str.strip()
+    
+    # Fill missing source URL to avoid website failure:
+    cleaned_df['url_source'] = cleaned_df['url_source'].fillna('https://')
+
+    # Rename options in geo_level:
+    geolevel_renamer = {'nao-se-aplica':'Não se aplica', 'mundial': 'Mundial', 'paises': 'Países', 'unidades-federativas':'Unidades federativas', 'municipios':'Municípios'}
+    cleaned_df['geo_level'] = cleaned_df['geo_level'].map(geolevel_renamer)
+    
+    # Lowercase tags:
+    cleaned_df['tags'] = cleaned_df['tags'].str.lower()
+
+    # Split terms by semicolons:
+    semicolon_cols = ['authors', 'email', 'tags']
+    for c in semicolon_cols:
+        cleaned_df[c] = split_semicolons(cleaned_df[c])
+
+    # Split terms by colons:
+    colon_cols = ['countries', 'fed_units', 'municipalities']
+    for c in colon_cols:
+        cleaned_df[c] = split_semicolons(cleaned_df[c], ',')
+
+    # Parse usecase types and topics covered:
+    assert set(type_names)  == set(xd.sel_col_by_regex(cleaned_df, '^type_'))
+    assert set(topic_names) == set(xd.sel_col_by_regex(cleaned_df, '^topics_'))
+    cleaned_df['type']   = options_to_list(cleaned_df, type_names)
+    cleaned_df['topics'] = options_to_list(cleaned_df, topic_names)
+
+    # Parse pub_date into month only:
+    cleaned_df['pub_date'] = cleaned_df['pub_date'].apply(parse_pub_date)
+
+    # Add country info for finer geographic levels:
+    finer_geo = cleaned_df['geo_level'].isin({'Unidades federativas', 'Municípios'})
+    cleaned_df.loc[finer_geo, 'countries'] = pd.Series([['Brasil'] for _ in range(finer_geo.sum())], index=cleaned_df.index[finer_geo], dtype=object)
+
+    # Add state info if municipalities is the level:
+    mun_cov = cleaned_df['geo_level'] == 'Municípios'
+    states  = cleaned_df.loc[mun_cov, 'municipalities'].str.join(', ').str.findall(r'\(([A-Z]{2})\)')
+    cleaned_df.loc[mun_cov, 'fed_units'] = states.apply(lambda l: None if l != l or len(l) == 0 else sorted(set(l)))
     
-    # Security check: no repeated names:
-    names = {i[0] for i in institutions}
-    assert len(names) == len(institutions)
+    # Parse datasets used by the usecases:
+    data_cols = xd.sel_col_by_regex(cleaned_df, '^data_')
+    cleaned_df['datasets'] = datasets_by_usecase(cleaned_df[data_cols], max_datasets)
+
+    # Change NaN for None:
+    cleaned_df = cleaned_df.replace({np.nan: None})
+
+    # Add processing date:
+    cleaned_df['record_date'] = dt.datetime.today().strftime('%Y-%m-%d')
     
-    # Create translator (name > ID):
-    inst_dict = dict(institutions)
-    inst2id = defaultdict(lambda: None, inst_dict)
+    # Add generic image when none is provided:
+    cleaned_df.loc[cleaned_df['url_image'].isin({'https://', None}), 'url_image'] = generic_image_url
+
+    # Add author and dataset institution IDs (from CGU's list):
+    cleaned_df['authors_id'] = cleaned_df['authors'].apply(lambda l: translate_list_elements(l, inst2id))
+    for datasets in cleaned_df['datasets']:
+        for ds in datasets:
+            ds['data_institution_id'] = None if ds['data_institution'] == None else inst2id[ds['data_institution']]
     
-    return inst2id
\ No newline at end of file
+    # Format as list of dicts (with fields in the CMS order and the CMS defaults):
+    cleaned_data = cleaned_df.to_dict(orient='records')
+    defaults = {'url_archive': 'https://', 'modified_date': None, 'status_published': False, 'status_review': True}
+    usecases = [{f: case_json.get(f, defaults.get(f)) for f in usecase_fields} for case_json in cleaned_data]
+    
+    # Add translation to Spanish for categories:
+    if vocabularies != None:
+        voc.translate_usecases(usecases, vocabularies)
+
+    return usecases
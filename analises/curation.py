@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Patch-based curation of CORDATA's form exports
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import hashlib
+import argparse
+from pathlib import Path
+import pandas as pd
+import numpy as np
+
+import clean as cc
+
+
+# Hard-coded paths:
+PATCHES_FILE = '../dados/curados/patches.json'
+
+
+def load_patches(path=PATCHES_FILE) -> dict:
+    """
+    Load the curation patches stored at `path` (str or Path).
+
+    Returns
+    -------
+    patches : dict
+        Map from row ID (int, the hash of the raw row's content) to
+        its patch: a dict with the usecase 'name' (for reference),
+        the 'export' where the row was first patched and either the
+        new values of the fields to change ('set', dict) or
+        'delete': True, for rows to drop.
+    """
+    if Path(path).exists() == False:
+        return dict()
+    return {p['row_id']: p for p in cc.load_json(path)}
+
+
+def save_patches(patches: dict, path=PATCHES_FILE):
+    """
+    Save the curation `patches` (dict from row ID to patch) to
+    `path` (str or Path), sorted by export and usecase name so
+    diffs are easy to review.
+    """
+    ordered = sorted(patches.values(), key=lambda p: (p['export'], str(p['name']), p['row_id']))
+    with open(path, 'w') as f:
+        json.dump(ordered, f, indent=1, ensure_ascii=False)
+
+
+def patch_hash(patch: dict) -> str:
+    """
+    Return a hash (str) of the content of a `patch` (dict).
+    """
+    return hashlib.sha256(json.dumps(patch, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def apply_patches(raw_df, patches: dict):
+    """
+    Apply curation `patches` (dict from row ID to patch) to a raw
+    form export `raw_df` (DataFrame).
+
+    Returns
+    -------
+    patched_df : DataFrame
+        A copy of `raw_df` with the fields changed by the patches
+        and without the deleted rows.
+    row_ids : Series of ints
+        The stable ID of each row in `raw_df` (the hash of its raw
+        content, see `clean.build_hash_id()`), which identifies the
+        row regardless of its patches.
+    """
+    row_ids = cc.build_hash_id(raw_df)
+    patched_df = raw_df.copy()
+
+    # Change fields:
+    for i, row_id in row_ids.items():
+        patch = patches.get(row_id)
+        if patch != None and patch.get('delete') != True:
+            for field, value in patch['set'].items():
+                if field not in patched_df.columns:
+                    patched_df[field] = None
+                patched_df[field] = patched_df[field].astype(object)
+                patched_df.at[i, field] = value
+
+    # Drop rows:
+    deleted = row_ids.map(lambda r: r in patches and patches[r].get('delete') == True)
+    patched_df = patched_df.loc[~deleted]
+
+    return patched_df, row_ids
+
+
+def to_json_value(value):
+    """
+    Convert a DataFrame cell `value` to a JSON value (NaN becomes
+    None and numpy scalars become Python scalars).
+    """
+    if pd.isnull(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def make_patches(raw_df, curated_df, export: str) -> dict:
+    """
+    Build the patches that turn `raw_df` (DataFrame) into its edited
+    copy `curated_df` (DataFrame), which must have the same columns
+    and the same rows in the same order, except for deleted ones.
+    Rows are matched by position if no row was deleted, otherwise
+    by name, in order.
+
+    Parameters
+    ----------
+    raw_df : DataFrame
+        The raw form export.
+    curated_df : DataFrame
+        The edited copy of the export.
+    export : str
+        The export's filename, recorded in the patches.
+
+    Returns
+    -------
+    patches : dict
+        Map from row ID to patch (see `load_patches()`).
+    """
+    if list(raw_df.columns) != list(curated_df.columns):
+        raise ValueError(f'Columns of the curated copy of {export} differ from the raw ones.')
+
+    row_ids = cc.build_hash_id(raw_df)
+    by_position = len(raw_df) == len(curated_df)
+    patches = dict()
+    j = 0
+    for i in range(len(raw_df)):
+        raw_row, row_id = raw_df.iloc[i], int(row_ids.iloc[i])
+        base = {'row_id': row_id, 'export': export, 'name': to_json_value(raw_row['name'])}
+
+        # Row was deleted:
+        if by_position == False and (j >= len(curated_df) or curated_df.iloc[j]['name'] != raw_row['name']):
+            patches[row_id] = {**base, 'delete': True}
+            continue
+
+        # Changed fields:
+        cur_row = curated_df.iloc[j]
+        changed = {c: to_json_value(cur_row[c]) for c in raw_df.columns
+                   if not (pd.isnull(raw_row[c]) and pd.isnull(cur_row[c])) and raw_row[c] != cur_row[c]}
+        if len(changed) > 0:
+            patches[row_id] = {**base, 'set': changed}
+        j += 1
+
+    if j < len(curated_df):
+        raise ValueError(f'Could not match all rows of the curated copy of {export} to raw rows.')
+
+    return patches
+
+
+def migrate_curated_copies(brutos_dir='../dados/brutos/', curados_dir='../dados/curados/', pattern='*_dados-abertos.csv',
+                           patches_path=PATCHES_FILE, remove_copies=False, verbose=False) -> dict:
+    """
+    Convert the full curated copies of form exports into patches,
+    added to the patches file. Copies whose columns differ from the
+    raw export (e.g. renamed topics) cannot be expressed as patches
+    and are kept.
+
+    Returns
+    -------
+    report : dict
+        For each curated copy, the number of patches created or
+        the reason it was kept.
+    """
+    patches = load_patches(patches_path)
+    report = dict()
+    for curated_path in sorted(Path(curados_dir).glob(pattern)):
+        raw_df = pd.read_csv(Path(brutos_dir) / curated_path.name, sep=';')
+        curated_df = pd.read_csv(curated_path, sep=';')
+        try:
+            new_patches = make_patches(raw_df, curated_df, curated_path.name)
+        except ValueError as e:
+            report[curated_path.name] = f'kept ({e})'
+            continue
+        patches.update(new_patches)
+        report[curated_path.name] = f'{len(new_patches)} patches'
+        if remove_copies == True:
+            curated_path.unlink()
+
+    save_patches(patches, patches_path)
+    if verbose == True:
+        print(json.dumps(report, indent=1, ensure_ascii=False))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert curated copies of CORDATA form exports into patches.')
+    parser.add_argument('--remove-copies', action='store_true', help='Delete the curated copies converted into patches.')
+    args = parser.parse_args()
+
+    migrate_curated_copies(remove_copies=args.remove_copies, verbose=True)
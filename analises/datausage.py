@@ -21,12 +21,18 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIStatusError, APIConnectionError
 from pathlib import Path
 import json
+import time
+import random
+import asyncio
 import numpy as np
 import pandas as pd
 import datetime as dt
+import hashlib
+import tempfile
+import csv
 import re
 
 from xavy.utils import load_env_vars
@@ -77,20 +83,38 @@ def add_column_suffix(df, suffix, inplace=False, prefix=False):
     return None
 
 
+# Cell values read as missing (NaN), as in pandas' `read_csv()` (version 2.0.3, in openai_requirements.txt, 
+# which this module runs with; unlike older versions, it includes 'None'):
+CSV_NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+                 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+
+def iter_csv_records(filename, records_cols=['titulo', 'resumo', 'palavras_chave']):
+    """
+    Read a file structured as CSV one row at a time, yielding a
+    dict with the selected columns of each row, so the file is 
+    never fully loaded in memory.
+
+    Values are the same as those of `csv2records()`: missing 
+    values are NaN, except for the abstract ('resumo'), which is 
+    an empty string and has its line breaks replaced by spaces.
+    """
+    # 'utf-8-sig' drops the byte order mark (BOM) some tools write, which would be part of the first column's name:
+    with open(filename, 'r', newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            record = {col: np.nan if row[col] in CSV_NA_VALUES else row[col] for col in records_cols}
+            if 'resumo' in record:
+                resumo = '' if row['resumo'] in CSV_NA_VALUES else row['resumo']
+                record['resumo'] = resumo.replace('\r\n', ' ').replace('\r', ' ').replace('\n', ' ')
+            yield record
+
+
 def csv2records(filename, records_cols=['titulo', 'resumo', 'palavras_chave']):
     """
     Load a file structured as CSV into a list of dicts.
     Only keep the selected columns.
     """
-    
-    # Load data:
-    df = pd.read_csv(filename)
-    # Clean abstract:
-    df['resumo'] = df['resumo'].fillna('').str.replace('\r\n', ' ').str.replace('\r', ' ').str.replace('\n', ' ')
-    # Export to other formats:
-    records = df[records_cols].to_dict(orient='records')
-
-    return records
+    return list(iter_csv_records(filename, records_cols))
 
 
 def to_datetime(timestamp):
@@ -138,32 +162,48 @@ def in2out_name(input_filename, in_suffix='gpt-in', out_suffix='gpt-out', file_e
     return outfile
     
 
-def read_jsonl(path):
+def iter_jsonl(path):
     """
-    Read a JSONL file and return a list of dictionaries.
+    Yield, one at a time, the dictionaries in a JSONL file, so the 
+    file is never fully held in memory.
 
     Parameters
     ----------
     path : str or Path
         Path to the JSONL file.
 
-    Returns
-    -------
-    list[dict]
+    Yields
+    ------
+    dict
         One dictionary per line in the file.
     """
-    records = []
     with open(path, 'r', encoding='utf-8') as f:
         for line_num, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
                 continue  # skip empty lines
             try:
-                #records.append(line)
-                records.append(json.loads(line))
+                record = json.loads(line)
             except json.JSONDecodeError as e:
                 raise ValueError(f"Invalid JSON on line {line_num}") from e
-    return records
+            yield record
+
+
+def read_jsonl(path):
+    """
+    Read a JSONL file and return a list of dictionaries.
+
+    Parameters
+    ----------
+    path : str or Path
+        Path to the JSONL file.
+
+    Returns
+    -------
+    list[dict]
+        One dictionary per line in the file.
+    """
+    return list(iter_jsonl(path))
 
 
 def extract(usecases, key):
@@ -205,12 +245,304 @@ def print_teses(teses_df):
         print('')
 
 
+def prompt_hash(model_name: str, prompt: str) -> str:
+    """
+    Return the key (str, SHA-256 hex digest) of the result of
+    `prompt` (str, fully rendered) sent to the model `model_name` 
+    (str).
+    """
+    return hashlib.sha256(f'{model_name}\n{prompt}'.encode('utf-8')).hexdigest()
+
+
+class PromptCache:
+    """
+    A local, content-addressed store of LLM answers: each answer is
+    kept under the hash of the model name and the fully rendered
+    prompt (see `prompt_hash()`), so the same work classified with
+    the same model and prompt is never sent again, whatever batch,
+    file or template variables it came from.
+
+    Entries are appended to a JSONL file as they arrive, so nothing
+    is lost if a run stops midway.
+    """
+    def __init__(self, path='prompt_cache.jsonl'):
+        """
+        Parameters
+        ----------
+        path : str or Path
+            JSONL file where the answers are stored. It is loaded
+            if it exists.
+        """
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self.entries = dict()
+        if self.path.exists():
+            for entry in read_jsonl(self.path):
+                self.entries[entry['key']] = entry
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def peek(self, key: str):
+        """
+        Return the answer (str) stored under `key` (str), or None 
+        if there is none, without counting it as a hit or a miss.
+        """
+        entry = self.entries.get(key)
+        return None if entry == None else entry['answer']
+
+    def get(self, key: str):
+        """
+        Return the answer (str) stored under `key` (str), or None 
+        if there is none, and count it as a hit or a miss.
+        """
+        answer = self.peek(key)
+        if answer == None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def put(self, key: str, answer: str, model_name=None):
+        """
+        Store the `answer` (str) under `key` (str), given by the 
+        model `model_name` (str), and append it to the file.
+        """
+        entry = {'key': key, 'model': model_name, 'answer': answer, 'created_at': dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        self.entries[key] = entry
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def add_batch_results(self, batch_input: list, batch_output: list) -> int:
+        """
+        Store the answers in a batch output (list of dicts, read 
+        from OpenAI's output JSONL), matching them to their prompts 
+        in the batch input (list of dicts) by 'custom_id'. Answers 
+        already stored are skipped. Returns the number of answers 
+        added.
+        """
+        requests = {r['custom_id']: r['body'] for r in batch_input}
+        n_added = 0
+        for r in batch_output:
+            body = requests[r['custom_id']]
+            key = prompt_hash(body['model'], body['messages'][0]['content'])
+            if key not in self.entries and r.get('response') != None and r['response']['status_code'] == 200:
+                self.put(key, r['response']['body']['choices'][0]['message']['content'], body['model'])
+                n_added += 1
+        return n_added
+
+    def report(self) -> dict:
+        """
+        Return the number of cache hits and misses since the 
+        cache was loaded, and the hit ratio.
+        """
+        total = self.hits + self.misses
+        ratio = self.hits / total if total > 0 else None
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': ratio}
+
+
+# Token and cost estimates:
+TOKENS_PER_WORD = 5069 / 3481    # Fallback ratio, calibrated on https://platform.openai.com/tokenizer.
+TOKENS_PER_MESSAGE = 3           # Chat format overhead of each message...
+TOKENS_PER_REQUEST = 3           # ... and of each request (priming of the reply).
+OUTPUT_TOKENS = 500              # Expected output tokens per request, including reasoning (see `batch_status()`).
+BATCH_DISCOUNT = 0.5             # Price of the Batch API relative to the synchronous API.
+COUNT_CHUNK = 1000               # Prompts counted at once.
+# Synchronous API prices in USD per million (input, output) tokens; model snapshots use their family's price:
+MODEL_PRICES = {'gpt-5': (1.25, 10.00), 'gpt-5-mini': (0.25, 2.00), 'gpt-5-nano': (0.05, 0.40),
+                'gpt-4.1': (2.00, 8.00), 'gpt-4.1-mini': (0.40, 1.60), 'gpt-4.1-nano': (0.10, 0.40),
+                'gpt-4o': (2.50, 10.00), 'gpt-4o-mini': (0.15, 0.60)}
+
+
+class WordRatioEstimator:
+    """
+    Token counter that needs no tokenizer: the number of words in
+    each text times a ratio of tokens per word, which can be
+    calibrated on texts whose token counts are known.
+    """
+    name = 'word-ratio'
+
+    def __init__(self, tokens_per_word=TOKENS_PER_WORD):
+        self.tokens_per_word = tokens_per_word
+
+    def count(self, texts: list) -> np.ndarray:
+        """
+        Return the estimated number of tokens (array of ints) in
+        each one of `texts` (list of str).
+        """
+        n_words = pd.Series(list(texts), dtype=object).str.count(r'\S+').to_numpy(dtype=float)
+        return np.ceil(n_words * self.tokens_per_word).astype(int)
+
+    def calibrate(self, texts: list, n_tokens) -> float:
+        """
+        Set the ratio of tokens per word from `texts` (list of str)
+        with known numbers of tokens `n_tokens` (list of ints, e.g.
+        from a tokenizer). Returns the new ratio.
+        """
+        n_words = pd.Series(list(texts), dtype=object).str.count(r'\S+').sum()
+        self.tokens_per_word = float(np.sum(n_tokens) / n_words)
+        return self.tokens_per_word
+
+
+class TiktokenEstimator:
+    """
+    Token counter using the model's own tokenizer, from the 
+    `tiktoken` package (an optional dependency).
+    """
+    name = 'tiktoken'
+
+    def __init__(self, model_name, num_threads=8):
+        """
+        Raises ImportError if `tiktoken` is not installed, and other
+        exceptions if the encoding cannot be loaded (it is downloaded
+        on first use).
+        """
+        import tiktoken
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Models unknown to the installed tiktoken (e.g. newer ones):
+            self.encoding = tiktoken.get_encoding('o200k_base')
+        self.num_threads = num_threads
+
+    def count(self, texts: list) -> np.ndarray:
+        """
+        Return the number of tokens (array of ints) in each one of
+        `texts` (list of str), encoded in parallel.
+        """
+        tokens = self.encoding.encode_ordinary_batch(list(texts), num_threads=self.num_threads)
+        return np.array([len(t) for t in tokens], dtype=int)
+
+
+def get_token_estimator(model_name: str):
+    """
+    Return a token counter for `model_name` (str): its tokenizer, if
+    `tiktoken` is installed and its encoding can be loaded, or the
+    word-ratio fallback otherwise.
+    """
+    try:
+        return TiktokenEstimator(model_name)
+    except Exception:
+        return WordRatioEstimator()
+
+
+def model_prices(model_name: str, prices=MODEL_PRICES):
+    """
+    Return the (input, output) prices in USD per million tokens of
+    `model_name` (str), or of the longest model name in `prices` 
+    (dict) it starts with (e.g. a dated snapshot). None if unknown.
+    """
+    matches = [m for m in prices if model_name == m or model_name.startswith(m + '-')]
+    if len(matches) == 0:
+        return None
+    return prices[max(matches, key=len)]
+
+
+def estimate_cost(input_tokens: int, output_tokens: int, model_name: str, batch=True, prices=MODEL_PRICES):
+    """
+    Return the cost in USD (float) of `input_tokens` (int) and 
+    `output_tokens` (int) with `model_name` (str) in the Batch API 
+    (if `batch` is True) or in the synchronous API. None if the 
+    model's prices are unknown.
+    """
+    model_price = model_prices(model_name, prices)
+    if model_price == None:
+        return None
+    cost = (input_tokens * model_price[0] + output_tokens * model_price[1]) / 1e6
+    return cost * BATCH_DISCOUNT if batch == True else cost
+
+
+def iter_chunks(iterable, size: int):
+    """
+    Yield lists with `size` (int) consecutive items from `iterable`
+    (the last one may be shorter).
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+# Concurrent (non-batch) classification:
+MAX_CONCURRENCY = 8              # Requests in flight.
+REQUESTS_PER_MINUTE = 500        # Rate limits of the account (depend on the model and tier).
+TOKENS_PER_MINUTE = 200_000
+MAX_RETRIES = 6                  # Retries of each request after a 429 or 5xx status (or a connection error).
+BACKOFF_BASE = 1.0               # Seconds before the first retry (doubled at each retry, with jitter)...
+BACKOFF_MAX = 60.0               # ... up to this.
+
+
+class TokenBucket:
+    """
+    Asynchronous rate limiter: a bucket holding up to `capacity` 
+    units (e.g. requests or tokens), refilled at `rate` units per 
+    second. Each request takes its units from the bucket, waiting 
+    until there are enough.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        """
+        Wait until `amount` (float) units are available and take
+        them (amounts above the capacity wait for a full bucket).
+        """
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Return whether a request that raised `error` should be retried:
+    rate limits (429), server errors (5xx) and connection errors.
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def retry_wait(error: Exception, attempt: int) -> float:
+    """
+    Return the seconds to wait before retrying a request that
+    raised `error` for the `attempt`-th time (int, from 0): the 
+    'Retry-After' sent by the server, if any, or an exponential 
+    backoff with jitter.
+    """
+    response = getattr(error, 'response', None)
+    if response != None and response.headers.get('retry-after') != None:
+        try:
+            return float(response.headers['retry-after'])
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1)
+
+
 class PublicDataUsageDetector:
     """
     An academic work inspector that uses OpenAI's LLMs to classify 
     works into "Uses public data" or "Does not use public data".
     """
-    def __init__(self, model_name, key_path, prompt_template, examples_datasets, examples_data_providers, project='proj_ZwJObp10wyAmWtBSIESV70Lw', temperature=1):
+    def __init__(self, model_name, key_path, prompt_template, examples_datasets, examples_data_providers, project='proj_ZwJObp10wyAmWtBSIESV70Lw', temperature=1, cache=None, token_estimator=None):
         """
         Parameters
         ----------
@@ -232,6 +564,14 @@ class PublicDataUsageDetector:
             Sampling temperature for the language model. Higher values
             increase randomness, while lower values make the output more
             deterministic. Default is 1.
+        cache : str, Path, PromptCache or None
+            Cache of previous answers (or the path to its file). 
+            Works whose prompt was already answered by the same 
+            model are not sent again. If None, no cache is used.
+        token_estimator : object or None
+            Token counter with a `count(texts)` method (see 
+            `WordRatioEstimator`). If None, the best available
+            one is used (see `get_token_estimator()`).
         """
 
         # Initial values:
@@ -246,6 +586,8 @@ class PublicDataUsageDetector:
         self.prompt_template = prompt_template
         self.template_vars = {'examples_datasets': examples_datasets, 'examples_data_providers': examples_data_providers}
         self.temperature = temperature
+        self.cache = PromptCache(cache) if isinstance(cache, (str, Path)) else cache
+        self.token_estimator = get_token_estimator(model_name) if token_estimator == None else token_estimator
         
         # Load the API key and other parameters:
         self.env = load_env_vars(key_path)
@@ -272,21 +614,39 @@ class PublicDataUsageDetector:
         prompt = self.template % prompt_input
         return prompt
 
+
+    def cache_key(self, data_dict: dict) -> str:
+        """
+        Return the cache key (str) of the classification of the work
+        described in `data_dict` (dict): a hash of the model name and
+        of the rendered prompt.
+        """
+        return prompt_hash(self.model_name, self.build_prompt(data_dict))
+
     
     def inspect(self, titulo, resumo, palavras_chave):
         """
         Call OpenAI's model to classify the work with the specified 
-        metadata.
+        metadata (or get the answer from the cache, if it is there).
         """
         
         # Create prompt:
         data_dict = {'titulo': titulo, 'resumo': resumo, 'palavras_chave': palavras_chave}
         prompt = self.build_prompt(data_dict)
+
+        # Look for previous answer:
+        if self.cache != None:
+            key = prompt_hash(self.model_name, prompt)
+            answer = self.cache.get(key)
+            if answer != None:
+                return answer
         
         # Ask LLM:
         completion = self.client.chat.completions.create(model=self.model_name, temperature=self.temperature, messages=[{"role": "developer", "content": prompt}])
         # Get response:
         answer = completion.choices[0].message.content
+        if self.cache != None:
+            self.cache.put(key, answer, self.model_name)
         
         return answer
 
@@ -315,6 +675,48 @@ class PublicDataUsageDetector:
             return json.dumps(api_request, ensure_ascii=False)
 
     
+    def iter_batch(self, data_records, id_prefix='request-', id_offset=0, endpoint='/v1/chat/completions'):
+        """
+        Yield, one at a time, the requests (str, in JSON format) for 
+        classifying the works in `data_records` (iterable of dicts, 
+        e.g. from `iter_csv_records()`), so the batch is never held 
+        in memory.
+
+        If the detector has a cache, works already answered (and 
+        repeated works in `data_records`) are skipped, keeping the 
+        'custom_id' of the others; use `build_results_csv()` with 
+        `detector` to recover all answers.
+
+        See `build_batch()` for the parameters.
+        """
+        seen = set()
+        for i, d in enumerate(data_records):
+            if self.cache != None:
+                key = self.cache_key(d)
+                if key in seen:
+                    continue
+                seen.add(key)
+                # Each unique work is counted once: a hit if answered before, a miss if it is to be sent:
+                if self.cache.get(key) != None:
+                    continue
+            yield self.build_batch_instance(id_prefix + str(i + id_offset), d, serialize=True, endpoint=endpoint)
+
+
+    def write_batch(self, data_records, f, id_prefix='request-', id_offset=0, endpoint='/v1/chat/completions') -> int:
+        """
+        Write the batch requests for `data_records` (iterable of 
+        dicts) to the file object `f` (opened in binary mode), one 
+        JSON per line, as they are built. Returns the number of 
+        requests written. See `build_batch()` for the other 
+        parameters.
+        """
+        n_requests = 0
+        for line in self.iter_batch(data_records, id_prefix, id_offset, endpoint):
+            f.write(line.encode('utf-8') + b'\n')
+            n_requests += 1
+        return n_requests
+
+    
     def build_batch(self, data_records: list, save_to=None, id_prefix='request-', id_offset=0, endpoint='/v1/chat/completions'):
         """
         Create a string in JSONL format in which each line is a JSON 
@@ -322,26 +724,31 @@ class PublicDataUsageDetector:
 
         Parameters
         ----------
-        data_records : list of dict 
+        data_records : list or iterable of dict 
             Metadata of the academic works to classify. Each entry 
             should contain the keys: 'titulo', 'resumo' and 
             'palavras_chave'.
         save_to : str, Path or None
-            If `save_to` (str | Path) is provided, save the JSONL to 
-            the specified file and return nothing.
+            If `save_to` (str | Path) is provided, stream the JSONL to 
+            the specified file and return the number of requests 
+            written.
         id_prefix : str
             Prefix for the 'custom_id' of each request.
         id_offset : int
             The number associated to the first request in the batch.
         endpoint : str
             Which OpenAI's endpoint to use for the request.            
+
+        If the detector has a cache, works already answered (and 
+        repeated works in `data_records`) are left out of the batch, 
+        keeping the 'custom_id' of the others; use `build_results_csv()` 
+        with `detector` to recover all answers.
         """
-        jsonl = '\n'.join([self.build_batch_instance(id_prefix + str(i + id_offset), d, serialize=True, endpoint=endpoint) for i, d in enumerate(data_records)])
         if save_to == None:
-            return jsonl
+            return '\n'.join(self.iter_batch(data_records, id_prefix, id_offset, endpoint))
         else: 
-            with open(save_to, 'w') as f:
-                f.write(jsonl)
+            with open(save_to, 'wb') as f:
+                return self.write_batch(data_records, f, id_prefix, id_offset, endpoint)
 
 
     def upload_batch(self, data_records: list, save_to=None, id_prefix='request-', id_offset=0, endpoint='/v1/chat/completions'):
@@ -351,13 +758,14 @@ class PublicDataUsageDetector:
 
         Parameters
         ----------
-        data_records : list of dict 
+        data_records : list or iterable of dict 
             Metadata of the academic works to classify. Each entry 
             should contain the keys: 'titulo', 'resumo' and 
             'palavras_chave'.
         save_to : str, Path or None
             If `save_to` (str | Path) is provided, save the JSONL to 
-            the specified file and return nothing.
+            the specified file. Otherwise, it is streamed to a 
+            temporary file, deleted after the upload.
         id_prefix : str
             Prefix for the 'custom_id' of each request.
         id_offset : int
@@ -367,24 +775,32 @@ class PublicDataUsageDetector:
 
         Returns
         -------
-        batch_input_file : FileObject
+        batch_input_file : FileObject or None
             An OpenAI API object that describes a file uploaded to 
             OpenAI Platform. The file contain the information 
-            required to run a batch.
+            required to run a batch. None if there was nothing to 
+            send (all works found in the cache).
         """            
-        # Stream payload:
+        # Stream payload through a temporary file:
         if save_to == None:
-            batch = self.build_batch(data_records, save_to=save_to, id_prefix=id_prefix, id_offset=id_offset, endpoint=endpoint).encode()
-            batch_input_file = self.client.files.create(file=batch, purpose="batch")
+            with tempfile.TemporaryFile() as f:
+                n_requests = self.write_batch(data_records, f, id_prefix=id_prefix, id_offset=id_offset, endpoint=endpoint)
+                if n_requests == 0:
+                    return None
+                f.seek(0)
+                batch_input_file = self.client.files.create(file=('batch_gpt-in.jsonl', f), purpose="batch")
         # Save a copy of payload:
         else:
-            self.build_batch(data_records, save_to=save_to, id_prefix=id_prefix, id_offset=id_offset, endpoint=endpoint)
-            batch_input_file = self.client.files.create(file=open(save_to, 'rb'), purpose="batch")
+            n_requests = self.build_batch(data_records, save_to=save_to, id_prefix=id_prefix, id_offset=id_offset, endpoint=endpoint)
+            if n_requests == 0:
+                return None
+            with open(save_to, 'rb') as f:
+                batch_input_file = self.client.files.create(file=f, purpose="batch")
 
         return batch_input_file
 
 
-    def run_batch(self, batch_file, batch_description='Public data usage detector', endpoint='/v1/chat/completions'):
+    def run_batch(self, batch_file, batch_description='Public data usage detector', endpoint='/v1/chat/completions', metadata=None):
         """
         Request to run the batch specified in a file previously uploaded 
         to OpenAI's platform.
@@ -397,6 +813,9 @@ class PublicDataUsageDetector:
             Description to be added to the batch's metadata.
         endpoint : str
             Which OpenAI's endpoint to use for the request.            
+        metadata : dict or None
+            Other metadata (str to str) to tag the batch with, e.g. to 
+            find it later.
 
         Returns
         -------
@@ -404,7 +823,10 @@ class PublicDataUsageDetector:
             An OpenAI API object that describes a batch submitted to the
             OpenAI Platform.
         """
-        batch_obj = self.client.batches.create(input_file_id=batch_file.id, endpoint=endpoint, completion_window='24h', metadata={"description": batch_description})
+        batch_metadata = {"description": batch_description}
+        if metadata != None:
+            batch_metadata.update(metadata)
+        batch_obj = self.client.batches.create(input_file_id=batch_file.id, endpoint=endpoint, completion_window='24h', metadata=batch_metadata)
 
         return batch_obj
 
@@ -435,16 +857,20 @@ class PublicDataUsageDetector:
 
         Returns
         -------
-        batch_obj : Batch
+        batch_obj : Batch or None
             An OpenAI API object that describes a batch submitted to the
             OpenAI Platform. It can be used to monitor the batch's status.
+            None if all works were found in the cache.
         """        
         
         batch_input_file = self.upload_batch(data_records, save_to=save_to, id_prefix=id_prefix, id_offset=id_offset, endpoint=endpoint)
+        self.jsonl_in = save_to
+        if batch_input_file == None:
+            print('All works found in the cache: no batch submitted.')
+            return None
         batch_obj = self.run_batch(batch_input_file, batch_description=batch_description, endpoint=endpoint)
         self.batch_obj = batch_obj
         self.batch_id  = batch_obj.id
-        self.jsonl_in  = save_to
 
         return batch_obj
 
@@ -460,7 +886,8 @@ class PublicDataUsageDetector:
         csv_file : str 
             Metadata of the academic works to classify. The CSV 
             should contain the columns: 'titulo', 'resumo' and 
-            'palavras_chave'.
+            'palavras_chave'. It is read as the batch is written,
+            one row at a time.
         save_to : str, Path or None
             If `save_to` (str | Path) is provided, save the input JSONL 
             to the specified file.
@@ -479,11 +906,54 @@ class PublicDataUsageDetector:
             An OpenAI API object that describes a batch submitted to the
             OpenAI Platform. It can be used to monitor the batch's status.
         """ 
-        records = csv2records(csv_file)
+        records = iter_csv_records(csv_file)
         batch_obj = self.inspect_batch(records, save_to, id_prefix, id_offset, batch_description, endpoint)
         return batch_obj
     
 
+    def complete_batch_results(self, data_records: list, batch_input: list, batch_output: list, id_prefix='request-', id_offset=0):
+        """
+        Store the answers of a batch in the cache and rebuild the 
+        batch input and output as if all `data_records` (list of 
+        dicts) had been sent, taking the answers left out of the 
+        batch (see `build_batch()`) from the cache.
+
+        Parameters
+        ----------
+        data_records : list or iterable of dict
+            Metadata of all the academic works, in the order used 
+            to build the batch.
+        batch_input : list of dicts
+            Requests sent in the batch (read from its input JSONL).
+        batch_output : list of dicts
+            Answers to the batch (read from its output JSONL).
+        id_prefix : str
+            Prefix for the 'custom_id' of each request.
+        id_offset : int
+            The number associated to the first request in the batch.
+
+        Returns
+        -------
+        full_input : list of dicts
+            One request per work in `data_records`.
+        full_output : list of dicts
+            One answer per work found in the cache.
+        """
+        self.cache.add_batch_results(batch_input, batch_output)
+        
+        full_input, full_output = [], []
+        for i, d in enumerate(data_records):
+            custom_id = id_prefix + str(i + id_offset)
+            prompt = self.build_prompt(d)
+            full_input.append({'custom_id': custom_id, 'body': {'model': self.model_name, 'messages': [{'role': 'developer', 'content': prompt}]}})
+            # Prompts were already counted as hits or misses when the batch was built:
+            answer = self.cache.peek(prompt_hash(self.model_name, prompt))
+            if answer != None:
+                full_output.append({'custom_id': custom_id, 'response': {'status_code': 200, 'body': {'choices': [{'message': {'content': answer}}]}}})
+
+        return full_input, full_output
+
+    
     def estimate_instance_tokens(self, batch_instance):
         """
         Estimate the number of tokens in the prompt of a batch
@@ -499,16 +969,31 @@ class PublicDataUsageDetector:
         Returns
         -------
         tot_tokens : int
-            Number of tokens estimated from the word counts in the
-            prompt.
+            Number of tokens in the messages (counted by the 
+            detector's token estimator), plus the chat format
+            overhead.
         """
+        contents = extract(batch_instance['body']['messages'], 'content')
+        tot_tokens = self.token_estimator.count(contents).sum() + TOKENS_PER_MESSAGE * len(contents) + TOKENS_PER_REQUEST
         
-        text_data = ' '.join(extract(batch_instance['body']['messages'], 'content'))
-        n_words = np.array([len(t.split()) for t in text_data])
-        tot_words = n_words.sum()
-        tot_tokens = int(tot_words / 3481 * 5069) # Based on from https://platform.openai.com/tokenizer
-        
-        return tot_tokens
+        return int(tot_tokens)
+
+
+    def count_prompt_tokens(self, data_records, chunk_size=COUNT_CHUNK) -> np.ndarray:
+        """
+        Estimate the number of input tokens of the request for each 
+        work in `data_records` (list or iterable of dicts), counting
+        the prompts in chunks of `chunk_size` (int) at once.
+
+        Returns
+        -------
+        tokens : array of ints
+            Input tokens of each request, in order.
+        """
+        counts = [self.token_estimator.count([self.build_prompt(d) for d in chunk]) for chunk in iter_chunks(data_records, chunk_size)]
+        if len(counts) == 0:
+            return np.zeros(0, dtype=int)
+        return np.concatenate(counts) + TOKENS_PER_MESSAGE + TOKENS_PER_REQUEST
 
 
     def estimate_batch_tokens(self, data_records: dict):
@@ -517,7 +1002,7 @@ class PublicDataUsageDetector:
 
         Parameters
         ----------
-        data_records : list of dict
+        data_records : list or iterable of dict
             Metadata of the academic works to classify. Each entry 
             should contain the keys: 'titulo', 'resumo' and 
             'palavras_chave'.
@@ -529,11 +1014,38 @@ class PublicDataUsageDetector:
             used to classify all records in the `data_records` 
             list.
         """
-        tokens = [self.estimate_instance_tokens(self.build_batch_instance(str(i), d)) for i, d in enumerate(data_records)]
-        #tokens = [self.build_batch_instance(str(i), d) for i, d in enumerate(data_records)]
-        batch_tokens = np.sum(tokens)
-        #return tokens
-        return int(batch_tokens)
+        return int(self.count_prompt_tokens(data_records).sum())
+
+
+    def estimate_batch_cost(self, data_records, output_tokens=OUTPUT_TOKENS, batch=True, prices=MODEL_PRICES) -> dict:
+        """
+        Estimate the tokens and cost of classifying `data_records` 
+        (list or iterable of dicts).
+
+        Parameters
+        ----------
+        data_records : list or iterable of dict
+            Metadata of the academic works to classify.
+        output_tokens : int
+            Expected output tokens per request (including reasoning
+            tokens; compare with `batch_status()` of a past batch).
+        batch : bool
+            Whether to use Batch API prices (or synchronous ones).
+        prices : dict
+            Map from model name to the (input, output) prices in USD 
+            per million tokens.
+
+        Returns
+        -------
+        estimate : dict
+            Number of requests, input and expected output tokens, 
+            cost in USD (None if the model's prices are unknown) and
+            the token estimator used.
+        """
+        tokens = self.count_prompt_tokens(data_records)
+        n_input, n_output = int(tokens.sum()), int(output_tokens * len(tokens))
+        return {'n_requests': len(tokens), 'input_tokens': n_input, 'output_tokens': n_output,
+                'cost': estimate_cost(n_input, n_output, self.model_name, batch, prices), 'estimator': self.token_estimator.name}
     
     
     def print_batch_info(self, data: dict) -> None:
@@ -690,6 +1202,140 @@ class PublicDataUsageDetector:
             print("Type of error:", type(e))
         
 
+    async def inspect_request(self, client, instance: dict, limits: dict, max_retries=MAX_RETRIES) -> dict:
+        """
+        Send one batch `instance` (dict, see `build_batch_instance()`) 
+        directly to the chat completions endpoint through the async 
+        `client`, respecting the `limits` (dict with the 'concurrency' 
+        Semaphore and the 'requests' and 'tokens' TokenBuckets) and 
+        retrying with backoff after 429 and 5xx statuses.
+
+        Returns
+        -------
+        result : dict
+            The answer in the format of a batch output line, with the 
+            'custom_id', the 'response' (status code and completion 
+            body) or the 'error'.
+        """
+        n_tokens = self.estimate_instance_tokens(instance) + OUTPUT_TOKENS
+        for attempt in range(max_retries + 1):
+            await limits['requests'].acquire(1)
+            await limits['tokens'].acquire(n_tokens)
+            try:
+                async with limits['concurrency']:
+                    completion = await client.chat.completions.create(**instance['body'])
+                body = completion.model_dump()
+                return {'id': None, 'custom_id': instance['custom_id'],
+                        'response': {'status_code': 200, 'request_id': getattr(completion, '_request_id', None), 'body': body},
+                        'error': None}
+            except Exception as e:
+                if is_retryable(e) == False or attempt == max_retries:
+                    return {'id': None, 'custom_id': instance['custom_id'], 'response': None,
+                            'error': {'code': getattr(e, 'status_code', type(e).__name__), 'message': str(e)}}
+                await asyncio.sleep(retry_wait(e, attempt))
+
+
+    async def ainspect_records(self, data_records, save_to, id_prefix='request-', id_offset=0, max_concurrency=MAX_CONCURRENCY,
+                               requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, max_retries=MAX_RETRIES,
+                               client=None) -> dict:
+        """
+        Classify the works in `data_records` right away (instead of 
+        through OpenAI's batch mode), sending requests concurrently. 
+        The requests are saved to `save_to` and the answers are 
+        streamed, as they arrive, to the matching output file (see 
+        `in2out_name()`) in the batch output format, so both files 
+        can be passed to `build_results_csv()`. Requests that failed
+        go to an error file ('gpt-err'), as in batch mode. Works found in the 
+        cache are not sent (see `build_batch()`); new answers are 
+        added to it.
+
+        In a Jupyter notebook, call it with `await`; elsewhere, use
+        `inspect_records()`.
+
+        Parameters
+        ----------
+        data_records : list or iterable of dict
+            Metadata of the academic works to classify. Each entry 
+            should contain the keys: 'titulo', 'resumo' and 
+            'palavras_chave'.
+        save_to : str or Path
+            Path to the input JSONL file (e.g. ending in 
+            '_gpt-in.jsonl').
+        id_prefix : str
+            Prefix for the 'custom_id' of each request.
+        id_offset : int
+            The number associated to the first request.
+        max_concurrency : int
+            Maximum number of requests in flight.
+        requests_per_minute, tokens_per_minute : float
+            Rate limits (tokens are estimated by the detector's token
+            estimator, plus the expected output).
+        max_retries : int
+            Retries of each request after 429 or 5xx statuses.
+        client : AsyncOpenAI or None
+            Async client to use. If None, one is created with the 
+            detector's credentials.
+
+        Returns
+        -------
+        report : dict
+            Input and output files, number of requests sent, of 
+            answers and of errors, and the time taken.
+        """
+        t0 = time.perf_counter()
+        if client == None:
+            client = AsyncOpenAI(api_key=self.env['OPENAI_API_KEY'], project=self.env['OPENAI_PROJECT_ID'], max_retries=0)
+        limits = {'concurrency': asyncio.Semaphore(max_concurrency),
+                  'requests': TokenBucket(requests_per_minute / 60, max_concurrency),
+                  'tokens': TokenBucket(tokens_per_minute / 60, tokens_per_minute)}
+
+        # Save requests:
+        self.build_batch(data_records, save_to=save_to, id_prefix=id_prefix, id_offset=id_offset)
+        instances = iter_jsonl(save_to)
+        jsonl_out = in2out_name(str(save_to))
+        jsonl_err = in2out_name(str(save_to), out_suffix='gpt-err')
+        
+        # Send requests (read as needed, with at most `max_concurrency` tasks at once) and stream answers 
+        # (and errors, to a separate file, as in batch mode):
+        pending = dict()
+        n_requests, n_answers, n_errors = 0, 0, 0
+        with open(jsonl_out, 'w', encoding='utf-8') as f_out, open(jsonl_err, 'w', encoding='utf-8') as f_err:
+            while True:
+                for instance in instances:
+                    pending[asyncio.ensure_future(self.inspect_request(client, instance, limits, max_retries))] = instance['body']
+                    n_requests += 1
+                    if len(pending) >= max_concurrency:
+                        break
+                if len(pending) == 0:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    body = pending.pop(task)
+                    result = task.result()
+                    f = f_out if result['error'] == None else f_err
+                    f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    f.flush()
+                    if result['error'] == None:
+                        n_answers += 1
+                        if self.cache != None:
+                            self.cache.put(prompt_hash(body['model'], body['messages'][0]['content']),
+                                           result['response']['body']['choices'][0]['message']['content'], body['model'])
+                    else:
+                        n_errors += 1
+        self.jsonl_in, self.jsonl_out = str(save_to), jsonl_out
+
+        return {'jsonl_in': str(save_to), 'jsonl_out': jsonl_out, 'jsonl_err': jsonl_err, 'n_requests': n_requests,
+                'n_answers': n_answers, 'n_errors': n_errors, 'time': time.perf_counter() - t0}
+
+
+    def inspect_records(self, data_records, save_to, **kwargs) -> dict:
+        """
+        Run `ainspect_records()` (see it for the parameters) from 
+        synchronous code.
+        """
+        return asyncio.run(self.ainspect_records(data_records, save_to, **kwargs))
+
+
     def run_classification(self, works_csv):
         """
         Apply the 'public data usage' detector to academic works.
@@ -730,7 +1376,7 @@ def binary_encode(class_series):
         return y
     
 
-def build_results_csv(data_file, gpt_jsonl_in, gpt_jsonl_out, save_to=None, application='usecase_detection'):
+def build_results_csv(data_file, gpt_jsonl_in, gpt_jsonl_out, save_to=None, application='usecase_detection', detector=None, id_prefix='request-'):
     """
     Join GPT classification to original data file about academic 
     works.
@@ -743,10 +1389,11 @@ def build_results_csv(data_file, gpt_jsonl_in, gpt_jsonl_out, save_to=None, appl
         of public dataset usage.
     gpt_jsonl_in : str
         Path to the GPT batch input in JSONL format.
-    gpt_jsonl_out : str
+    gpt_jsonl_out : str or None
         Path to the GPT batch output in JSONL format, with
         classification as 'Uses public data' or 'Does nor use
-        public data'.
+        public data'. None if no batch was sent (all works 
+        found in the detector's cache).
     save_to : str or None
         If provided, save the original data with extra columns 
         'y_pred' and 'class', containing GPT's classification, 
@@ -760,6 +1407,13 @@ def build_results_csv(data_file, gpt_jsonl_in, gpt_jsonl_out, save_to=None, appl
           public datasets or not.
         - 'metadata_collection': For collecting metadata about
           the usecase.
+    detector : PublicDataUsageDetector or None
+        The detector that built the batch. If it has a cache, the 
+        batch answers are stored in it and the answers of works 
+        left out of the batch are taken from it.
+    id_prefix : str
+        Prefix of the 'custom_id' of each request (only used with 
+        `detector`).
 
     Returns
     -------
@@ -772,7 +1426,10 @@ def build_results_csv(data_file, gpt_jsonl_in, gpt_jsonl_out, save_to=None, appl
     test_df = pd.read_csv(data_file)
     # Load GPT results:
     gpt_input  = read_jsonl(gpt_jsonl_in)
-    gpt_output = read_jsonl(gpt_jsonl_out)
+    gpt_output = read_jsonl(gpt_jsonl_out) if gpt_jsonl_out != None else []
+    # Add answers found in cache:
+    if detector != None and detector.cache != None:
+        gpt_input, gpt_output = detector.complete_batch_results(iter_csv_records(data_file), gpt_input, gpt_output, id_prefix)
     
     # Create a GPT classification DataFrame:
     gpt_df = pd.DataFrame()
@@ -0,0 +1 @@
+../codigo/imagebatch.py
\ No newline at end of file
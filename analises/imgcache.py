@@ -0,0 +1 @@
+../codigo/imgcache.py
\ No newline at end of file
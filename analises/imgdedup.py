@@ -0,0 +1 @@
+../codigo/imgdedup.py
\ No newline at end of file
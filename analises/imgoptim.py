@@ -0,0 +1 @@
+../codigo/imgoptim.py
\ No newline at end of file
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Incremental ingestion of CORDATA's form exports into the clean usecases
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import hashlib
+import argparse
+import datetime as dt
+from pathlib import Path
+import pandas as pd
+
+import clean as cc
+import curation as cu
+import institutions as ins
+
+
+# Hard-coded paths:
+BRUTOS_DIR = '../dados/brutos/'
+CURADOS_DIR = '../dados/curados/'
+EXPORT_PATTERN = '*_dados-abertos.csv'
+CLEAN_FILE = '../dados/limpos/usecases_current.json'
+MANIFEST_FILE = '../dados/limpos/ingest_manifest.json'
+TRANSLATIONS_FILE = '../codigo/data/translations.csv'
+INSTITUTIONS_PATTERN = '../dados/aux/organizacao_*.json'
+
+
+def file_hash(path) -> str:
+    """
+    Return the SHA-256 hex digest of the content of the file
+    at `path` (str or Path).
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path=MANIFEST_FILE) -> dict:
+    """
+    Load the manifest of processed form exports stored at `path`
+    (str or Path), or return an empty one if it does not exist.
+    The manifest maps each export filename (under 'files') to
+    the hash of its content, the file read and the IDs of its
+    rows (the hash_ids of the raw rows), and the ID of each
+    patched row (under 'patches') to the hash of its patch.
+    """
+    if Path(path).exists() == False:
+        return {'files': {}, 'patches': {}}
+    manifest = cc.load_json(path)
+    manifest.setdefault('patches', {})
+    return manifest
+
+
+def save_manifest(manifest: dict, path=MANIFEST_FILE):
+    """
+    Save the `manifest` (dict) of processed form exports to
+    `path` (str or Path).
+    """
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+
+
+def save_clean(clean_json: dict, path=CLEAN_FILE) -> bool:
+    """
+    Save the clean usecases `clean_json` (dict) to `path` (str or
+    Path), setting their last update to today, unless their data
+    is the same as the one already saved there (so the file and
+    its update date are only touched when usecases change).
+    
+    Returns whether the file was written.
+    """
+    if Path(path).exists() == True and cc.load_json(path)['data'] == clean_json['data']:
+        return False
+    metadata = dict(clean_json['metadata'], last_update=dt.datetime.today().strftime('%Y-%m-%d'))
+    with open(path, 'w') as f:
+        json.dump(dict(clean_json, metadata=metadata), f, indent=2, ensure_ascii=False)
+    return True
+
+
+def export_source(name: str, brutos_dir=BRUTOS_DIR, curados_dir=CURADOS_DIR) -> Path:
+    """
+    Return the path to the form export `name` (str) to be read:
+    its legacy curated copy, if it exists, or the raw one (to
+    which curation patches are applied).
+    """
+    curated = Path(curados_dir) / name
+    if curated.exists():
+        return curated
+    return Path(brutos_dir) / name
+
+
+def pending_exports(manifest: dict, brutos_dir=BRUTOS_DIR, curados_dir=CURADOS_DIR, pattern=EXPORT_PATTERN) -> list:
+    """
+    List the form exports in `brutos_dir` that are not in the
+    `manifest` (dict) or whose content (or curated copy) changed.
+
+    Returns
+    -------
+    pending : list of dicts
+        The filename ('name'), the path to the file to read
+        ('source') and its content hash ('sha256') of each
+        pending export, in filename order.
+    """
+    pending = []
+    for raw_path in sorted(Path(brutos_dir).glob(pattern)):
+        source = export_source(raw_path.name, brutos_dir, curados_dir)
+        sha256 = file_hash(source)
+        entry  = manifest['files'].get(raw_path.name)
+        if entry == None or entry['sha256'] != sha256:
+            pending.append({'name': raw_path.name, 'source': str(source), 'sha256': sha256})
+    return pending
+
+
+def read_export(path) -> pd.DataFrame:
+    """
+    Read a CSV form export at `path` (str or Path).
+    """
+    return pd.read_csv(path, sep=';')
+
+
+def read_curated_export(source, brutos_dir=BRUTOS_DIR, patches=dict()):
+    """
+    Read the form export at `source` (str or Path) and apply the
+    curation `patches` (dict from row ID to patch) to it, unless
+    it is a legacy curated copy (i.e. not in `brutos_dir`).
+
+    Returns
+    -------
+    curated_df : DataFrame
+        The export, without the rows deleted by the patches.
+    row_ids : Series of ints
+        The ID of each row in the export (see
+        `curation.apply_patches()`).
+    """
+    raw_df = read_export(source)
+    if Path(source).parent.resolve() != Path(brutos_dir).resolve():
+        return raw_df, cc.build_hash_id(raw_df)
+    return cu.apply_patches(raw_df, patches)
+
+
+def changed_patches(manifest: dict, patches: dict) -> set:
+    """
+    Return the IDs (set of ints) of the rows whose curation patch
+    is new, was changed or was removed since the last ingestion,
+    according to the `manifest` (dict).
+    """
+    current  = {str(row_id): cu.patch_hash(p) for row_id, p in patches.items()}
+    recorded = manifest['patches']
+    changed  = {k for k in current.keys() | recorded.keys() if current.get(k) != recorded.get(k)}
+    return {int(k) for k in changed}
+
+
+def merge_usecases(previous: list, new: list, removed_ids=set(), aliases=dict()) -> list:
+    """
+    Merge `new` usecases (list of dicts) into `previous` ones by
+    'hash_id': those already present are replaced in place and
+    the others are added on top (newest first), in reverse order.
+    Usecases with hash_ids in `removed_ids` are dropped. `aliases`
+    (dict) maps hash_ids of previous usecases to the hash_ids of
+    the new usecases that replace them in place.
+
+    Returns a list of dicts.
+    """
+    new_by_id = {uc['hash_id']: uc for uc in new}
+    previous_ids = {uc['hash_id'] for uc in previous} | set(aliases.values())
+
+    merged = [new_by_id.get(aliases.get(uc['hash_id'], uc['hash_id']), uc) for uc in previous if uc['hash_id'] not in removed_ids]
+    added  = [uc for uc in new if uc['hash_id'] not in previous_ids]
+
+    return added[::-1] + merged
+
+
+def mark_ingested(manifest_path=MANIFEST_FILE, brutos_dir=BRUTOS_DIR, curados_dir=CURADOS_DIR, pattern=EXPORT_PATTERN,
+                  patches_path=cu.PATCHES_FILE) -> dict:
+    """
+    Record all current form exports and curation patches as
+    processed, without cleaning them. Use it once to start the manifest when the clean output
+    already contains the usecases from these exports.
+
+    Returns the manifest (dict).
+    """
+    manifest = load_manifest(manifest_path)
+    patches = cu.load_patches(patches_path)
+    now = dt.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    for export in pending_exports(manifest, brutos_dir, curados_dir, pattern):
+        curated_df, row_ids = read_curated_export(export['source'], brutos_dir, patches)
+        manifest['files'][export['name']] = {'sha256': export['sha256'], 'source': export['source'],
+                                             'hash_ids': row_ids.tolist(), 'ingested_at': now}
+    manifest['patches'] = {str(row_id): cu.patch_hash(p) for row_id, p in patches.items()}
+    save_manifest(manifest, manifest_path)
+    return manifest
+
+
+def ingest(clean_path=CLEAN_FILE, manifest_path=MANIFEST_FILE, brutos_dir=BRUTOS_DIR, curados_dir=CURADOS_DIR,
+           pattern=EXPORT_PATTERN, patches_path=cu.PATCHES_FILE, vocabularies=None, inst2id=None, max_datasets=10,
+           skip_known_urls=True, dry_run=False, verbose=False) -> dict:
+    """
+    Parse only the form exports that are new or changed since the last
+    ingestion (according to the manifest) and merge their usecases into
+    the clean output by 'hash_id'. Within these exports, only rows not
+    processed before (with IDs neither in the manifest nor in the clean
+    output) are cleaned, so a new form download costs only its own new
+    rows. Curation patches (see `curation.py`) are applied to the raw
+    exports; rows whose patch is new, changed or removed are cleaned
+    again (or removed, if deleted by the patch), even if their export
+    did not change. Usecases from rows that disappeared from a changed
+    export are removed. The images of new usecases are not processed
+    (see `imagebatch.batch_etl_images()`).
+
+    Parameters
+    ----------
+    clean_path : str or Path
+        JSON file with the clean usecases (and metadata), updated
+        in place.
+    manifest_path : str or Path
+        JSON file with the manifest of processed exports.
+    brutos_dir : str or Path
+        Folder with the raw form exports.
+    curados_dir : str or Path
+        Folder with legacy curated copies of raw form exports,
+        which are read instead of the raw ones.
+    pattern : str
+        Glob pattern of the form exports.
+    patches_path : str or Path
+        JSON file with the curation patches.
+    vocabularies : dict or None
+        Compiled vocabularies of types, topics and countries, with
+        their translations to Spanish. If None, compile them from
+        TRANSLATIONS_FILE (see `clean.load_vocabularies()`).
+    inst2id : defaultdict or None
+        Mapper from institutions' names to CGU IDs. If None, load
+        it from INSTITUTIONS_PATTERN.
+    max_datasets : int
+        The maximum number of datasets allowed in CORDATA's form.
+    skip_known_urls : bool
+        Whether to skip new rows whose 'url' already belongs to a
+        clean usecase (e.g. a usecase later edited in the CMS).
+    dry_run : bool
+        If True, do not save the clean output nor the manifest.
+    verbose : bool
+        Whether to print what is done with each export.
+
+    Returns
+    -------
+    report : dict
+        For each export read, the number of rows, of new rows, of
+        patched rows cleaned again and the error (if it failed),
+        plus the number of usecases added or replaced and removed,
+        the institutions' names left without ID but with a fuzzy
+        or acronym match, to be reviewed (see 
+        `institutions.InstitutionResolver`), and whether the clean
+        output was written (if saved, see `save_clean()`).
+    """
+    # Load data:
+    manifest = load_manifest(manifest_path)
+    clean_json = cc.load_json(clean_path)
+    patches = cu.load_patches(patches_path)
+    if vocabularies == None:
+        vocabularies = cc.load_vocabularies(TRANSLATIONS_FILE)
+    if inst2id == None:
+        inst2id = cc.load_institution_identifier(INSTITUTIONS_PATTERN)
+
+    # Exports to read: new or changed ones, and those with changed patches:
+    now = dt.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    pending = pending_exports(manifest, brutos_dir, curados_dir, pattern)
+    pending_names = {e['name'] for e in pending}
+    repatched_ids = changed_patches(manifest, patches)
+    for name, entry in sorted(manifest['files'].items()):
+        if name not in pending_names and len(repatched_ids.intersection(entry['hash_ids'])) > 0:
+            pending.append({'name': name, 'source': entry['source'], 'sha256': entry['sha256']})
+
+    # Rows already processed:
+    pending_names = {e['name'] for e in pending}
+    kept_ids = {h for name, entry in manifest['files'].items() if name not in pending_names for h in entry['hash_ids']}
+
+    patch_hashes = {str(row_id): cu.patch_hash(p) for row_id, p in patches.items()}
+    report = {'exports': [], 'n_new_usecases': 0, 'n_removed_usecases': 0}
+    new_usecases = []
+    removed_ids  = set()
+    for export in pending:
+        log = {'name': export['name'], 'source': export['source'], 'n_rows': None, 'n_new_rows': None,
+               'n_repatched_rows': None, 'error': None}
+        try:
+            curated_df, row_ids = read_curated_export(export['source'], brutos_dir, patches)
+            kept_rows = row_ids.index.isin(curated_df.index)
+
+            # Rows of a previous version of this export that are gone, or deleted by a patch:
+            previous_entry = manifest['files'].get(export['name'], {'hash_ids': []})
+            previous_ids = set(previous_entry['hash_ids'])
+            gone_ids = set(row_ids[~kept_rows]) & repatched_ids
+            gone_ids |= previous_ids - set(row_ids) - kept_ids
+
+            # Clean only the new rows (not processed before nor in the clean output) and the repatched ones:
+            present_ids = {uc['hash_id'] for uc in clean_json['data'] + new_usecases if uc['hash_id'] not in gone_ids}
+            new_rows = ~row_ids.isin(kept_ids | present_ids | previous_ids)
+            if skip_known_urls == True:
+                known_urls = {uc['url'] for uc in clean_json['data'] if uc['hash_id'] not in removed_ids | gone_ids}
+                new_rows = new_rows & ~curated_df['url'].str.strip().reindex(row_ids.index).isin(known_urls - {'https://'})
+            repatched_rows = row_ids.isin(repatched_ids - {uc['hash_id'] for uc in new_usecases})
+            selected = (new_rows | repatched_rows) & kept_rows
+            usecases = cc.clean_form_data(curated_df.loc[row_ids.index[selected]], vocabularies, inst2id, max_datasets,
+                                          row_ids)
+            new_usecases += usecases
+            removed_ids  |= gone_ids
+
+            # Update manifest:
+            manifest['files'][export['name']] = {'sha256': export['sha256'], 'source': export['source'],
+                                                 'hash_ids': row_ids.tolist(), 'ingested_at': now}
+            kept_ids |= set(row_ids)
+            for row_id in repatched_ids.intersection(row_ids):
+                if str(row_id) in patch_hashes:
+                    manifest['patches'][str(row_id)] = patch_hashes[str(row_id)]
+                else:
+                    manifest['patches'].pop(str(row_id), None)
+            log.update({'n_rows': len(row_ids), 'n_new_rows': int((new_rows & kept_rows).sum()),
+                        'n_repatched_rows': int(repatched_rows.sum())})
+
+        except Exception as e:
+            log['error'] = f'{type(e).__name__}: {e}'
+
+        report['exports'].append(log)
+        if verbose == True:
+            print(log)
+
+    # Usecases cleaned from legacy curated copies have other hash_ids; match them by URL:
+    output_ids = {uc['hash_id'] for uc in clean_json['data']}
+    id_by_url = {uc['url']: uc['hash_id'] for uc in clean_json['data'] if uc['url'] != 'https://'}
+    aliases = {id_by_url[uc['url']]: uc['hash_id'] for uc in new_usecases
+               if uc['hash_id'] in repatched_ids and uc['hash_id'] not in output_ids and uc['url'] in id_by_url}
+
+    # Merge into clean output:
+    removed_ids -= {uc['hash_id'] for uc in new_usecases}
+    clean_json['data'] = merge_usecases(clean_json['data'], new_usecases, removed_ids, aliases)
+    report['n_new_usecases'] = len(new_usecases)
+    report['n_removed_usecases'] = len(removed_ids & output_ids)
+    if type(inst2id) == ins.InstitutionResolver:
+        report['institutions_review'] = {name: match['name'] for name, match in inst2id.review.items()}
+
+    # Record the patches of rows not found in any export (the others are recorded once their export is read):
+    exported_ids = {h for entry in manifest['files'].values() for h in entry['hash_ids']}
+    for row_id in repatched_ids - exported_ids:
+        manifest['patches'][str(row_id)] = patch_hashes.get(str(row_id))
+    manifest['patches'] = {k: v for k, v in manifest['patches'].items() if v != None}
+
+    # Save:
+    if dry_run == False and len(pending) > 0:
+        report['data_written'] = save_clean(clean_json, clean_path)
+        save_manifest(manifest, manifest_path)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest new or changed CORDATA form exports into the clean usecases.")
+    parser.add_argument('--bootstrap', action='store_true', help='Only record the current exports as already processed.')
+    parser.add_argument('--dry-run', action='store_true', help='Do not save the clean output nor the manifest.')
+    parser.add_argument('--clean', default=CLEAN_FILE, help='JSON file with the clean usecases.')
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help='JSON file with the manifest of processed exports.')
+    args = parser.parse_args()
+
+    if args.bootstrap == True:
+        manifest = mark_ingested(args.manifest)
+        print(f"{len(manifest['files'])} exports recorded as processed.")
+    else:
+        report = ingest(args.clean, args.manifest, dry_run=args.dry_run, verbose=True)
+        print(f"{report['n_new_usecases']} usecases added or updated, {report['n_removed_usecases']} removed.")
+        for name, suggestion in report.get('institutions_review', {}).items():
+            print(f'Institution without ID (review the match): "{name}" -> "{suggestion}"')
@@ -0,0 +1 @@
+../codigo/institutions.py
\ No newline at end of file
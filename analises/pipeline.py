@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cached pipeline from CORDATA's form exports to the published usecases
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import argparse
+import datetime as dt
+from glob import glob
+from pathlib import Path
+from copy import deepcopy
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import clean as cc
+import ingest as ig
+import curation as cu
+import institutions as ins
+import vocabulary as voc
+
+
+# Hard-coded paths:
+CACHE_DIR = '../dados/cache/'
+CMS_FILES = ['../codigo/data/usecases_temp.json', '../codigo/data/usecases_current.json']
+
+
+class Stage:
+    """
+    A step of the pipeline: a function of the outputs of other
+    stages (its dependencies) and of files. Its output is cached
+    under a key computed from the dependencies' keys, the files'
+    contents and the code version, so it is only recomputed when
+    one of these changes.
+    """
+    def __init__(self, name, func, deps=[], files=[], modules=[cc]):
+        """
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        func : callable
+            Function that computes the stage's output. It gets the
+            outputs of `deps`, in order, as positional arguments.
+            The output must be picklable.
+        deps : list of str
+            Names of the stages whose outputs are inputs to `func`.
+        files : list of str
+            Paths or glob patterns of the files read by `func`.
+        modules : list of modules
+            Modules used by `func`, whose source code is part of
+            the code version.
+        """
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.files = files
+        self.modules = modules
+
+    def code_version(self) -> str:
+        """
+        Return a hash of the source code of the stage's function
+        and of its modules.
+        """
+        func = self.func.func if type(self.func) == partial else self.func
+        digest = hashlib.sha256(inspect.getsource(func).encode('utf-8'))
+        for module in self.modules:
+            digest.update(inspect.getsource(module).encode('utf-8'))
+        if type(self.func) == partial:
+            digest.update(repr((self.func.args, sorted(self.func.keywords.items()))).encode('utf-8'))
+        return digest.hexdigest()
+
+    def input_files(self) -> list:
+        """
+        Return the sorted list of existing files read by the stage.
+        """
+        return sorted(set([f for pattern in self.files for f in glob(pattern)]))
+
+    def key(self, dep_keys: list) -> str:
+        """
+        Return the cache key of the stage given the keys of its
+        dependencies, `dep_keys` (list of str, in the order of
+        `deps`).
+        """
+        digest = hashlib.sha256(self.name.encode('utf-8'))
+        digest.update(self.code_version().encode('utf-8'))
+        for k in dep_keys:
+            digest.update(k.encode('utf-8'))
+        for f in self.input_files():
+            digest.update(f.encode('utf-8'))
+            digest.update(ig.file_hash(f).encode('utf-8'))
+        return digest.hexdigest()
+
+
+class Pipeline:
+    """
+    A set of stages forming a directed acyclic graph (DAG), run
+    in dependency order. Stale stages are recomputed, with the
+    independent ones running in parallel (in threads), and fresh
+    ones are loaded from the cache only if needed.
+    """
+    def __init__(self, stages: list, cache_dir=CACHE_DIR, max_workers=4):
+        """
+        Parameters
+        ----------
+        stages : list of Stage
+            The stages, in any order.
+        cache_dir : str or Path
+            Folder where the stages' outputs are cached.
+        max_workers : int
+            Maximum number of stages running at the same time.
+        """
+        self.stages = {s.name: s for s in stages}
+        self.cache_dir = Path(cache_dir)
+        self.max_workers = max_workers
+        self.outputs = dict()
+
+    def order(self) -> list:
+        """
+        Return the names of the stages in a topological order
+        (dependencies first). Raise an exception for unknown
+        dependencies or cycles.
+        """
+        ordered, visiting = [], set()
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise Exception(f'Cycle in pipeline at stage "{name}".')
+            if name not in self.stages:
+                raise Exception(f'Unknown stage "{name}".')
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.remove(name)
+            ordered.append(name)
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    def keys(self) -> dict:
+        """
+        Return the cache key of each stage.
+        """
+        keys = dict()
+        for name in self.order():
+            stage = self.stages[name]
+            keys[name] = stage.key([keys[d] for d in stage.deps])
+        return keys
+
+    def cache_path(self, name: str, key: str) -> Path:
+        """
+        Path to the cached output of stage `name` (str) with
+        cache `key` (str).
+        """
+        return self.cache_dir / f'{name}-{key[:16]}.pkl'
+
+    def output(self, name: str, key: str):
+        """
+        Return the output of stage `name` (str), loading it
+        from the cache if needed.
+        """
+        if name not in self.outputs:
+            with open(self.cache_path(name, key), 'rb') as f:
+                self.outputs[name] = pickle.load(f)
+        return self.outputs[name]
+
+    def compute(self, name: str, keys: dict) -> float:
+        """
+        Compute the output of stage `name` (str), store it in the
+        cache (removing older versions) and return the time it
+        took, in seconds.
+        """
+        stage = self.stages[name]
+        t0 = time.perf_counter()
+        output = stage.func(*[self.output(d, keys[d]) for d in stage.deps])
+
+        # Cache output:
+        for old in self.cache_dir.glob(f'{name}-*.pkl'):
+            old.unlink()
+        with open(self.cache_path(name, keys[name]), 'wb') as f:
+            pickle.dump(output, f)
+        self.outputs[name] = output
+
+        return time.perf_counter() - t0
+
+    def run(self, force=[], verbose=False) -> dict:
+        """
+        Run the pipeline, recomputing only the stale stages: those
+        with no cached output for their current key and those listed
+        in `force` (list of str).
+
+        Returns
+        -------
+        report : dict
+            For each stage, its status ('cached' or 'computed'),
+            its key and the time spent computing it (in seconds).
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.outputs = dict()
+        keys = self.keys()
+        stale = {n for n in keys if n in force or self.cache_path(n, keys[n]).exists() == False}
+        report = {n: {'status': 'cached', 'key': keys[n], 'time': None} for n in keys}
+
+        done = set(keys) - stale
+        running = dict()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while len(done) < len(keys):
+                # Submit stale stages whose dependencies are done:
+                for name in self.order():
+                    if name not in done and name not in running.values() and set(self.stages[name].deps) <= done:
+                        running[pool.submit(self.compute, name, keys)] = name
+                # Wait for a stage to finish:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    report[name].update({'status': 'computed', 'time': future.result()})
+                    done.add(name)
+                    if verbose == True:
+                        print(f"{name}: computed in {report[name]['time']:.2f}s")
+
+        return report
+
+
+### Stages ###
+
+def parse_exports(pattern: str) -> dict:
+    """
+    Read all raw form exports matching `pattern` (str).
+    Returns a dict from filename to DataFrame.
+    """
+    return {Path(f).name: ig.read_export(f) for f in sorted(glob(pattern))}
+
+
+def curate_exports(parsed: dict, curados_dir: str, patches_path: str) -> dict:
+    """
+    Apply the curation patches stored at `patches_path` (str) to the
+    `parsed` exports (dict from filename to DataFrame), or replace
+    them by their legacy curated copies in `curados_dir` (str), when
+    these exist.
+
+    Returns a dict from filename to a tuple: the curated DataFrame
+    and the IDs of its rows (Series of ints).
+    """
+    patches = cu.load_patches(patches_path)
+    curated = dict()
+    for name, df in parsed.items():
+        legacy_path = Path(curados_dir) / name
+        if legacy_path.exists():
+            legacy_df = ig.read_export(legacy_path)
+            curated[name] = (legacy_df, cc.build_hash_id(legacy_df))
+        else:
+            curated[name] = cu.apply_patches(df, patches)
+    return curated
+
+
+def load_institutions(pattern: str) -> ins.InstitutionIndex:
+    """
+    Build the index of institutions' names to CGU IDs from the
+    JSON files matching `pattern` (str).
+    """
+    return ins.InstitutionIndex.from_cgu_files(pattern)
+
+
+def clean_exports(curated: dict, institutions: ins.InstitutionIndex, max_datasets=10) -> dict:
+    """
+    Clean the `curated` exports (dict from filename to DataFrame and
+    row IDs, see `curate_exports()`), without translations, looking
+    up institutions' IDs in the `institutions` index. Exports in
+    older form versions (which fail to be cleaned) are skipped, and
+    rows repeated across exports are kept only once.
+
+    Returns
+    -------
+    result : dict
+        The cleaned usecases ('usecases', list of dicts), the
+        error for each skipped export ('skipped') and the 
+        institutions' names left without ID but with a fuzzy 
+        or acronym match, to be reviewed ('institutions_review').
+    """
+    inst2id = ins.InstitutionResolver(institutions)
+    usecases, skipped, seen = [], dict(), set()
+    for name, (df, row_ids) in curated.items():
+        try:
+            cleaned = cc.clean_form_data(df, None, inst2id, max_datasets, row_ids)
+        except (KeyError, AssertionError) as e:
+            skipped[name] = f'{type(e).__name__}: {e}'
+            continue
+        usecases += [uc for uc in cleaned if uc['hash_id'] not in seen]
+        seen |= {uc['hash_id'] for uc in cleaned}
+    review = {name: match['name'] for name, match in inst2id.review.items()}
+    return {'usecases': usecases, 'skipped': skipped, 'institutions_review': review}
+
+
+def translate_usecases(cleaned: dict, vocabularies: dict) -> list:
+    """
+    Return a copy of the `cleaned` usecases (see `clean_exports()`)
+    with translations to Spanish from the compiled `vocabularies`
+    (dict, see `clean.load_vocabularies()`).
+    """
+    usecases = deepcopy(cleaned['usecases'])
+    voc.translate_usecases(usecases, vocabularies)
+    return usecases
+
+
+def load_cms(cms_files: list) -> dict:
+    """
+    Load the data (with metadata) edited in the CMS from the first
+    existing file in `cms_files` (list of str).
+    """
+    for path in cms_files:
+        if Path(path).exists():
+            return cc.load_json(path)
+    raise FileNotFoundError(f'None of the CMS files {cms_files} exist.')
+
+
+def merge_with_cms(usecases: list, cms_data: dict, manifest: dict) -> dict:
+    """
+    Add to the CMS data `cms_data` (dict) the form `usecases`
+    (list of dicts) that were never ingested, that is: whose rows
+    are not in the ingest `manifest` (dict, see `ingest.load_manifest()`)
+    and that the CMS does not have (by 'hash_id' or 'url'). Usecases
+    missing from the CMS but already ingested were deleted or edited
+    by the curators, so they are not added back.
+
+    Returns the merged data (dict, with metadata).
+    """
+    ingested_ids = {h for entry in manifest['files'].values() for h in entry['hash_ids']}
+    known_ids  = {uc['hash_id'] for uc in cms_data['data']} | ingested_ids
+    known_urls = {uc['url'] for uc in cms_data['data']} - {'https://'}
+    new = [uc for uc in usecases if uc['hash_id'] not in known_ids and uc['url'] not in known_urls]
+    merged = {'metadata': deepcopy(cms_data['metadata']), 'data': ig.merge_usecases(cms_data['data'], new)}
+    return merged
+
+
+def ingested_manifest(manifest: dict, curated: dict, cleaned: dict, patches_path: str, brutos_dir: str, curados_dir: str) -> dict:
+    """
+    Return a copy of the ingest `manifest` (dict) recording the
+    `curated` exports (see `curate_exports()`) that are new or changed
+    and were not skipped when `cleaned` (see `clean_exports()`) as 
+    processed, along with the curation patches at `patches_path` (str)
+    applied to their rows.
+    """
+    manifest = deepcopy(manifest)
+    patch_hashes = {str(row_id): cu.patch_hash(p) for row_id, p in cu.load_patches(patches_path).items()}
+    now = dt.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    for name, (df, row_ids) in curated.items():
+        source = ig.export_source(name, brutos_dir, curados_dir)
+        sha256 = ig.file_hash(source)
+        if name in cleaned['skipped'] or manifest['files'].get(name, {}).get('sha256') == sha256:
+            continue
+        manifest['files'][name] = {'sha256': sha256, 'source': str(source), 'hash_ids': row_ids.tolist(), 'ingested_at': now}
+        for row_id in row_ids:
+            if str(row_id) in patch_hashes:
+                manifest['patches'][str(row_id)] = patch_hashes[str(row_id)]
+            else:
+                manifest['patches'].pop(str(row_id), None)
+    return manifest
+
+
+def publish(merged: dict, manifest: dict, curated: dict, cleaned: dict, clean_path: str, manifest_path: str,
+            patches_path: str, brutos_dir: str, curados_dir: str) -> dict:
+    """
+    Save the `merged` data (dict) to `clean_path` (str), setting
+    its last update to today, and record the form exports in the
+    ingest `manifest` (dict) at `manifest_path` (str), so their rows
+    are not added again (see `ingested_manifest()`). Files are only
+    written if their content changed.
+    
+    Returns the path, the number of usecases published and whether
+    the data and the manifest were written.
+    """
+    write_data = ig.save_clean(merged, clean_path)
+
+    new_manifest = ingested_manifest(manifest, curated, cleaned, patches_path, brutos_dir, curados_dir)
+    write_manifest = new_manifest != manifest
+    if write_manifest == True:
+        ig.save_manifest(new_manifest, manifest_path)
+
+    return {'path': clean_path, 'n_usecases': len(merged['data']), 'data_written': write_data,
+            'manifest_written': write_manifest}
+
+
+def build_pipeline(brutos_dir=ig.BRUTOS_DIR, curados_dir=ig.CURADOS_DIR, patches_path=cu.PATCHES_FILE,
+                   clean_path=ig.CLEAN_FILE, manifest_path=ig.MANIFEST_FILE, cms_files=CMS_FILES,
+                   translations_file=ig.TRANSLATIONS_FILE, institutions_pattern=ig.INSTITUTIONS_PATTERN,
+                   cache_dir=CACHE_DIR, max_datasets=10, max_workers=4) -> Pipeline:
+    """
+    Create the pipeline from the form exports to the published usecases,
+    with stages: parse (raw exports), curate (apply curation patches or
+    legacy curated copies), clean, translate, merge (with the CMS data) and publish.
+    The translations, the institutions' IDs, the CMS data and the ingest
+    manifest are loaded in stages of their own, which run in parallel 
+    with parsing. The publish stage also depends on the published file 
+    itself, so it runs again if that file is deleted or edited by hand
+    (it is often also the CMS data, so after new usecases are published
+    the next run recomputes the CMS, merge and publish stages once, 
+    without writing anything).
+    """
+    raw_pattern = str(Path(brutos_dir) / ig.EXPORT_PATTERN)
+    stages = [Stage('parse', partial(parse_exports, raw_pattern), files=[raw_pattern], modules=[ig]),
+              Stage('curate', partial(curate_exports, curados_dir=curados_dir, patches_path=patches_path), ['parse'],
+                    files=[str(Path(curados_dir) / ig.EXPORT_PATTERN), patches_path], modules=[ig, cu]),
+              Stage('translations', partial(cc.load_vocabularies, translations_file), files=[translations_file], modules=[cc, voc]),
+              Stage('institutions', partial(load_institutions, institutions_pattern), files=[institutions_pattern], modules=[ins]),
+              Stage('clean', partial(clean_exports, max_datasets=max_datasets), ['curate', 'institutions'], modules=[cc, ins]),
+              Stage('translate', translate_usecases, ['clean', 'translations'], modules=[voc]),
+              Stage('cms', partial(load_cms, cms_files), files=cms_files),
+              Stage('manifest', partial(ig.load_manifest, manifest_path), files=[manifest_path], modules=[ig]),
+              Stage('merge', merge_with_cms, ['translate', 'cms', 'manifest'], modules=[ig]),
+              Stage('publish', partial(publish, clean_path=clean_path, manifest_path=manifest_path, patches_path=patches_path,
+                                       brutos_dir=brutos_dir, curados_dir=curados_dir),
+                    ['merge', 'manifest', 'curate', 'clean'], files=[clean_path, manifest_path], modules=[ig, cu])]
+    return Pipeline(stages, cache_dir, max_workers)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run CORDATA's cached data pipeline (form exports to published usecases).")
+    parser.add_argument('--force', nargs='*', default=[], help='Stages to recompute even if cached.')
+    parser.add_argument('--workers', type=int, default=4, help='Maximum number of stages running in parallel.')
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(max_workers=args.workers)
+    report = pipeline.run(args.force, verbose=True)
+    print(json.dumps({n: r['status'] for n, r in report.items()}, indent=1))
+    for name, suggestion in pipeline.output('clean', report['clean']['key'])['institutions_review'].items():
+        print(f'Institution without ID (review the match): "{name}" -> "{suggestion}"')
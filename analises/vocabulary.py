@@ -0,0 +1 @@
+../codigo/vocabulary.py
\ No newline at end of file
@@ -0,0 +1 @@
+../codigo/webclient.py
\ No newline at end of file
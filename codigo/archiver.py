@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Bulk archiving of CORDATA's usecases in a web archive (Wayback Machine)
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import config as cf
+import webclient as web
+import linkrot as lr
+
+
+# Default configuration:
+DB_FILE = 'data/archive_jobs.sqlite'
+SAVE_ENDPOINT = 'https://web.archive.org'     # Base URL of the Save Page Now API.
+MAX_SUBMITS = 4                               # Captures being submitted or polled at once.
+DELAY = 5.0                                   # Seconds between the starts of requests to the archive.
+POLL_INTERVAL = 10.0                          # Seconds between polls of the same capture.
+MAX_POLLS = 30                                # Polls before a capture is given up (and retried next run).
+MAX_ATTEMPTS = 3                              # Submissions of a URL before it is marked as failed.
+TIMEOUT = 60                                  # Seconds for each request.
+
+# Job states:
+QUEUED, SUBMITTED, ARCHIVED, FAILED = 'queued', 'submitted', 'archived', 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    url         TEXT PRIMARY KEY,
+    state       TEXT NOT NULL,
+    job_id      TEXT,
+    archive_url TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    updated_at  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+
+#############
+### Queue ###
+#############
+
+def now() -> str:
+    """
+    Return the current date and time (str, ISO format).
+    """
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def connect(path=DB_FILE) -> sqlite3.Connection:
+    """
+    Open (and create, if needed) the SQLite database at `path`
+    (str) with the archiving jobs.
+    """
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def needs_archive(usecase: dict) -> bool:
+    """
+    Return whether `usecase` (dict) has a URL to archive but no
+    archived copy (its 'url_archive' is empty or a placeholder
+    like 'https://').
+    """
+    return lr.is_checkable(usecase.get('url')) and lr.is_checkable(usecase.get('url_archive')) == False
+
+
+def enqueue(con: sqlite3.Connection, usecases: list) -> int:
+    """
+    Add the URLs of the `usecases` (list of dicts) that need an
+    archived copy to the queue in the database `con`. URLs already
+    in the queue (in any state) are left as they are. Returns the
+    number of URLs added.
+    """
+    urls = list(dict.fromkeys(uc['url'].strip() for uc in usecases if needs_archive(uc)))
+    with con:
+        before = con.total_changes
+        con.executemany('INSERT OR IGNORE INTO jobs (url, state, updated_at) VALUES (?, ?, ?)',
+                        [(u, QUEUED, now()) for u in urls])
+        return con.total_changes - before
+
+
+def pending_jobs(con: sqlite3.Connection, limit=None) -> list:
+    """
+    List the jobs in the database `con` still to be done: captures
+    submitted in previous runs (to be polled) first, then the queued
+    URLs, oldest first. Returns at most `limit` (int or None) dicts.
+    """
+    query = f"""
+    SELECT url, state, job_id, attempts FROM jobs WHERE state IN ('{SUBMITTED}', '{QUEUED}')
+    ORDER BY state = '{QUEUED}', updated_at, url
+    """
+    rows = con.execute(query + (' LIMIT ?' if limit != None else ''), (limit,) if limit != None else ())
+    return [dict(zip(['url', 'state', 'job_id', 'attempts'], row)) for row in rows]
+
+
+def update_job(con: sqlite3.Connection, job: dict):
+    """
+    Save the state of `job` (dict) in the database `con`, right
+    away, so an interrupted run can resume from it.
+    """
+    with con:
+        con.execute('UPDATE jobs SET state = ?, job_id = ?, archive_url = ?, attempts = ?, error = ?, updated_at = ? '
+                    'WHERE url = ?', (job['state'], job.get('job_id'), job.get('archive_url'), job['attempts'],
+                                      job.get('error'), now(), job['url']))
+
+
+def archived_urls(con: sqlite3.Connection) -> dict:
+    """
+    Return a dict from each URL archived (according to the database
+    `con`) to the URL of its archived copy.
+    """
+    return dict(con.execute('SELECT url, archive_url FROM jobs WHERE state = ?', (ARCHIVED,)))
+
+
+##############
+### Client ###
+##############
+
+class WaybackClient:
+    """
+    Client of the Wayback Machine's Save Page Now API. Any object
+    with the same `submit()` and `status()` coroutines can replace
+    it (e.g. a client of another archive, or of a local stub).
+    """
+    def __init__(self, base_url=SAVE_ENDPOINT, access_key=None, secret_key=None):
+        """
+        Parameters
+        ----------
+        base_url : str
+            Address of the API (e.g. of a local stub, for testing).
+        access_key, secret_key : str or None
+            Credentials of an archive.org account (S3-like keys),
+            which raise the limits of the API.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'Accept': 'application/json'}
+        if access_key != None and secret_key != None:
+            self.headers['Authorization'] = f'LOW {access_key}:{secret_key}'
+
+    async def submit(self, session, url: str) -> str:
+        """
+        Ask the archive, through the aiohttp `session`, to capture
+        `url` (str). Returns the ID of the capture job (str).
+        """
+        async with session.post(f'{self.base_url}/save', data={'url': url}, headers=self.headers) as response:
+            response.raise_for_status()
+            content = await response.json(content_type=None)
+        if 'job_id' not in content:
+            raise ValueError(content.get('message', f'No job ID in response: {content}'))
+        return content['job_id']
+
+    async def status(self, session, job_id: str) -> dict:
+        """
+        Get the state of the capture `job_id` (str) through the
+        aiohttp `session`. Returns a dict with the 'status' ('pending',
+        'success' or 'error'), the 'archive_url' (if successful) and
+        the 'error' message (if any).
+        """
+        async with session.get(f'{self.base_url}/save/status/{job_id}', headers=self.headers) as response:
+            response.raise_for_status()
+            content = await response.json(content_type=None)
+        archive_url = None
+        if content.get('status') == 'success':
+            archive_url = f"https://web.archive.org/web/{content['timestamp']}/{content['original_url']}"
+        return {'status': content.get('status'), 'archive_url': archive_url, 'error': content.get('message')}
+
+
+###############
+### Running ###
+###############
+
+async def archive_job(session, client, job: dict, con: sqlite3.Connection, throttle: lr.HostThrottle,
+                      limit: asyncio.Semaphore, poll_interval=POLL_INTERVAL, max_polls=MAX_POLLS,
+                      max_attempts=MAX_ATTEMPTS) -> dict:
+    """
+    Take `job` (dict) forward: submit its URL through the `client` (if
+    not submitted yet) and poll the capture until it finishes or
+    `max_polls` (int) polls, `poll_interval` (float) seconds apart,
+    are done. Every change of state is saved to the database `con`.
+    Requests to the archive respect `throttle` (HostThrottle) and
+    `limit` (Semaphore), which is held only during each request (not
+    while waiting between polls). A failed submission or capture is
+    retried in the next runs, up to `max_attempts` (int) times, while
+    a failed poll keeps the job submitted, to be polled again (the 
+    capture may still succeed). A capture that does not finish within
+    `max_polls` also counts as an attempt, so it is polled again in
+    the next runs until the job runs out of attempts and fails.
+    Returns the updated job.
+    """
+    host = 'archive'
+    if job['state'] == QUEUED:
+        try:
+            # Wait for the archive's turn first, then hold a slot just for the request:
+            await throttle.wait_turn(host, limit)
+            try:
+                job['attempts'] += 1
+                job['job_id'] = await client.submit(session, job['url'])
+            finally:
+                limit.release()
+            job['state'], job['error'] = SUBMITTED, None
+        except Exception as e:
+            job['error'] = f'{type(e).__name__}: {e}'
+        update_job(con, job)
+
+    timed_out = False
+    if job['state'] == SUBMITTED:
+        try:
+            for _ in range(max_polls):
+                await asyncio.sleep(poll_interval)
+                await throttle.wait_turn(host, limit)
+                try:
+                    status = await client.status(session, job['job_id'])
+                finally:
+                    limit.release()
+                if status['status'] == 'success':
+                    job['state'], job['archive_url'], job['error'] = ARCHIVED, status['archive_url'], None
+                    break
+                if status['status'] == 'error':
+                    job['state'], job['error'] = QUEUED, status['error']
+                    break
+            else:
+                timed_out = True
+                job['attempts'] += 1
+                job['error'] = f'Capture not finished after {max_polls} polls.'
+        except Exception as e:
+            job['error'] = f'{type(e).__name__}: {e}'
+
+    if (job['state'] == QUEUED or timed_out == True) and job['attempts'] >= max_attempts:
+        job['state'] = FAILED
+    update_job(con, job)
+    return job
+
+
+async def archive_jobs(jobs: list, con: sqlite3.Connection, client=None, max_submits=MAX_SUBMITS, delay=DELAY,
+                       poll_interval=POLL_INTERVAL, max_polls=MAX_POLLS, max_attempts=MAX_ATTEMPTS,
+                       timeout=TIMEOUT) -> list:
+    """
+    Take all `jobs` (list of dicts, see `pending_jobs()`) forward
+    concurrently, with at most `max_submits` (int) of them being
+    submitted or polled at once and `delay` (float) seconds between
+    requests to the archive (see `archive_job()` for the other
+    parameters). If `client` is None, a `WaybackClient` is used.
+    Returns the updated jobs.
+    """
+    import aiohttp
+
+    client = WaybackClient() if client == None else client
+    throttle = lr.HostThrottle(max_submits, delay)
+    limit = asyncio.Semaphore(max_submits)
+    async with aiohttp.ClientSession(headers={'User-Agent': web.USER_AGENT},
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        return await asyncio.gather(*[archive_job(session, client, job, con, throttle, limit, poll_interval,
+                                                  max_polls, max_attempts) for job in jobs])
+
+
+def apply_archives(data_path: str, archived: dict) -> list:
+    """
+    Write the archived copies in `archived` (dict from URL to the
+    URL of its copy) to the 'url_archive' of the usecases in the
+    catalog at `data_path` (str) that still need one, in a single
+    update: the file is read, changed and replaced (atomically) once.
+    Returns the hash_ids of the updated usecases.
+    """
+    data = json.loads(Path(data_path).read_text(encoding='utf-8'))
+    today = datetime.today().strftime('%Y-%m-%d')
+    updated = []
+    for uc in data['data']:
+        if needs_archive(uc) and uc['url'].strip() in archived:
+            uc['url_archive'] = archived[uc['url'].strip()]
+            uc['modified_date'] = today
+            updated.append(uc['hash_id'])
+
+    if len(updated) > 0:
+        data['metadata']['last_update'] = today
+        temp_path = f'{data_path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(temp_path, data_path)
+    return updated
+
+
+def run_archiving(data_path=cf.TEMP_FILE, db_path=DB_FILE, client=None, limit=None, max_submits=MAX_SUBMITS,
+                  delay=DELAY, poll_interval=POLL_INTERVAL, max_polls=MAX_POLLS, max_attempts=MAX_ATTEMPTS,
+                  timeout=TIMEOUT, verbose=False) -> dict:
+    """
+    Archive the URLs of the usecases in the catalog at `data_path`
+    (str) without an archived copy and write the copies back to
+    the catalog. Progress is kept in the database at `db_path`
+    (str), so an interrupted run resumes where it stopped: captures
+    already submitted are polled instead of submitted again.
+
+    Parameters
+    ----------
+    data_path : str
+        JSON file with CORDATA's usecases.
+    db_path : str
+        SQLite database with the archiving jobs.
+    client : object or None
+        Archive client (see `WaybackClient`).
+    limit : int or None
+        Maximum number of jobs to take forward in this run.
+    max_submits, delay, poll_interval, max_polls, max_attempts, timeout
+        See `archive_job()` and `archive_jobs()`.
+    verbose : bool
+        Whether to print the progress.
+
+    Returns
+    -------
+    report : dict
+        Number of URLs queued, of jobs run, archived and failed, of
+        usecases updated and the time taken.
+    """
+    t0 = time.perf_counter()
+    usecases = json.loads(Path(data_path).read_text(encoding='utf-8'))['data']
+    con = connect(db_path)
+    n_queued = enqueue(con, usecases)
+    jobs = pending_jobs(con, limit)
+    if verbose == True:
+        print(f'{n_queued} URLs queued, {len(jobs)} jobs to run.')
+
+    jobs = asyncio.run(archive_jobs(jobs, con, client, max_submits, delay, poll_interval, max_polls, max_attempts, timeout))
+    updated = apply_archives(data_path, archived_urls(con))
+    con.close()
+
+    return {'n_queued': n_queued, 'n_jobs': len(jobs), 'n_archived': sum(1 for j in jobs if j['state'] == ARCHIVED),
+            'n_failed': sum(1 for j in jobs if j['state'] == FAILED), 'n_updated': len(updated),
+            'time': time.perf_counter() - t0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Archive the URLs of CORDATA's usecases without an archived copy.")
+    parser.add_argument('--data', default=cf.TEMP_FILE, help='JSON file with the usecases (updated in place).')
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database with the archiving jobs.')
+    parser.add_argument('--endpoint', default=SAVE_ENDPOINT, help='Base URL of the Save Page Now API.')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum number of jobs to run.')
+    parser.add_argument('--submits', type=int, default=MAX_SUBMITS, help='Captures submitted or polled at once.')
+    parser.add_argument('--delay', type=float, default=DELAY, help='Seconds between requests to the archive.')
+    args = parser.parse_args()
+
+    client = WaybackClient(args.endpoint, os.environ.get('ARCHIVE_ACCESS_KEY'), os.environ.get('ARCHIVE_SECRET_KEY'))
+    report = run_archiving(args.data, args.db, client, args.limit, args.submits, args.delay, verbose=True)
+    print(json.dumps(report, indent=1))
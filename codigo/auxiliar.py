@@ -199,19 +199,6 @@ def read_csv_as_dict(filename: str, delimiter=",", skip_header=True) -> dict:
     return result
 
 
-@st.cache_data
-def load_translations(path='data/translations.csv', from_l='ptbr', to_l='es') -> dict:
-    """
-    Load translations for terms used in the data from 
-    CSV file stored in `path` (str) and return a dict 
-    with the translations from language `from_l` (str)
-    to `to_l` (str). 
-    """
-    translations_df = read_csv_as_dict(path)
-    translation_dict = dict(zip(translations_df[from_l], translations_df[to_l]))
-    return translation_dict
-    
-
 def get_usecase_pos(usecases: list, hash_id: int) -> int: 
     """
     Given a list `usecases` of usecases (dicts), returns the 
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks and timing of the bulk archiver against a local stub archive
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from collections import Counter
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import archiver as ar
+
+
+# Number of polls a capture stays pending before finishing:
+POLLS_TO_FINISH = 2
+
+
+class StubArchive(BaseHTTPRequestHandler):
+    """
+    Imitate the Save Page Now API: captures finish after
+    POLLS_TO_FINISH polls, URLs containing 'blocked' fail and
+    those containing 'stuck' never finish.
+    Submissions per URL and requests in flight are recorded in
+    the server's `stats`.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, content: dict):
+        body = json.dumps(content).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def track(self, delta: int):
+        stats = self.server.stats
+        with stats['lock']:
+            stats['in_flight'] += delta
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+
+    def do_POST(self):
+        self.track(1)
+        try:
+            length = int(self.headers['Content-Length'])
+            url = parse_qs(self.rfile.read(length).decode())['url'][0]
+            stats = self.server.stats
+            with stats['lock']:
+                stats['submits'][url] += 1
+                job_id = f'spn2-{len(stats["jobs"])}'
+                stats['jobs'][job_id] = {'url': url, 'polls': 0}
+            time.sleep(0.01)
+            self.reply({'url': url, 'job_id': job_id})
+        finally:
+            self.track(-1)
+
+    def do_GET(self):
+        self.track(1)
+        try:
+            job = self.server.stats['jobs'][self.path.split('/')[-1]]
+            job['polls'] += 1
+            if job['polls'] < POLLS_TO_FINISH or 'stuck' in job['url']:
+                self.reply({'status': 'pending', 'job_id': self.path.split('/')[-1]})
+            elif 'blocked' in job['url']:
+                self.reply({'status': 'error', 'message': 'Blocked by robots.txt.'})
+            else:
+                self.reply({'status': 'success', 'timestamp': '20260101000000', 'original_url': job['url']})
+        finally:
+            self.track(-1)
+
+
+class FlakyClient(ar.WaybackClient):
+    """
+    Client whose first poll fails, as with a dropped connection.
+    """
+    failed = False
+
+    async def status(self, session, job_id: str) -> dict:
+        if self.failed == False:
+            self.failed = True
+            raise ConnectionError('Connection dropped.')
+        return await super().status(session, job_id)
+
+
+def serve_stub():
+    """
+    Start the stub archive in a background thread. Returns the
+    server (with its `stats`) and its base URL.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubArchive)
+    server.daemon_threads = True
+    server.stats = {'lock': threading.Lock(), 'submits': Counter(), 'jobs': dict(), 'in_flight': 0, 'max_in_flight': 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def run_checks(n_usecases=60, max_submits=4, poll_interval=0.05) -> dict:
+    """
+    Check the archiver against the stub archive on a catalog of
+    `n_usecases` (int) fake usecases: resuming, failures, limits and
+    the write-back, and time the archiving.
+
+    Returns
+    -------
+    report : dict
+        Results of the checks and the timings.
+    """
+    server, base_url = serve_stub()
+    client = ar.WaybackClient(base_url)
+    usecases = [{'hash_id': i, 'url': f'https://example.org/{"blocked" if i % 10 == 0 else "caso"}/{i}',
+                 'url_archive': 'https://', 'modified_date': None} for i in range(n_usecases)]
+    usecases += [{'hash_id': -1, 'url': 'https://example.org/arquivado', 'url_archive': 'https://web.archive.org/web/1/x',
+                  'modified_date': None},
+                 {'hash_id': -2, 'url': 'https://', 'url_archive': None, 'modified_date': None},
+                 {'hash_id': -3, 'url': usecases[1]['url'], 'url_archive': '', 'modified_date': None}]
+    params = dict(client=client, max_submits=max_submits, delay=0, poll_interval=poll_interval, max_attempts=3)
+    try:
+        with TemporaryDirectory() as folder:
+            data_path, db_path = str(Path(folder) / 'usecases.json'), str(Path(folder) / 'jobs.sqlite')
+            Path(data_path).write_text(json.dumps({'metadata': {'last_update': None}, 'data': usecases}))
+
+            # Interrupted run (captures still pending when polling stops, which counts as an attempt):
+            first = ar.run_archiving(data_path, db_path, max_polls=1, **params)
+            assert first['n_queued'] == n_usecases and first['n_archived'] == 0 and first['n_updated'] == 0, first
+
+            # Resumed run (no new submissions):
+            t0 = time.perf_counter()
+            second = ar.run_archiving(data_path, db_path, max_polls=5, **params)
+            t_second = time.perf_counter() - t0
+            assert max(server.stats['submits'].values()) == 1, 'Submitted captures should be polled, not resubmitted.'
+            n_blocked = len([u for u in usecases[:n_usecases] if 'blocked' in u['url']])
+            assert second['n_queued'] == 0 and second['n_archived'] == n_usecases - n_blocked, second
+            assert server.stats['max_in_flight'] <= max_submits, f"{server.stats['max_in_flight']} requests in flight."
+
+            # Write-back (a single update, including usecases sharing a URL):
+            data = json.loads(Path(data_path).read_text())
+            by_id = {uc['hash_id']: uc for uc in data['data']}
+            assert second['n_updated'] == n_usecases - n_blocked + 1, second
+            assert by_id[1]['url_archive'] == 'https://web.archive.org/web/20260101000000/https://example.org/caso/1'
+            assert by_id[-3]['url_archive'] == by_id[1]['url_archive'] and by_id[1]['modified_date'] != None
+            assert by_id[-1]['url_archive'] == 'https://web.archive.org/web/1/x' and by_id[-1]['modified_date'] == None
+            assert by_id[0]['url_archive'] == 'https://' and by_id[-2]['url_archive'] == None
+
+            # Failed captures are retried up to `max_attempts` times:
+            third = ar.run_archiving(data_path, db_path, max_polls=5, **params)
+            assert third['n_jobs'] == n_blocked and third['n_failed'] == n_blocked, third
+            assert ar.run_archiving(data_path, db_path, max_polls=5, **params)['n_jobs'] == 0
+
+            # A failed poll keeps the capture submitted, to be polled (not resubmitted) in the next run:
+            con = ar.connect(db_path)
+            ar.enqueue(con, [{'url': 'https://example.org/instavel', 'url_archive': None}])
+            flaky = FlakyClient(base_url)
+            for expected in [ar.SUBMITTED, ar.ARCHIVED]:
+                job = asyncio.run(ar.archive_jobs(ar.pending_jobs(con), con, flaky, max_submits, 0, poll_interval, 5, 2))[0]
+                assert job['state'] == expected and job['attempts'] == 1, job
+            assert server.stats['submits']['https://example.org/instavel'] == 1
+
+            # A capture that never finishes runs out of attempts instead of staying submitted forever:
+            ar.enqueue(con, [{'url': 'https://example.org/stuck', 'url_archive': None}])
+            for expected in [ar.SUBMITTED, ar.FAILED]:
+                job = asyncio.run(ar.archive_jobs(ar.pending_jobs(con), con, client, max_submits, 0, poll_interval, 2, 3))[0]
+                assert job['state'] == expected, job
+            con.close()
+    finally:
+        server.shutdown()
+
+    # Lower bound of the time of a serial run (polls of each capture one after the other):
+    t_serial = n_usecases * POLLS_TO_FINISH * poll_interval
+    return {'n_usecases': n_usecases, 'first_run': first, 'second_run': second, 'third_run': third,
+            'max_in_flight': server.stats['max_in_flight'], 't_resumed_run': t_second,
+            't_serial_lower_bound': t_serial}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the bulk archiver against a local stub archive.')
+    parser.add_argument('--n-usecases', type=int, default=60, help='Number of fake usecases to archive.')
+    parser.add_argument('--submits', type=int, default=4, help='Captures submitted or polled at once.')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='Seconds between polls of a capture.')
+    args = parser.parse_args()
+
+    print(json.dumps(run_checks(args.n_usecases, args.submits, args.poll_interval), indent=1))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Memory benchmark of the compact representation of CORDATA's usecases
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import gc
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from pathlib import Path
+
+import config as cf
+import vocabulary as voc
+import compact as cp
+
+
+def synthetic_catalog(usecases: list, n_usecases=100_000, seed=42) -> str:
+    """
+    Create a catalog of `n_usecases` (int) fake usecases by mixing the
+    fields of real `usecases` (list of dicts) at random, with unique
+    names, URLs and hash_ids. Returns its JSON (str), so it can be
+    loaded like the CMS loads its data.
+    """
+    rng = random.Random(seed)
+    data = []
+    for i in range(n_usecases):
+        uc = dict(rng.choice(usecases))
+        for field in ['description', 'authors', 'tags', 'datasets', 'pub_date', 'record_date', 'email']:
+            uc[field] = rng.choice(usecases)[field]
+        # Controlled fields and their translations come together:
+        donor = rng.choice(usecases)
+        for field, translated in voc.TRANSLATED_FIELDS.items():
+            uc[field], uc[translated] = donor[field], donor[translated]
+        uc['hash_id'] = rng.getrandbits(32)
+        uc['name'] = f"{uc['name']} ({i})"
+        uc['url'] = f"{uc['url']}?caso={i}"
+        data.append(uc)
+    return json.dumps({'metadata': {'last_update': '2026-01-01'}, 'data': data}, ensure_ascii=False)
+
+
+def run_benchmark(n_usecases=100_000, seed=42, data_file=cf.DATA_FILE) -> dict:
+    """
+    Measure the memory held by a synthetic catalog of `n_usecases`
+    (int) usecases, built from the real ones in `data_file` (str),
+    as JSON dicts and as a `compact.CompactCatalog`, and check that
+    the conversion is lossless.
+
+    Returns
+    -------
+    report : dict
+        Memory (in bytes, total and per usecase) and timings (in
+        seconds) of both representations and the reduction factor.
+    """
+    usecases = json.loads(Path(data_file).read_text(encoding='utf-8'))['data']
+    text = synthetic_catalog(usecases, n_usecases, seed)
+
+    options = {'type': cf.TYPE_OPTIONS, 'topics': cf.TOPIC_OPTIONS, 'countries': cf.COUNTRY_OPTIONS}
+    vocabularies = voc.compile_vocabularies(options, cf.TRANSLATIONS_FILE)
+    codec = cp.Codec.from_vocabularies(vocabularies, {'fed_units': cf.UF_OPTIONS, 'geo_level': cf.GEOLEVEL_OPTIONS,
+                                                      'data_license': cf.LICENSE_OPTIONS, 'data_format': cf.FORMAT_OPTIONS})
+
+    # Memory held by the dicts:
+    tracemalloc.start()
+    gc.collect()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    data = json.loads(text)
+    t_load = time.perf_counter() - t0
+    gc.collect()
+    dict_bytes = tracemalloc.get_traced_memory()[0] - base
+
+    # Memory held by the compact catalog alone (interned strings are shared with the dicts until they are freed):
+    t0 = time.perf_counter()
+    catalog = cp.CompactCatalog.from_json_data(data, codec)
+    t_encode = time.perf_counter() - t0
+    del data
+    gc.collect()
+    compact_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    # Check round trip:
+    t0 = time.perf_counter()
+    assert catalog.to_json_data() == json.loads(text), 'The compact catalog differs from the original data.'
+    t_decode = time.perf_counter() - t0
+    n_raw = sum(1 for r in catalog.records if r._raw != None)
+
+    report = {'n_usecases': n_usecases, 'python': sys.version.split()[0],
+              'dict_bytes': dict_bytes, 'compact_bytes': compact_bytes,
+              'dict_bytes_per_usecase': dict_bytes / n_usecases, 'compact_bytes_per_usecase': compact_bytes / n_usecases,
+              'reduction': dict_bytes / compact_bytes, 'n_usecases_with_raw_fields': n_raw,
+              't_json_load': t_load, 't_encode': t_encode, 't_decode_and_compare': t_decode}
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the memory saved by the compact representation of usecases.')
+    parser.add_argument('--n-usecases', type=int, default=100_000, help='Number of usecases in the synthetic catalog.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic catalog.')
+    parser.add_argument('--data', default=cf.DATA_FILE, help='JSON file with the real usecases used as a model.')
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.n_usecases, args.seed, args.data), indent=1))
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark of the image standardization pipeline for usecases in CORDATA.
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import tracemalloc
+import statistics
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from datetime import datetime
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import PIL
+from PIL import Image, ImageDraw
+
+import images as im
+
+
+# Synthetic sources (width, height), covering the crop and gray-band paths:
+SIZES = [(523, 293), (640, 480), (1920, 1080), (300, 300), (1200, 400), (400, 1200), (560, 293), (523, 330),
+         (4000, 3000)]
+FORMATS = ['JPEG', 'PNG', 'WEBP']
+STAGES = ['download', 'decode', 'fit', 'resize', 'encode']
+
+
+def synthetic_image(width: int, height: int, rng: random.Random):
+    """
+    Create an RGB image of size `width` x `height` with a gradient
+    background and random shapes, resembling a banner or logo.
+    """
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(1, width // 2 + 2), y0 + rng.randrange(1, height // 2 + 2)
+        color = tuple(rng.randrange(256) for _ in range(3))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+    return img
+
+
+def generate_images(folder, n_images=None, seed=42) -> list:
+    """
+    Save synthetic images with all combinations of SIZES and FORMATS
+    (repeated or truncated to `n_images` files, if provided) to
+    `folder` and return their filenames.
+    """
+    rng = random.Random(seed)
+    combos = [(size, fmt) for size in SIZES for fmt in FORMATS]
+    if n_images != None:
+        combos = [combos[i % len(combos)] for i in range(n_images)]
+
+    filenames = []
+    for i, ((width, height), fmt) in enumerate(combos):
+        filename = f'src_{i:04d}_{width}x{height}.{fmt.lower()}'
+        synthetic_image(width, height, rng).save(Path(folder) / filename, format=fmt)
+        filenames.append(filename)
+    return filenames
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that does not log requests.
+    """
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_folder(folder):
+    """
+    Serve the files in `folder` over HTTP from a background thread.
+
+    Returns
+    -------
+    server : ThreadingHTTPServer
+        The running server (call `shutdown()` to stop it).
+    base_url : str
+        URL of the folder.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(folder)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def timed(stage: str, timings: dict, func, *args):
+    """
+    Run `func(*args)` and record, in `timings` (dict), the time
+    (in seconds) and the peak of memory allocated by Python
+    (in bytes) under `stage` (str). Return the function's output.
+    Pillow's pixel buffers are not allocated by Python, so they are
+    reported separately by `bench_image()`; in the 'thread' mode the
+    peak also includes allocations made by the other threads.
+    """
+    tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    output = func(*args)
+    timings[stage] = {'time': time.perf_counter() - t0, 'peak_bytes': tracemalloc.get_traced_memory()[1]}
+    return output
+
+
+def encode_png(img) -> int:
+    """
+    Encode `img` (PIL Image) as PNG in memory, the same way as
+    `images.standardize_image()`, and return its size in bytes.
+    """
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.tell()
+
+
+def bench_image(url: str, target_height=293, target_width=523, grayband_factor=1) -> dict:
+    """
+    Run the standardization pipeline on the image at `url` (str),
+    timing each stage (see STAGES). Being a module-level function,
+    it can be sent to a process pool.
+
+    Returns
+    -------
+    result : dict
+        The URL, the source size, the aspect-ratio path taken
+        ('crop', 'pad' or 'none'), the pixel memory of the decoded
+        image and the time and Python memory peak of each stage.
+    """
+    if tracemalloc.is_tracing() == False:
+        tracemalloc.start()
+    timings = dict()
+
+    def download():
+        response = im.http_get(url, stream=True)
+        return im.stream_to_file(response)
+
+    fp = timed('download', timings, download)
+    with fp:
+        img = timed('decode', timings, im.decode_image, fp, (target_width, target_height))
+    fitted = timed('fit', timings, im.fit_aspect_ratio, img, target_height, target_width, grayband_factor)
+    scaled = timed('resize', timings, im.scale_to_width, fitted, target_width)
+    n_bytes = timed('encode', timings, encode_png, scaled)
+
+    # Identify the path taken by `fit_aspect_ratio()`:
+    if fitted.size == img.size:
+        path = 'none'
+    elif fitted.size[0] * fitted.size[1] < img.size[0] * img.size[1]:
+        path = 'crop'
+    else:
+        path = 'pad'
+
+    return {'url': url, 'size': img.size, 'path': path, 'pixel_bytes': img.size[0] * img.size[1] * len(img.getbands()),
+            'output_bytes': n_bytes, 'stages': timings}
+
+
+def run_mode(mode: str, urls: list, grayband_factor=1, max_workers=4) -> dict:
+    """
+    Benchmark all `urls` (list of str) in one of the execution modes:
+    'serial', 'thread' (pool of threads) or 'process' (pool of
+    processes), and summarize the results.
+
+    Returns
+    -------
+    report : dict
+        The mode, the number of workers, the wall time and throughput
+        (images per second), the statistics of each stage (overall and
+        per aspect-ratio path) and the individual results.
+    """
+    func = partial(bench_image, grayband_factor=grayband_factor)
+    t0 = time.perf_counter()
+    if mode == 'serial':
+        results = [func(url) for url in urls]
+    elif mode == 'thread':
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(func, urls))
+    elif mode == 'process':
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(func, urls))
+    else:
+        raise ValueError(f"Unknown mode '{mode}'; use 'serial', 'thread' or 'process'.")
+    wall_time = time.perf_counter() - t0
+
+    paths = sorted(set([r['path'] for r in results]))
+    report = {'mode': mode, 'workers': 1 if mode == 'serial' else max_workers, 'grayband_factor': grayband_factor,
+              'n_images': len(results), 'wall_time': wall_time, 'images_per_second': len(results) / wall_time,
+              'stages': summarize_stages(results),
+              'paths': {p: summarize_stages([r for r in results if r['path'] == p]) for p in paths},
+              'results': results}
+    return report
+
+
+def summarize_stages(results: list) -> dict:
+    """
+    Return, for each stage, the mean, median and maximum time
+    (in seconds), the total time and the maximum Python memory
+    peak (in bytes) over `results` (list of dicts from
+    `bench_image()`), plus the number of results.
+    """
+    summary = {'n_images': len(results)}
+    for stage in STAGES:
+        times = [r['stages'][stage]['time'] for r in results]
+        peaks = [r['stages'][stage]['peak_bytes'] for r in results]
+        summary[stage] = {'mean': statistics.mean(times), 'median': statistics.median(times), 'max': max(times),
+                          'total': sum(times), 'max_peak_bytes': max(peaks)}
+    return summary
+
+
+def run_benchmark(modes=('serial', 'thread', 'process'), grayband_factors=(1, 1.2, 1.5), n_images=None, max_workers=4,
+                  seed=42, output_path=None, verbose=False) -> dict:
+    """
+    Generate synthetic images, serve them from a local HTTP server and
+    benchmark the image pipeline for each combination of execution mode
+    and `grayband_factor`.
+
+    Parameters
+    ----------
+    modes : sequence of str
+        Execution modes (see `run_mode()`).
+    grayband_factors : sequence of float
+        Values of `grayband_factor` to test (see
+        `images.fit_aspect_ratio()`).
+    n_images : int or None
+        Number of synthetic images. If None, use one per
+        combination of SIZES and FORMATS.
+    max_workers : int
+        Number of threads or processes in the parallel modes.
+    seed : int
+        Seed for the synthetic images.
+    output_path : str, Path or None
+        If provided, save the report to this JSON file.
+    verbose : bool
+        Whether to print the throughput of each run.
+
+    Returns
+    -------
+    report : dict
+        The environment ('meta') and the report of each run ('runs').
+    """
+    meta = {'date': datetime.today().strftime('%Y-%m-%d %H:%M:%S'), 'python': sys.version.split()[0],
+            'pillow': PIL.__version__, 'platform': platform.platform(), 'seed': seed}
+    runs = []
+
+    with TemporaryDirectory() as folder:
+        filenames = generate_images(folder, n_images, seed)
+        server, base_url = serve_folder(folder)
+        try:
+            urls = [base_url + f for f in filenames]
+            for gbf in grayband_factors:
+                for mode in modes:
+                    run = run_mode(mode, urls, gbf, max_workers)
+                    runs.append(run)
+                    if verbose == True:
+                        print(f"{mode:>8} gbf={gbf}: {run['images_per_second']:.1f} images/s ({run['wall_time']:.2f}s)")
+        finally:
+            server.shutdown()
+
+    report = {'meta': meta, 'runs': runs}
+    if output_path != None:
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the image standardization pipeline with synthetic images.')
+    parser.add_argument('--modes', nargs='+', default=['serial', 'thread', 'process'], help='Execution modes.')
+    parser.add_argument('--grayband-factors', nargs='+', type=float, default=[1, 1.2, 1.5], help='Values of grayband_factor.')
+    parser.add_argument('--n-images', type=int, default=None, help='Number of synthetic images.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of threads or processes.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the synthetic images.')
+    parser.add_argument('--output', default='bench_images.json', help='JSON file where to save the report.')
+    args = parser.parse_args()
+
+    run_benchmark(args.modes, args.grayband_factors, args.n_images, args.workers, args.seed, args.output, verbose=True)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks and timing of the link-rot checker against a local stub server
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import linkrot as lr
+
+
+# Paths served by the stub and the statuses expected from the checker:
+EXPECTED = {'/ok': 200, '/gone': 404, '/no-head': 200, '/redirect': 200, '/error': 500, '/slow': 200}
+SLOW_SECONDS = 0.2
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answer requests according to their path (see EXPECTED) and
+    record, per host, when requests start and how many are in
+    flight (in the server's `stats`).
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, with_body: bool):
+        stats, host = self.server.stats, self.headers['Host'].split(':')[0]
+        with stats['lock']:
+            stats['starts'][host].append(time.monotonic())
+            stats['in_flight'][host] += 1
+            stats['max_in_flight'][host] = max(stats['max_in_flight'][host], stats['in_flight'][host])
+        try:
+            path = self.path.split('?')[0]
+            if path == '/slow':
+                time.sleep(SLOW_SECONDS)
+            if path == '/no-head' and self.command == 'HEAD':
+                status = 405
+            elif path == '/redirect':
+                status = 301
+            else:
+                status = EXPECTED.get(path, 404)
+            self.send_response(status)
+            if status == 301:
+                self.send_header('Location', '/ok')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            if with_body == True:
+                self.wfile.write(b'ok')
+        finally:
+            with stats['lock']:
+                stats['in_flight'][host] -= 1
+
+    def do_HEAD(self):
+        self.respond(False)
+
+    def do_GET(self):
+        self.respond(True)
+
+
+def serve_stub():
+    """
+    Start the stub server in a background thread. Returns the server
+    (with its `stats`) and its port.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.stats = {'lock': threading.Lock(), 'starts': defaultdict(list), 'in_flight': defaultdict(int),
+                    'max_in_flight': defaultdict(int)}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def run_checks(n_slow=40, per_host=2, delay=0.05) -> dict:
+    """
+    Check the link checker against the stub server, served under two
+    host names ('127.0.0.1' and 'localhost'), and time it on `n_slow`
+    (int) slow URLs.
+
+    Returns
+    -------
+    report : dict
+        Results of the checks and the timings.
+    """
+    server, port = serve_stub()
+    hosts = ['127.0.0.1', 'localhost']
+    try:
+        # Statuses (including HEAD fallback and redirects):
+        urls = [f'http://{h}:{port}{p}' for h in hosts for p in EXPECTED]
+        results = asyncio.run(lr.check_urls(urls, per_host=per_host, delay=delay, timeout=5))
+        for r in results:
+            expected = EXPECTED[r['url'].split(str(port))[1]]
+            assert r['status'] == expected, f"{r['url']}: got {r['status']} ({r['error']}), expected {expected}."
+            assert r['ok'] == (expected < 400)
+
+        # Politeness (slow URLs, unique per request):
+        for h in hosts:
+            server.stats['starts'][h].clear()
+            server.stats['max_in_flight'][h] = 0
+        slow = [f'http://{hosts[i % 2]}:{port}/slow?n={i}' for i in range(n_slow)]
+        t0 = time.perf_counter()
+        asyncio.run(lr.check_urls(slow, per_host=per_host, delay=delay, timeout=10))
+        t_async = time.perf_counter() - t0
+        max_in_flight = dict(server.stats['max_in_flight'])
+        min_gap = min(b - a for h in hosts for a, b in zip(sorted(server.stats['starts'][h]), sorted(server.stats['starts'][h])[1:]))
+        assert max(max_in_flight.values()) <= per_host, f'Per-host limit exceeded: {max_in_flight}.'
+        assert min_gap >= delay * 0.9, f'Requests to the same host {min_gap:.3f}s apart (delay is {delay}s).'
+
+        # History, stale ordering and broken usecases:
+        with TemporaryDirectory() as folder:
+            db_path = str(Path(folder) / 'linkrot.sqlite')
+            usecases = [{'hash_id': 1, 'url': f'http://127.0.0.1:{port}/ok', 'url_source': 'https://',
+                         'datasets': [{'data_url': f'http://localhost:{port}/gone'}]},
+                        {'hash_id': 2, 'url': f'http://127.0.0.1:{port}/error', 'url_source': None, 'datasets': []}]
+            first = lr.run_checks(usecases, db_path, max_age_days=0, delay=delay)
+            assert lr.broken_usecases(usecases, db_path, min_failures=2) == dict(), 'One failure is not enough.'
+            skipped = lr.run_checks(usecases, db_path, max_age_days=1, delay=delay)
+            assert skipped['n_checked'] == 0, 'Recently checked URLs should be skipped.'
+            lr.run_checks(usecases, db_path, max_age_days=0, delay=delay)
+            broken = lr.broken_usecases(usecases, db_path, min_failures=2)
+            assert {k: [b['field'] for b in v] for k, v in broken.items()} == {1: ['data_url'], 2: ['url']}, broken
+            con = lr.connect(db_path)
+            order = lr.stale_first(['http://never.checked/'] + list(lr.collect_links(usecases)), lr.last_checked(con), 0)
+            assert order[0] == 'http://never.checked/', 'URLs never checked should come first.'
+            assert len(lr.url_history(con, usecases[0]['url'])) == 2
+            con.close()
+    finally:
+        server.shutdown()
+
+    # Lower bound of the time of a serial check (one request at a time):
+    t_serial = n_slow * SLOW_SECONDS
+    return {'status_checks': len(results), 'first_run': first, 'n_slow': n_slow, 'per_host': per_host, 'delay': delay,
+            'max_in_flight_per_host': max_in_flight, 'min_gap_same_host': min_gap, 't_async': t_async,
+            't_serial_lower_bound': t_serial, 'speedup': t_serial / t_async}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the link-rot checker against a local stub server.')
+    parser.add_argument('--n-slow', type=int, default=40, help='Number of slow URLs to time.')
+    parser.add_argument('--per-host', type=int, default=2, help='Maximum requests in flight per host.')
+    parser.add_argument('--delay', type=float, default=0.05, help='Seconds between requests to the same host.')
+    args = parser.parse_args()
+
+    print(json.dumps(run_checks(args.n_slow, args.per_host, args.delay), indent=1))
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compact in-memory representation of CORDATA's usecases
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import sys
+
+import vocabulary as voc
+
+
+# How each field is stored:
+# - 'code':    a term from a list of options, stored as its position (int);
+# - 'codes':   a list of terms from a list of options, stored as bytes (one code per term, in order);
+# - 'derived': the translation of a 'codes' field, stored as True when it matches the vocabulary;
+# - 'text':    a string, interned;
+# - 'list':    a list of strings or scalars, stored as a tuple (strings interned);
+# - 'records': a list of datasets, stored as a tuple of `CompactDataset`;
+# - 'value':   a scalar (int, bool or None), stored as is.
+# Values that do not fit their kind (e.g. terms not in the options) are kept as they are.
+USECASE_KINDS = {'hash_id': 'value', 'name': 'text', 'url': 'text', 'url_archive': 'text', 'description': 'text',
+                 'pub_date': 'text', 'authors': 'list', 'authors_id': 'list', 'geo_level': 'code', 'countries': 'codes',
+                 'fed_units': 'codes', 'municipalities': 'list', 'email': 'list', 'type': 'codes', 'topics': 'codes',
+                 'tags': 'list', 'url_source': 'text', 'url_image': 'text', 'comment': 'text', 'datasets': 'records',
+                 'record_date': 'text', 'modified_date': 'text', 'status_published': 'value', 'status_review': 'value',
+                 'type_es': 'derived', 'topics_es': 'derived', 'countries_es': 'derived'}
+DATASET_KINDS = {'data_name': 'text', 'data_institution': 'text', 'data_url': 'text', 'data_license': 'code',
+                 'data_format': 'codes', 'data_periodical': 'value', 'data_institution_id': 'value'}
+
+
+class CompactRecord:
+    """
+    Base class of the compact records: besides the fields (slots),
+    each record keeps the order of the keys of the original dict
+    ('_keys', a tuple shared by all records with the same order)
+    and the values that could not be compacted ('_raw', a dict or
+    None).
+    """
+    __slots__ = ('_keys', '_raw')
+
+
+class CompactUsecase(CompactRecord):
+    """
+    A usecase with controlled-vocabulary fields stored as codes and
+    free text interned (see USECASE_KINDS).
+    """
+    __slots__ = tuple(USECASE_KINDS)
+
+
+class CompactDataset(CompactRecord):
+    """
+    A dataset used by a usecase, stored like `CompactUsecase` (see
+    DATASET_KINDS).
+    """
+    __slots__ = tuple(DATASET_KINDS)
+
+
+class Codec:
+    """
+    Lossless conversion between usecases as JSON dicts and the
+    compact records.
+    """
+    def __init__(self, options: dict, vocabularies: dict, lang='es', translated_fields=voc.TRANSLATED_FIELDS):
+        """
+        Parameters
+        ----------
+        options : dict
+            Map from each 'code' or 'codes' field (str) to its list
+            of options. The codes of 'codes' fields are stored as
+            bytes when there are at most 256 options.
+        vocabularies : dict
+            Map from the translated fields (e.g. 'topics') to their
+            compiled `vocabulary.Vocabulary`, used for the 'derived'
+            fields.
+        lang : str
+            Language of the 'derived' fields.
+        translated_fields : dict
+            Map from field with controlled terms to the field with
+            their translations.
+        """
+        self.options = {f: list(o) for f, o in options.items()}
+        self.codes = {f: {t: i for i, t in enumerate(o)} for f, o in self.options.items()}
+        self.vocabularies = vocabularies
+        self.lang = lang
+        self.source_field = {t: s for s, t in translated_fields.items()}
+        self.key_orders = dict()
+
+    @classmethod
+    def from_vocabularies(cls, vocabularies: dict, options: dict, lang='es'):
+        """
+        Create a codec whose 'type', 'topics' and 'countries' codes are
+        those of the `vocabularies` (dict), plus other `options` (dict
+        from field to list of terms).
+        """
+        all_options = {f: v.terms for f, v in vocabularies.items()}
+        all_options.update(options)
+        return cls(all_options, vocabularies, lang)
+
+    def shared_keys(self, keys) -> tuple:
+        """
+        Return a tuple of `keys` shared by all records with the same
+        keys in the same order.
+        """
+        keys = tuple(keys)
+        return self.key_orders.setdefault(keys, keys)
+
+    def pack(self, field: str, kind: str, value, record: dict):
+        """
+        Compact the `value` of `field` (str) of `kind` (str) in the
+        dict `record`. Return a tuple: whether it could be compacted
+        and the compact value.
+        """
+        if value is None or kind == 'value':
+            return not isinstance(value, (list, dict, str)), value
+        if kind == 'text':
+            return isinstance(value, str), sys.intern(value) if isinstance(value, str) else value
+        if kind == 'code':
+            return isinstance(value, str) and value in self.codes[field], self.codes[field].get(value)
+        if kind == 'codes':
+            codes = self.codes[field]
+            if isinstance(value, list) and all(isinstance(t, str) and t in codes for t in value):
+                packed = [codes[t] for t in value]
+                return True, bytes(packed) if len(codes) <= 256 else tuple(packed)
+            return False, None
+        if kind == 'derived':
+            source = record.get(self.source_field[field], None)
+            derived = isinstance(source, list) and isinstance(value, list) and len(source) == len(value)
+            if derived == True:
+                try:
+                    derived = self.vocabularies[self.source_field[field]].translate(source, self.lang) == value
+                except KeyError:
+                    derived = False
+            return derived, True
+        if kind == 'list':
+            if isinstance(value, list) and all(not isinstance(v, (list, dict)) for v in value):
+                return True, tuple(sys.intern(v) if isinstance(v, str) else v for v in value)
+            return False, None
+        if kind == 'records':
+            if isinstance(value, list) and all(isinstance(v, dict) for v in value):
+                return True, tuple(self.encode(v, CompactDataset, DATASET_KINDS) for v in value)
+            return False, None
+        raise ValueError(f"Unknown field kind '{kind}'.")
+
+    def unpack(self, field: str, kind: str, value, record: dict):
+        """
+        Return the JSON value of `field` (str) of `kind` (str), stored
+        as `value` in the compact `record`.
+        """
+        if value is None or kind in {'value', 'text'}:
+            return value
+        if kind == 'code':
+            return self.options[field][value]
+        if kind == 'codes':
+            return [self.options[field][c] for c in value]
+        if kind == 'derived':
+            source = self.source_field[field]
+            terms = self.unpack(source, 'codes', getattr(record, source), record)
+            return self.vocabularies[source].translate(terms, self.lang)
+        if kind == 'list':
+            return list(value)
+        if kind == 'records':
+            return [self.decode(v, DATASET_KINDS) for v in value]
+        raise ValueError(f"Unknown field kind '{kind}'.")
+
+    def encode(self, record: dict, cls=CompactUsecase, kinds=USECASE_KINDS) -> CompactRecord:
+        """
+        Convert a usecase (or, with `cls` and `kinds`, a dataset) from
+        a JSON dict `record` to a compact record.
+        """
+        compact = cls()
+        compact._keys = self.shared_keys(record.keys())
+        raw = dict()
+        for field, value in record.items():
+            if field not in kinds:
+                raw[field] = value
+                continue
+            ok, packed = self.pack(field, kinds[field], value, record)
+            if ok == True:
+                setattr(compact, field, packed)
+            else:
+                raw[field] = value
+        compact._raw = raw if len(raw) > 0 else None
+        return compact
+
+    def decode(self, compact: CompactRecord, kinds=USECASE_KINDS) -> dict:
+        """
+        Convert a `compact` record back to the JSON dict it came from
+        (same keys, key order and values).
+        """
+        raw = compact._raw if compact._raw != None else dict()
+        record = dict()
+        for field in compact._keys:
+            if field in raw:
+                record[field] = raw[field]
+            else:
+                record[field] = self.unpack(field, kinds[field], getattr(compact, field), compact)
+        return record
+
+
+class CompactCatalog:
+    """
+    A catalog of usecases (the 'data' in CORDATA's JSON) held as
+    compact records, with its metadata.
+    """
+    def __init__(self, codec: Codec, usecases=[], metadata=None):
+        """
+        Parameters
+        ----------
+        codec : Codec
+            Converter between JSON dicts and compact records.
+        usecases : list of dicts
+            The usecases to store.
+        metadata : dict or None
+            The catalog's metadata (e.g. last update).
+        """
+        self.codec = codec
+        self.metadata = metadata
+        self.records = [codec.encode(uc) for uc in usecases]
+
+    @classmethod
+    def from_json_data(cls, data: dict, codec: Codec):
+        """
+        Create a catalog from CORDATA's `data` (dict with 'metadata'
+        and 'data').
+        """
+        return cls(codec, data['data'], data.get('metadata'))
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, i) -> dict:
+        return self.codec.decode(self.records[i])
+
+    def __iter__(self):
+        return (self.codec.decode(r) for r in self.records)
+
+    def append(self, usecase: dict):
+        """
+        Add a `usecase` (dict) to the catalog.
+        """
+        self.records.append(self.codec.encode(usecase))
+
+    def to_json_data(self) -> dict:
+        """
+        Return the catalog as CORDATA's data (dict with 'metadata'
+        and 'data'), identical to the one it was created from.
+        """
+        return {'metadata': self.metadata, 'data': list(self)}
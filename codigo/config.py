@@ -31,6 +31,15 @@ ENTRY_MODEL = "data/entry_model.json"
 DATASET_MODEL = "data/dataset_model.json"
 DSPACE_DIR = "data/dspaces/"
 DSPACE_INDEX_FILE = "dspace_index.csv"
+DSPACE_CATALOG_FILE = "dspace_catalog.csv"
+DSPACE_CATALOG_SOURCES = "dspace_catalog_sources.json"
+DSPACE_SEARCH_FIELDS = ['titulo', 'resumo', 'palavras_chave']
+DSPACE_PAGE_SIZE = 50
+TRANSLATIONS_FILE = "data/translations.csv"
+INSTITUTIONS_INDEX = "data/institutions_index.json"
+INSTITUTION_MIN_CONFIDENCE = 0.85
+LINKROT_DB = "data/linkrot.sqlite"
+LINKROT_MIN_FAILURES = 2
 
 # Lists for controlled vocabularies
 TYPE_OPTIONS = [
@@ -21,9 +21,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import streamlit as st
+from pathlib import Path
 
 import config as cf
 import auxiliar as aux
+import linkrot as lr
 
 
 def status_selected(usecase: dict, status_filter: dict) -> bool:
@@ -82,6 +84,46 @@ def status_selectors() -> dict:
     return status_filter
     
 
+@st.cache_data
+def load_broken_urls(db_path: str, mtime: float) -> dict:
+    """
+    Load the URLs found broken by the link checker (see 
+    `linkrot.py`) from the database at `db_path` (str). 
+    `mtime` (float) is the modification time of the file,
+    only used for invalidating the cache when it changes.
+    """
+    con = lr.connect(db_path)
+    broken = lr.broken_urls(con, cf.LINKROT_MIN_FAILURES)
+    con.close()
+    return broken
+
+
+def broken_link_selector() -> set:
+    """
+    Create a checkbox filter for usecases with broken links.
+    Return the broken URLs (set of str) if the filter is on,
+    or None if it is off (or if links were never checked).
+    """
+    db_path = Path(cf.LINKROT_DB)
+    if db_path.exists() == False:
+        return None
+    broken = load_broken_urls(str(db_path), db_path.stat().st_mtime)
+    if st.sidebar.checkbox(f'Apenas com links quebrados ({len(broken)} links)', value=False) == True:
+        return set(broken.keys())
+    return None
+
+
+def has_broken_link(usecase: dict, broken: set) -> bool:
+    """
+    Return whether `usecase` (dict) has a link in the set 
+    of `broken` URLs, or True if `broken` is None (i.e. no
+    filtering).
+    """
+    if broken == None:
+        return True
+    return len(broken.intersection(lr.collect_links([usecase]).keys())) > 0
+
+
 def usecase_picker(usecases: list, data: dict) -> int:
     """
     Create the dropdown selector used to pick a usecase
@@ -122,17 +164,19 @@ def usecase_selector(data: dict)-> int:
     
     # Display statuses selectors for usecases and get selected statuses:
     status_filter = status_selectors()
+    broken = broken_link_selector()
+    selected = lambda uc: status_selected(uc, status_filter) and has_broken_link(uc, broken)
 
     # Check if status selector will drop current usecase:
     usecases = data["data"]
     if st.session_state['usecase_selectbox'] != None:
          uc = aux.select_usecase_by_id(data, st.session_state['usecase_selectbox'])
-         if status_selected(uc, status_filter) == False:
+         if selected(uc) == False:
              # Set id_init to None.
              st.session_state['usecase_selectbox'] = None
 
-    # Filter usecases based on statuses:
-    sel_usecases = list(filter(lambda uc: status_selected(uc, status_filter), usecases))
+    # Filter usecases based on statuses and broken links:
+    sel_usecases = list(filter(selected, usecases))
 
     # Select usecase:
     hash_id = usecase_picker(sel_usecases, data)
@@ -20,7 +20,6 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import requests
 import json
 import streamlit as st
 from pathlib import Path
@@ -28,9 +27,14 @@ from datetime import datetime
 from copy import deepcopy
 import csv
 import re
+import unicodedata
+from collections import defaultdict
 
 import config as cf
 import auxiliar as aux
+import webclient as web
+import institutions as ins
+import vocabulary as voc
 
 
 ###############################################
@@ -86,35 +90,65 @@ def std_data(data: dict):
                 uc[k] = 'https://'
 
 
+@st.cache_resource
+def load_institution_index(path: str, mtime: float) -> ins.InstitutionIndex:
+    """
+    Load the index of institutions' names to CGU IDs saved 
+    at `path` (str), once per process. `mtime` (float) is the 
+    modification time of the file, only used for invalidating 
+    the cache when the file changes (use 0 if it is missing).
+    """
+    aux.log(f'Loading institution index from {path}')
+    return ins.InstitutionIndex.load(path)
+
+
+@st.cache_resource
+def load_vocabularies(path: str, mtime: float) -> dict:
+    """
+    Compile the controlled vocabularies (types, topics and 
+    countries) with their translations from the CSV file at 
+    `path` (str), once per process. It fails if a term in the 
+    options lacks a translation. `mtime` (float) is the 
+    modification time of the file, only used for invalidating 
+    the cache when the file changes.
+    """
+    aux.log(f'Compiling vocabularies from {path}')
+    options = {'type': cf.TYPE_OPTIONS, 'topics': cf.TOPIC_OPTIONS, 'countries': cf.COUNTRY_OPTIONS}
+    return voc.compile_vocabularies(options, path)
+
+
 def make_derived_data(data: dict):
     """
     Compute data fields given others, in place:
     - Translate type, topics and countries;
-    - Assign author IDs for CGU (FAKE FOR NOW!)
+    - Assign CGU IDs to authors and to datasets' institutions
+      (names only matched by similarity or by an ambiguous acronym
+      are logged for review).
     """
-    # Hard-coded:
-    fields2translate = [('type', 'type_es'), ('topics', 'topics_es'), ('countries', 'countries_es')]
-    translate = aux.load_translations()
+    usecases = data['data']
+
+    # Translate all usecases at once:
+    vocabularies = load_vocabularies(cf.TRANSLATIONS_FILE, Path(cf.TRANSLATIONS_FILE).stat().st_mtime)
+    voc.translate_usecases(usecases, vocabularies)
+
+    # Look up all institution names at once:
+    index_path = Path(cf.INSTITUTIONS_INDEX)
+    index = load_institution_index(str(index_path), index_path.stat().st_mtime if index_path.exists() else 0)
+    names = [a for uc in usecases for a in aux.fillnone(uc['authors'], [])]
+    names += [ds['data_institution'] for uc in usecases for ds in uc['datasets']]
+    name2id = index.resolve(names, cf.INSTITUTION_MIN_CONFIDENCE)
+    for name, match in name2id.review.items():
+        aux.log(f'Institution "{name}" without ID ({match["method"]} match to review: "{match["name"]}", {match.get("similarity", match["confidence"]):.2f})')
 
     # Loop over usecases:
-    usecases = data['data']
     for uc in usecases:
-        # Translate (loop over fields requiring translation):
-        for ptbr, es in fields2translate:
-            if uc[ptbr] != None:
-                # Loop over items in list:
-                translations = []
-                for entry in uc[ptbr]:
-                    translations.append(translate[entry])
-                # Assign translations to key:
-                uc[es] = translations
-            else:
-                uc[es] = None
-        # Lookup author IDs from CGU compatibility (FAKE FOR NOW!):
+        # Lookup author and dataset institution IDs from CGU compatibility:
         if uc['authors'] != None:
-            uc['authors_id'] = [None] * len(uc['authors'])
+            uc['authors_id'] = [name2id[a] for a in uc['authors']]
         else:
             uc['authors_id'] = None
+        for ds in uc['datasets']:
+            ds['data_institution_id'] = name2id[ds['data_institution']]
 
 
 def today() -> str:
@@ -172,7 +206,7 @@ def get_json(url: str) -> dict:
     Download CORDATA data from an `url` (str) address pointing to a 
     JSON file.
     """
-    response = requests.get(url)
+    response = web.get(url)
     status = response.status_code
     if status == 200:
         content = response.content.decode()
@@ -395,6 +429,90 @@ def use_public_data(row, key='y_pred'):
         return True
     return False
 
+
+def tokenize(text: str) -> list:
+    """
+    Split `text` (str) into lower-case word tokens 
+    without accents, used for searching academic works.
+
+    Example input:  'Análise de dados: o SUS'
+    Example output: ['analise', 'de', 'dados', 'o', 'sus']
+    """
+    # Remove accents:
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join([c for c in text if not unicodedata.combining(c)])
+    # Split words:
+    return re.findall(r'\w+', text)
+
+
+@st.cache_resource
+def load_dspace_index(filename: str, mtime: float) -> dict:
+    """
+    Load a Dspace CSV file and build a token index 
+    over its text fields.
+
+    Parameters
+    ----------
+    filename : str
+        Path to the CSV file.
+    mtime : float
+        Modification time of the file, only used for
+        invalidating the cache when the file changes.
+
+    Returns
+    -------
+    dspace_index : dict
+        Under 'records', the rows in the CSV file (list of 
+        dicts), so the row ID is its position in the list.
+        Under 'tokens', a dict from each token found in the 
+        fields `cf.DSPACE_SEARCH_FIELDS` to the set of IDs
+        of the rows containing it.
+    """
+    aux.log(f'Building Dspace index for {filename}')
+    records = read_csv_into_records(filename)
+    
+    # Map tokens to row IDs:
+    tokens = defaultdict(set)
+    for row_id, row in enumerate(records):
+        text = ' '.join([aux.fillnone(row.get(k), '') for k in cf.DSPACE_SEARCH_FIELDS])
+        for t in set(tokenize(text)):
+            tokens[t].add(row_id)
+    
+    return {'records': records, 'tokens': dict(tokens)}
+
+
+def search_dspace_index(dspace_index: dict, query: str, filter_func=None) -> list:
+    """
+    Return the IDs (list of int, in file order) of the rows in 
+    `dspace_index` (dict, see `load_dspace_index`) containing 
+    all words in `query` (str) and for which `filter_func` 
+    (callable on a row) returns True. An empty query selects
+    all rows.
+    """
+    
+    # If no filtering is provided, return all rows:
+    if filter_func == None:
+        filter_func = (lambda x: True)
+    records = dspace_index['records']
+    
+    # Intersect the rows containing each word:
+    query_tokens = tokenize(query)
+    if len(query_tokens) > 0:
+        row_ids = set.intersection(*[dspace_index['tokens'].get(t, set()) for t in query_tokens])
+        row_ids = sorted(row_ids)
+    else:
+        row_ids = range(len(records))
+    
+    return [i for i in row_ids if filter_func(records[i])]
+
+
+def reset_dspace_page():
+    """
+    Go back to the first page of academic works 
+    (used when the search changes).
+    """
+    st.session_state['dspace_page'] = 1
+
     
 def normalize_name(name: str) -> str:
     """
@@ -691,27 +809,48 @@ def collect_usecase_info(record, usecase_data_model):
 def load_from_dspace():
     """
     Opens dialog that lists academic works in CSV databases
-    extracted from DSpace. The user can load some metadata 
-    about the work in the appropriate format. 
+    extracted from DSpace. The user can search the works, 
+    browse them page by page and load some metadata about 
+    the work in the appropriate format. 
     """
     
     # List Dspace datasets:
     dspace_index = read_csv_into_records(Path(cf.DSPACE_DIR) / Path(cf.DSPACE_INDEX_FILE))
     dspace_dict   = aux.to_dict(dspace_index, 'filename', 'label')
+    # Federated catalog of all Dspaces (see dspaces.py):
+    if (Path(cf.DSPACE_DIR) / Path(cf.DSPACE_CATALOG_FILE)).exists():
+        dspace_dict[cf.DSPACE_CATALOG_FILE] = 'Catálogo unificado (todas as fontes)'
     dspace_file   = st.selectbox(label='Selecione a fonte de trabalhos acadêmicos:', options=dspace_dict.keys(), 
-                                index=None, key='dspace_selector', format_func=(lambda x: dspace_dict[x])) 
+                                index=None, key='dspace_selector', format_func=(lambda x: dspace_dict[x]),
+                                on_change=reset_dspace_page) 
     if dspace_file != None:
-        # List academic works in the selected Dspace dataset:
-        current_ucs = aux.extract(st.session_state['data']['data'], 'url')
-        dspace_data = read_csv_into_records(Path(cf.DSPACE_DIR) / Path(dspace_file), 
-                                            lambda row: (normalize_url(row['uri']) not in current_ucs) and use_public_data(row))
-        titles = aux.extract(dspace_data, 'titulo')
-        title = st.selectbox(label='Selecione o trabalho acadêmico:', options=titles, index=None, key='academic_work_selector')
+        # Load the selected Dspace dataset and its search index:
+        dspace_path = Path(cf.DSPACE_DIR) / Path(dspace_file)
+        work_index  = load_dspace_index(str(dspace_path), dspace_path.stat().st_mtime)
+        records     = work_index['records']
         
-        if title != None:
+        # Search academic works not yet in the catalog:
+        current_ucs = set(aux.extract(st.session_state['data']['data'], 'url'))
+        query = st.text_input(label='Buscar por título, resumo ou palavras-chave:', key='dspace_query', on_change=reset_dspace_page)
+        row_ids = search_dspace_index(work_index, query, 
+                                      lambda row: (normalize_url(row['uri']) not in current_ucs) and use_public_data(row))
+        
+        # Select page of results:
+        n_pages = max(1, -(-len(row_ids) // cf.DSPACE_PAGE_SIZE))
+        if 'dspace_page' not in st.session_state or st.session_state['dspace_page'] > n_pages:
+            reset_dspace_page()
+        page = st.number_input(label=f'Página (de {n_pages}, com {len(row_ids)} trabalhos):', min_value=1, max_value=n_pages, 
+                               step=1, key='dspace_page')
+        page_ids = row_ids[(page - 1) * cf.DSPACE_PAGE_SIZE: page * cf.DSPACE_PAGE_SIZE]
+        
+        # Select academic work by its row ID:
+        row_id = st.selectbox(label='Selecione o trabalho acadêmico:', options=page_ids, index=None, key='academic_work_selector',
+                              format_func=(lambda i: records[i]['titulo']))
+        
+        if row_id != None:
             if st.button('➕ Carregar como caso de uso'):        
                 # Parse data from the selected academic work:
-                work_data = aux.select(dspace_data, 'titulo', title)[0]
+                work_data = records[row_id]
                 work_prep = collect_usecase_info(work_data, st.session_state['uc_defaults'])
                 
                 # Insert in dataset:
@@ -720,7 +859,3 @@ def load_from_dspace():
                 # Set to show it:
                 st.session_state['usecase_selectbox'] = work_prep['hash_id']
                 st.rerun()
-
-            
-
-
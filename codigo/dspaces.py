@@ -0,0 +1,369 @@
+# Federated catalog of academic works from Dspace databases.
+# -*- coding: utf-8 -*-
+
+"""
+CORDATA EDITOR (Content Management System)
+Copyright (C) 2025 Henrique Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import csv
+import re
+import hashlib
+from pathlib import Path
+
+import config as cf
+import auxiliar as aux
+import dataops as io
+
+
+# Columns added by the catalog to the ones in the Dspace dumps:
+CATALOG_COLS = ['catalog_id', 'uri_canonica', 'titulo_normalizado', 'fontes', 'y_pred_fontes']
+# Separator for multiple values in a catalog cell:
+SEP = ';'
+
+
+##############################
+### Keys for deduplication ###
+##############################
+
+def canonical_uri(uri: str) -> str:
+    """
+    Build a canonical form of an academic work's URI, so the
+    same work listed in different Dspaces gets the same URI.
+    Handle URIs (e.g. 'http://hdl.handle.net/123/456' and
+    'https://repositorio.x.br/handle/123/456') become
+    'hdl:123/456'. Other URIs are put in HTTPS, with lower-case
+    host and no trailing slash.
+    """
+    uri = uri.strip()
+    if uri == '':
+        return None
+
+    # Handle system:
+    handle = re.search(r'(?:hdl\.handle\.net/|/handle/)(\d+(?:\.\d+)*/\d+)', uri)
+    if handle != None:
+        return 'hdl:' + handle.group(1)
+
+    # Generic URL:
+    uri = io.normalize_url(uri).rstrip('/')
+    parts = uri.split('/', 3)
+    if len(parts) >= 3:
+        parts[2] = parts[2].lower()
+    return '/'.join(parts)
+
+
+def title_key(title: str) -> str:
+    """
+    Build a normalized version of an academic work's title
+    (lower-case, without accents and punctuation) used to
+    find duplicates.
+    """
+    if title.strip() == '':
+        return None
+    return ' '.join(io.tokenize(title))
+
+
+def file_hash(path) -> str:
+    """
+    Return the SHA-256 hex digest of the file at `path`
+    (str or Path).
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+###########################
+### Catalog persistence ###
+###########################
+
+def load_catalog(catalog_dir=cf.DSPACE_DIR) -> tuple:
+    """
+    Load the federated catalog of academic works and the
+    list of Dspace dumps already merged into it.
+
+    Returns
+    -------
+    records : list of dicts
+        Catalog rows (all values as str).
+    sources : dict
+        Merged dump filenames mapped to their SHA-256 hash,
+        number of rows and merge date.
+    """
+    catalog_path = Path(catalog_dir) / Path(cf.DSPACE_CATALOG_FILE)
+    sources_path = Path(catalog_dir) / Path(cf.DSPACE_CATALOG_SOURCES)
+
+    if catalog_path.exists() == False:
+        return [], {}
+
+    records = io.read_csv_into_records(catalog_path)
+    sources = io.load_data(sources_path)
+    return records, sources
+
+
+def save_catalog(records: list, sources: dict, catalog_dir=cf.DSPACE_DIR):
+    """
+    Save the catalog `records` (list of dicts) as CSV and its
+    merged `sources` (dict) as JSON in `catalog_dir` (str).
+    """
+    catalog_path = Path(catalog_dir) / Path(cf.DSPACE_CATALOG_FILE)
+    sources_path = Path(catalog_dir) / Path(cf.DSPACE_CATALOG_SOURCES)
+
+    # Union of columns, keeping the order of appearance:
+    columns = aux.unique_preserve_order(CATALOG_COLS + [k for r in records for k in r.keys()])
+
+    with open(catalog_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, restval='')
+        writer.writeheader()
+        writer.writerows(records)
+    with open(sources_path, 'w') as f:
+        json.dump(sources, f, indent=1, ensure_ascii=False)
+    aux.log(f'Saved Dspace catalog ({len(records)} works) to {catalog_path}')
+
+
+#######################
+### Catalog merging ###
+#######################
+
+def parse_pred(value: str) -> int:
+    """
+    Return the prediction of public data usage in `value` (str,
+    e.g. '1' or '0.0') as an int, or None if it is empty or not
+    a number (e.g. 'nan').
+    """
+    try:
+        pred = float(value)
+    except (TypeError, ValueError):
+        return None
+    if pred != pred:
+        return None
+    return int(pred)
+
+
+def combine_preds(y_pred_fontes: str) -> str:
+    """
+    Combine the predictions of each source (str joined by SEP):
+    a work is considered to use public data if any source says so.
+    Returns '' if no source has a valid prediction.
+    """
+    preds = [parse_pred(p) for p in y_pred_fontes.split(SEP)]
+    preds = [p for p in preds if p != None]
+    return str(max(preds)) if len(preds) > 0 else ''
+
+
+def remove_source(records: list, source: str) -> int:
+    """
+    Remove, in place, the dump `source` (str) from the provenance
+    and predictions of the catalog `records` (list of dicts), so
+    it can be merged again. Works that only came from `source` are
+    dropped. Returns the number of works dropped.
+    """
+    kept = []
+    for entry in records:
+        fontes = entry['fontes'].split(SEP)
+        if source in fontes:
+            preds = entry['y_pred_fontes'].split(SEP)
+            preds += [''] * (len(fontes) - len(preds))
+            remaining = [(f, p) for f, p in zip(fontes, preds) if f != source]
+            if len(remaining) == 0:
+                continue
+            entry['fontes'] = SEP.join(f for f, p in remaining)
+            entry['y_pred_fontes'] = SEP.join(p for f, p in remaining)
+            entry['y_pred'] = combine_preds(entry['y_pred_fontes'])
+        kept.append(entry)
+    n_dropped = len(records) - len(kept)
+    records[:] = kept
+    return n_dropped
+
+
+def build_key_index(records: list) -> tuple:
+    """
+    Map canonical URIs and normalized titles of the catalog
+    `records` (list of dicts) to their positions in the list.
+    """
+    by_uri   = dict()
+    by_title = dict()
+    for i, r in enumerate(records):
+        if r['uri_canonica'] != '':
+            by_uri[r['uri_canonica']] = i
+        if r['titulo_normalizado'] != '':
+            by_title[r['titulo_normalizado']] = i
+    return by_uri, by_title
+
+
+def merge_dump(records: list, dump_records: list, source: str) -> int:
+    """
+    Merge the rows from a Dspace dump into the catalog, in place.
+
+    A row is considered the same work as a catalog entry if it
+    shares the canonical URI or the normalized title. In that
+    case, `source` is added to the entry's provenance and the
+    entry's empty fields are filled with the row's values.
+    Otherwise, the row is appended to the catalog.
+
+    If `source` was merged before (e.g. the dump changed), its
+    previous predictions and the works only found in it are
+    removed first (see `remove_source()`), so the catalog
+    reflects the current version of the dump.
+
+    Parameters
+    ----------
+    records : list of dicts
+        The catalog rows, modified in place.
+    dump_records : list of dicts
+        Rows read from the Dspace dump CSV.
+    source : str
+        Filename of the dump, used as provenance.
+
+    Returns
+    -------
+    n_new : int
+        Number of works added to the catalog.
+    """
+    remove_source(records, source)
+    by_uri, by_title = build_key_index(records)
+
+    n_new = 0
+    for row in dump_records:
+        uri_id   = aux.fillnone(canonical_uri(row.get('uri', '')), '')
+        title_id = aux.fillnone(title_key(row.get('titulo', '')), '')
+        y_pred = row.get('y_pred', '')
+
+        # Find the work in the catalog:
+        idx = by_uri.get(uri_id) if uri_id != '' else None
+        if idx == None and title_id != '':
+            idx = by_title.get(title_id)
+
+        # New work:
+        if idx == None:
+            entry = dict(row)
+            entry['catalog_id']   = str(aux.hash_string(uri_id + title_id))
+            entry['uri_canonica'] = uri_id
+            entry['titulo_normalizado'] = title_id
+            entry['fontes'] = source
+            entry['y_pred_fontes'] = y_pred
+            records.append(entry)
+            idx = len(records) - 1
+            n_new += 1
+
+        # Known work:
+        else:
+            entry = records[idx]
+            fontes = entry['fontes'].split(SEP)
+            # Record provenance (only once per source):
+            if source not in fontes:
+                entry['fontes'] = SEP.join(fontes + [source])
+                entry['y_pred_fontes'] = SEP.join(entry['y_pred_fontes'].split(SEP) + [y_pred])
+            # Fill missing information:
+            for k, v in row.items():
+                if entry.get(k, '') == '':
+                    entry[k] = v
+            # Considered to use public data if any classification says so:
+            y_pred = combine_preds(entry['y_pred_fontes'])
+            if y_pred != '':
+                entry['y_pred'] = y_pred
+
+        # Register keys:
+        if uri_id != '':
+            by_uri.setdefault(uri_id, idx)
+        if title_id != '':
+            by_title.setdefault(title_id, idx)
+
+    return n_new
+
+
+def update_catalog(catalog_dir=cf.DSPACE_DIR) -> dict:
+    """
+    Merge into the federated catalog the Dspace dumps listed
+    in the Dspace index that are new or changed since they
+    were last merged. Dumps already merged are not read.
+
+    Returns
+    -------
+    sources : dict
+        The dumps currently merged into the catalog.
+    """
+    records, sources = load_catalog(catalog_dir)
+    dspace_index = io.read_csv_into_records(Path(catalog_dir) / Path(cf.DSPACE_INDEX_FILE))
+
+    updated = False
+    for dump in dspace_index:
+        filename = dump['filename']
+        if filename == cf.DSPACE_CATALOG_FILE:
+            continue
+        path = Path(catalog_dir) / Path(filename)
+        sha  = file_hash(path)
+        # Skip dumps already merged:
+        if sources.get(filename, {}).get('sha256') == sha:
+            continue
+
+        dump_records = io.read_csv_into_records(path)
+        n_new = merge_dump(records, dump_records, filename)
+        sources[filename] = {'sha256': sha, 'n_rows': len(dump_records), 'merged_at': io.today()}
+        aux.log(f'Merged {filename} into Dspace catalog: {n_new} new of {len(dump_records)} works')
+        updated = True
+
+    if updated == True:
+        save_catalog(records, sources, catalog_dir)
+
+    return sources
+
+
+########################
+### Catalog querying ###
+########################
+
+def query_catalog(records: list, publisher=None, year=None, y_pred=None) -> list:
+    """
+    Select works from the catalog `records` (list of dicts).
+
+    Parameters
+    ----------
+    records : list of dicts
+        The catalog rows.
+    publisher : str or None
+        If provided, only select works whose 'publicador'
+        contains this string (ignoring case and accents).
+    year : int, str or None
+        If provided, only select works whose 'data_publicacao'
+        starts with this year.
+    y_pred : int or None
+        If provided, only select works with this prediction
+        of public data usage (1 for using public data, 0 for
+        not using).
+
+    Returns
+    -------
+    selected : list of dicts
+        The selected catalog rows.
+    """
+    selected = records
+    if publisher != None:
+        pub_key = ' '.join(io.tokenize(publisher))
+        selected = [r for r in selected if pub_key in ' '.join(io.tokenize(r.get('publicador', '')))]
+    if year != None:
+        selected = [r for r in selected if r.get('data_publicacao', '').strip()[:4] == str(year)]
+    if y_pred != None:
+        selected = [r for r in selected if parse_pred(r.get('y_pred', '')) == int(y_pred)]
+    return selected
+
+
+if __name__ == '__main__':
+    update_catalog()
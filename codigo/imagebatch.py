@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent preparation of representative images for all usecases in CORDATA.
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import json
+import time
+import threading
+from tempfile import NamedTemporaryFile
+from pathlib import Path
+from urllib.parse import urlparse
+from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import images as im
+import imgcache as ic
+import imgdedup as idd
+import imgoptim as iop
+
+
+class HostLimiter:
+    """
+    Limit the number of simultaneous requests made to each host.
+    """
+    def __init__(self, max_per_host=2):
+        """
+        Parameters
+        ----------
+        max_per_host : int
+            Maximum number of requests to the same host (domain)
+            running at the same time.
+        """
+        self.max_per_host = max_per_host
+        self.semaphores = defaultdict(lambda: threading.BoundedSemaphore(self.max_per_host))
+        self.lock = threading.Lock()
+
+    def slot(self, url):
+        """
+        Return the semaphore associated to the host in `url`
+        (str), to be used in a `with` statement.
+        """
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            return self.semaphores[host]
+
+
+def select_usecases(usecases: list, skip_pattern='raw.githubusercontent.com/cewebbr/cordata/') -> list:
+    """
+    Return the usecases (list of dicts) whose image is not in
+    CORDATA's github (that is, that were not processed already
+    and that are not the default image), nor empty.
+    """
+    selected = [uc for uc in usecases if uc['url_image'] != None and uc['url_image'].find(skip_pattern) == -1
+                and len(uc['url_image']) > len('https://')]
+    return selected
+
+
+def process_usecase_image(uc: dict, outpath, process_pool, limiter, target_height, target_width, grayband_factor, cache=None, variants=False,
+                          phash_index=None, optimize=False, min_ssim=0.98) -> dict:
+    """
+    Download the image of a usecase `uc` (dict) and standardize it
+    in a process pool, saving it to `outpath` (str or Path). If a 
+    `cache` (ImageCache) is provided, the request is conditional 
+    and nothing is done if the source image did not change. If
+    `variants` is True, also save the image's thumbnail, 2x and 
+    WebP/AVIF variants next to `outpath` (see 
+    `images.standardize_image_variants()`). If a `phash_index`
+    (PhashIndex) is provided, images similar to one already stored
+    are not saved: the usecase is linked to the stored image; and
+    if `outpath` is the stored image of other usecases, the new 
+    image is saved under another name (see `PhashIndex.claim()`). If
+    `optimize` is True, the saved PNGs (including the variants) are
+    then recompressed (see `imgoptim.optimize_png()`).
+
+    Returns
+    -------
+    entry : dict
+        Manifest entry for the usecase, with the path to its stored
+        image ('outpath'), the result status ('ok', 'cached', 
+        'duplicate', 'not_image' or 'failed'), the stored image it
+        duplicates (if any), the error message (if
+        any), the number of bytes downloaded, the time spent
+        (in seconds) downloading and processing the image, the
+        saved variants (if requested) and the PNG optimization
+        results, one per saved PNG (if requested).
+    """
+    entry = {'hash_id': uc['hash_id'], 'url': uc['url_image'], 'outpath': str(outpath),
+             'status': None, 'error': None, 'bytes': None, 't_download': None, 't_process': None, 'variants': None,
+             'duplicate_of': None, 'optimization': None}
+    tmpfile = None
+    try:
+        # Download (limiting requests per host):
+        t0 = time.perf_counter()
+        with limiter.slot(uc['url_image']):
+            if cache == None:
+                response = im.http_get(uc['url_image'], stream=True)
+            else:
+                response = ic.fetch_image(uc['url_image'], outpath, cache, stream=True)
+
+            # Source image did not change (it may be stored under another name, e.g. as a duplicate):
+            if response == None:
+                entry['outpath'] = str(cache.stored_path(uc['url_image'], outpath))
+                entry['t_download'] = time.perf_counter() - t0
+                entry['status'] = 'cached'
+                return entry
+
+            # Skip Web pages:
+            content_type = response.headers.get("Content-Type", "")
+            if content_type[:9] == 'text/html':
+                response.close()
+                entry['t_download'] = time.perf_counter() - t0
+                entry['status'] = 'not_image'
+                return entry
+
+            # Stream content to a temporary file (the image is never fully in memory here):
+            with NamedTemporaryFile(suffix='.img', delete=False) as fp:
+                tmpfile = fp.name
+                im.stream_to_file(response, fp)
+                entry['bytes'] = fp.seek(0, os.SEEK_END)
+        entry['t_download'] = time.perf_counter() - t0
+
+        # Standardize in another process (CPU-bound), decoding with bounded memory:
+        t0 = time.perf_counter()
+        if phash_index != None:
+            # Images used by other usecases are never overwritten: save under a new name if needed:
+            savepath = Path(outpath).parent / phash_index.claim(Path(outpath).name, uc['hash_id'], Path(outpath).parent)
+            entry['outpath'] = str(savepath)
+            future = process_pool.submit(idd.standardize_image_from_file_dedup, tmpfile, str(savepath), phash_index.known_hashes(), 
+                                         phash_index.threshold, variants, target_height, target_width, grayband_factor)
+            result = future.result()
+            entry['variants'] = result['variants']
+            entry['duplicate_of'] = result['duplicate_of']
+            # Link to the image already stored or register the new image:
+            if result['duplicate_of'] != None:
+                phash_index.link(result['duplicate_of'], uc['hash_id'])
+                entry['t_process'] = time.perf_counter() - t0
+                entry['status'] = 'duplicate'
+                return entry
+            # A similar image may have been stored after the worker got the known hashes (e.g. in the same batch):
+            canonical = phash_index.add_or_link(result['phash'], savepath.name, uc['hash_id'])
+            if canonical != None:
+                # The files just saved are not used by any other usecase:
+                saved = [v['file'] for v in result['variants']] if variants == True else [savepath.name]
+                for filename in saved:
+                    (savepath.parent / filename).unlink(missing_ok=True)
+                entry['variants'] = None
+                entry['duplicate_of'] = canonical
+                entry['t_process'] = time.perf_counter() - t0
+                entry['status'] = 'duplicate'
+                return entry
+        elif variants == True:
+            future = process_pool.submit(im.standardize_image_variants_from_file, tmpfile, str(Path(outpath).parent),
+                                         Path(outpath).stem, target_height, target_width, grayband_factor)
+            entry['variants'] = future.result()
+        else:
+            future = process_pool.submit(im.standardize_image_from_file, tmpfile, str(outpath),
+                                         target_height, target_width, grayband_factor)
+            future.result()
+
+        # Recompress the saved PNGs (all variants, if any):
+        if optimize == True:
+            if entry['variants'] == None:
+                pngs = [Path(entry['outpath']).name]
+            else:
+                pngs = [v['file'] for v in entry['variants'] if v['format'] == 'PNG']
+            futures = [process_pool.submit(iop.optimize_png, str(Path(outpath).parent / f), min_ssim) for f in pngs]
+            entry['optimization'] = [f.result() for f in futures]
+            if entry['variants'] != None:
+                new_bytes = {o['file']: o['new_bytes'] for o in entry['optimization']}
+                for v in entry['variants']:
+                    v['bytes'] = new_bytes.get(v['file'], v['bytes'])
+        entry['t_process'] = time.perf_counter() - t0
+        entry['status'] = 'ok'
+
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = f'{type(e).__name__}: {e}'
+
+    finally:
+        if tmpfile != None:
+            Path(tmpfile).unlink(missing_ok=True)
+        # Only once the image is stored (or linked to a duplicate) its validators can be used for conditional requests:
+        if cache != None and entry['status'] in {'ok', 'duplicate'}:
+            stored = entry['outpath'] if entry['status'] == 'ok' else Path(outpath).parent / entry['duplicate_of']
+            cache.record(uc['url_image'], response, outpath, uc['hash_id'], 
+                         {'target_height': target_height, 'target_width': target_width, 'grayband_factor': grayband_factor,
+                          'variants': variants, 'dedup': phash_index != None, 'optimize': optimize, 'min_ssim': min_ssim},
+                         stored)
+
+    return entry
+
+
+def batch_etl_images(usecases: list, outfolder='../imagens/', outfile_template='hash_id_%(hash_id)s.png',
+                     url_path='https://raw.githubusercontent.com/cewebbr/cordata/main/imagens/',
+                     skip_pattern='raw.githubusercontent.com/cewebbr/cordata/', manifest_path=None, cache=None,
+                     variants=False, variants_manifest='../imagens/variants.json', phash_index=None,
+                     optimize=False, min_ssim=0.98,
+                     max_downloads=16, max_per_host=2, max_processes=None,
+                     target_height=293, target_width=523, grayband_factor=1, verbose=False) -> dict:
+    """
+    Standardize the images of all usecases that are not in CORDATA's
+    github yet, setting their 'url_image' to the new images (in place).
+    This is the concurrent version of `images.etl_usecase_image()`:
+    downloads run in a pool of threads, with a limit of simultaneous
+    requests per host, and the image processing runs in a pool of
+    processes.
+
+    Parameters
+    ----------
+    usecases : list of dicts
+        The usecases whose images should be processed. Those
+        already in CORDATA's github are skipped.
+    outfolder : str or Path
+        Folder where to save the standardized images.
+    outfile_template : str
+        Template for the image filenames, filled with the
+        usecase's fields.
+    url_path : str
+        URL of the `outfolder` in CORDATA's github.
+    skip_pattern : str
+        Usecases with 'url_image' containing this are skipped.
+    manifest_path : str, Path or None
+        If provided, save the manifest to this JSON file.
+    cache : ImageCache or None
+        If provided, use conditional requests so unchanged source
+        images are not downloaded nor processed again. The cache
+        is saved at the end and its hit ratio is added to the
+        manifest summary.
+    variants : bool
+        If True, also save thumbnail, 2x and WebP/AVIF variants of
+        each image, listing them in `variants_manifest`.
+    variants_manifest : str or Path
+        JSON file mapping each usecase hash_id to its image variants
+        (see `images.update_variants_manifest()`).
+    phash_index : PhashIndex or None
+        If provided, images similar to one already stored (according
+        to their perceptual hash) are not saved: the usecase's 
+        'url_image' is set to the stored image. The index is saved at
+        the end.
+    optimize : bool
+        If True, recompress each saved PNG (including the variants)
+        with maximum lossless compression or palette quantization, 
+        whichever is smaller (see `imgoptim.optimize_png()`). The 
+        bytes saved are added to the manifest summary.
+    min_ssim : float
+        Minimum SSIM accepted for palette quantization.
+    max_downloads : int
+        Number of threads used for downloading images (and
+        waiting for their processing).
+    max_per_host : int
+        Maximum number of simultaneous requests to the same host.
+    max_processes : int or None
+        Number of processes used for standardizing the images.
+        If None, use the number of CPUs.
+    target_height : int
+        Target height in pixels.
+    target_width : int
+        Target width in pixels.
+    grayband_factor : float
+        See `images.standardize_image()`.
+    verbose : bool
+        Whether to print the result for each usecase.
+
+    Returns
+    -------
+    manifest : dict
+        Under 'summary', the number of usecases processed, the
+        number of successes and failures and the total time. Under
+        'images', a list of the manifest entries for each usecase
+        (see `process_usecase_image()`).
+    """
+    selected = select_usecases(usecases, skip_pattern)
+    limiter = HostLimiter(max_per_host)
+    t0 = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max_processes) as process_pool:
+        with ThreadPoolExecutor(max_workers=max_downloads) as thread_pool:
+            futures = [thread_pool.submit(process_usecase_image, uc, Path(outfolder) / Path(outfile_template % uc),
+                                          process_pool, limiter, target_height, target_width, grayband_factor, cache, variants,
+                                          phash_index, optimize, min_ssim)
+                       for uc in selected]
+            entries = [f.result() for f in futures]
+
+    # Set URL for new images (keep original URL if new image failed):
+    for uc, entry in zip(selected, entries):
+        if entry['status'] in {'ok', 'cached'}:
+            uc['url_image'] = f"{url_path}{Path(entry['outpath']).name}"
+        if entry['status'] == 'duplicate':
+            uc['url_image'] = f"{url_path}{entry['duplicate_of']}"
+        if verbose == True:
+            print(f"{uc['hash_id']}: {entry['status']} ({entry['url']})")
+
+    # Build manifest:
+    statuses = [e['status'] for e in entries]
+    summary = {'date': datetime.today().strftime('%Y-%m-%d %H:%M:%S'), 'n_images': len(entries),
+               'n_ok': statuses.count('ok'), 'n_cached': statuses.count('cached'),
+               'n_duplicate': statuses.count('duplicate'), 'n_not_image': statuses.count('not_image'),
+               'n_failed': statuses.count('failed'), 'total_time': time.perf_counter() - t0}
+    if variants == True:
+        im.update_variants_manifest(variants_manifest, {e['hash_id']: e['variants'] for e in entries if e['variants'] != None})
+    if phash_index != None:
+        phash_index.save()
+    if optimize == True:
+        optimized = [o for e in entries if e['optimization'] != None for o in e['optimization']]
+        summary['bytes_saved'] = sum([o['original_bytes'] - o['new_bytes'] for o in optimized])
+    if cache != None:
+        cache.save()
+        summary['cache'] = cache.report()
+    manifest = {'summary': summary, 'images': entries}
+    if manifest_path != None:
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1, ensure_ascii=False)
+
+    return manifest
+
+
+def refresh_cached_images(cache: ic.ImageCache, phash_index=None, variants_manifest='../imagens/variants.json',
+                          max_downloads=16, max_per_host=2, max_processes=None, verbose=False) -> dict:
+    """
+    Check every source image recorded in `cache` (ImageCache) and
+    regenerate the standardized images whose sources changed, with
+    the options they were processed with (size, variants, 
+    deduplication and optimization, see `process_usecase_image()`).
+    The cache, the variants manifest and the index are saved at the
+    end.
+
+    Parameters
+    ----------
+    cache : ImageCache
+        The cache with the source images to check.
+    phash_index : PhashIndex or None
+        Perceptual hash index of the stored images. Required if
+        some image was processed with deduplication. Usecases
+        whose new image duplicates another one should then be
+        repointed (see `imgdedup.repoint_usecases()`).
+    variants_manifest : str or Path
+        JSON file mapping each usecase hash_id to its image variants.
+    max_downloads, max_per_host, max_processes : int
+        See `batch_etl_images()`.
+    verbose : bool
+        Whether to print the result for each image.
+
+    Returns
+    -------
+    results : dict
+        Manifest entry (see `process_usecase_image()`) for each URL.
+    """
+    entries = list(cache.entries.items())
+    if phash_index == None and any([e.get('options', {}).get('dedup') == True for _, e in entries]):
+        raise ValueError('Images processed with deduplication require a `phash_index` to be refreshed.')
+
+    def refresh(url, entry):
+        options = entry.get('options', {})
+        hash_id = entry.get('hash_id')
+        if hash_id == None:
+            hash_id = idd.hash_id_from_filename(Path(entry['output_path']).name)
+        return process_usecase_image({'hash_id': hash_id, 'url_image': url}, entry['output_path'], process_pool, limiter,
+                                     options.get('target_height', 293), options.get('target_width', 523),
+                                     options.get('grayband_factor', 1), cache, options.get('variants', False),
+                                     phash_index if options.get('dedup') == True else None,
+                                     options.get('optimize', False), options.get('min_ssim', 0.98))
+
+    limiter = HostLimiter(max_per_host)
+    with ProcessPoolExecutor(max_workers=max_processes) as process_pool:
+        with ThreadPoolExecutor(max_workers=max_downloads) as thread_pool:
+            futures = [(url, thread_pool.submit(refresh, url, entry)) for url, entry in entries]
+            results = {url: f.result() for url, f in futures}
+
+    if verbose == True:
+        for url, result in results.items():
+            print(f"{result['status']}: {url} -> {result['outpath']}")
+    variants = {r['hash_id']: r['variants'] for r in results.values() if r['variants'] != None}
+    if len(variants) > 0:
+        im.update_variants_manifest(variants_manifest, variants)
+    if phash_index != None:
+        phash_index.save()
+    cache.save()
+    if verbose == True:
+        print(cache.report())
+    return results
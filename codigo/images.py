@@ -21,75 +21,167 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import requests
+import json
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 from PIL import Image, ImageOps
 from pathlib import Path
 
+import webclient as web
 
-def http_get(url, max_retries=3, timeout=10):
+
+# Limits for source images:
+MAX_PIXELS = 40_000_000     # Largest image decoded (width x height), after JPEG reduction.
+MAX_BYTES  = 50 * 2**20     # Largest source file accepted (in bytes).
+SPOOL_SIZE = 4 * 2**20      # Downloads larger than this are kept on disk instead of memory.
+
+
+def http_get(url, timeout=10, ok_statuses={200}, **kwargs):
     """
     Make an HTTP GET request to `url` (str) and return a response object.
+    The request uses the shared session in `webclient`, which keeps 
+    connections alive and retries on connection errors and on statuses 
+    429 and 5xx (respecting the `Retry-After` header).
 
     Parameters
     ----------
     url : str
         The Web Address to request.
-    max_retries : int
-        Maximum number of request trials before giving up.
     timeout : float
         How long to wait for a response, in seconds.
+    ok_statuses : set of int
+        HTTP status codes accepted as success (e.g. add 304 for 
+        conditional requests).
+    kwargs : dict
+        Extra arguments passed to `webclient.get()` (e.g. `headers` 
+        or `stream`).
     """
-    # Prepare for request:
-    session = requests.session()
-    session.mount('http://', requests.adapters.HTTPAdapter(max_retries=max_retries))
-    
     # GET:
     ssl_verify = True
     try:
-        response = session.get(url, timeout=timeout)
+        response = web.get(url, timeout=timeout, **kwargs)
     # In case of SSL Certificate error:
     except requests.exceptions.SSLError:
         ssl_verify = False
-        response = session.get(url, timeout=timeout, verify=ssl_verify)
-
-    # If forbidden, try pretending to be a browser:
-    if response.status_code in {403, 404, 406, 412, 503, 429}:
-        browser_header = {'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:136.0) Gecko/20100101 Firefox/136.0'}
-        response = session.get(url, timeout=timeout, headers=browser_header, verify=ssl_verify)
+        response = web.get(url, timeout=timeout, verify=ssl_verify, **kwargs)
+
+    # If forbidden (some servers block non-browser clients), try pretending to be a browser:
+    if response.status_code in {403, 406}:
+        response.close()
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers['User-Agent'] = 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:136.0) Gecko/20100101 Firefox/136.0'
+        response = web.get(url, timeout=timeout, headers=headers, verify=ssl_verify, **kwargs)
     
-    # If fail:
-    if response.status_code != 200:
+    # If fail (releasing the connection, which is not read when streaming):
+    if response.status_code not in ok_statuses:
+        response.close()
         raise Exception('HTTP request failed with code ' + str(response.status_code))
 
     return response
 
 
-def standardize_image(img, output_path, target_height=293, target_width=523, grayband_factor=1):
+def stream_to_file(response, fp=None, max_bytes=MAX_BYTES, chunk_size=2**16):
     """
-    Standardizes an image to a target aspect ratio and size.
+    Copy the body of a streamed HTTP `response` (requested with
+    `stream=True`) to a file, chunk by chunk, so the whole content 
+    is never held in memory at once.
 
-    Steps:
-    1. Input the PIL RGB image.
-    2. Computes current aspect ratio.
-    3. Crops or pads symmetrically based on deviation from target aspect ratio.
-    4. Scales image to target width while maintaining aspect ratio.
-    5. Saves output as PNG.
+    Parameters
+    ----------
+    response : Response
+        The streamed response.
+    fp : file object or None
+        Binary file to write to. If None, use a temporary file kept
+        in memory up to `SPOOL_SIZE` bytes and on disk after that.
+    max_bytes : int
+        Maximum size of the content. Larger downloads are aborted
+        with a ValueError.
+    chunk_size : int
+        Number of bytes read at a time.
+
+    Returns
+    -------
+    fp : file object
+        The file with the content, positioned at its start.
+    """
+    if fp == None:
+        fp = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    
+    n_bytes = 0
+    with response:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            n_bytes += len(chunk)
+            if n_bytes > max_bytes:
+                raise ValueError(f'Image larger than {max_bytes} bytes')
+            fp.write(chunk)
+    fp.seek(0)
+    
+    return fp
+
+
+def decode_image(source, min_size=None, max_pixels=MAX_PIXELS):
+    """
+    Decode an image in RGB with bounded memory usage.
+
+    For JPEG images, the decoder is set to reduce the image on load 
+    (by a factor of 2, 4 or 8) as long as it remains larger than 
+    `min_size`, which avoids decoding huge images at full resolution.
+    The size to be decoded (the reduced one for JPEGs, the header one 
+    for other formats) is checked against `max_pixels` before decoding.
+
+    Parameters
+    ----------
+    source : str, Path or file object
+        The encoded JPG, PNG or GIF image.
+    min_size : tuple of int or None
+        Minimum (width, height) of the decoded image. If None, the 
+        image is decoded at full resolution.
+    max_pixels : int
+        Maximum number of pixels (width x height) to decode. Larger 
+        images raise a ValueError.
+
+    Returns
+    -------
+    img : PIL Image
+        The decoded image, in RGB.
+    """
+    img = Image.open(source)
+    
+    # Reduce JPEG images on load (other formats are not affected):
+    if min_size != None:
+        img.draft('RGB', min_size)
+    
+    # Check the size to be decoded (reduced for JPEGs), before decoding:
+    width, height = img.size
+    if width * height > max_pixels:
+        raise ValueError(f'Image with {width}x{height} pixels is larger than the limit of {max_pixels} pixels')
+    
+    return img.convert("RGB")
+
+
+def fit_aspect_ratio(img, target_height=293, target_width=523, grayband_factor=1):
+    """
+    Crops or pads (with gray bands) an image symmetrically so it gets 
+    the target aspect ratio, without scaling it.
 
     Parameters
     ----------
     img : PIL Image 
         The image to be standardized, in RGB.
-    output_path : str 
-        Path to save transformed PNG image.
     target_height : int
-        Target height in pixels.
+        Target height in pixels (only used for the aspect ratio).
     target_width : int
-        Target width in pixels.
+        Target width in pixels (only used for the aspect ratio).
     grayband_factor : float
         Aspect ratio (width / height) factor between the current and target image 
         up to which a gray band is added to it instead of cropping.  It must be
         greater than or equal to one. If set to 1, the image is always cropped to 
         reach the desired aspect ratio.
+
+    Returns
+    -------
+    img : PIL Image
+        The cropped or padded image.
     """
     
     # Compute image and target aspect ratios
@@ -97,51 +189,219 @@ def standardize_image(img, output_path, target_height=293, target_width=523, gra
     aspect = width / height
     target_aspect = target_width / target_height
 
-    # Step 3: If aspect ratio is more than the required on the target, crop horizontally:
+    # If aspect ratio is more than the required on the target, crop horizontally:
     if aspect > grayband_factor * target_aspect:
         new_width = int(height * target_aspect)
         left = (width - new_width) // 2
         right = left + new_width
         img = img.crop((left, 0, right, height))
-        width, height = img.size
-        aspect = width / height
 
-    # Step 4: If aspect ratio is less than required on the target, crop vertically:
+    # If aspect ratio is less than required on the target, crop vertically:
     elif aspect < target_aspect / grayband_factor:
         new_height = int(width / target_aspect)
         top = (height - new_height) // 2
         bottom = top + new_height
         img = img.crop((0, top, width, bottom))
-        width, height = img.size
-        aspect = width / height
 
-    # Step 5: If slightly wider, add gray bands on top/bottom:
+    # If slightly wider, add gray bands on top/bottom:
     elif aspect > target_aspect:
         new_height = int(width / target_aspect)
         padding = (new_height - height) // 2
         img = ImageOps.expand(img, border=(0, padding, 0, padding), fill=(128, 128, 128))
-        width, height = img.size
 
-    # Step 6: If slightly narrower, add gray bands on left/right:
+    # If slightly narrower, add gray bands on left/right:
     elif aspect < target_aspect:
         new_width = int(height * target_aspect)
         padding = (new_width - width) // 2
         img = ImageOps.expand(img, border=(padding, 0, padding, 0), fill=(128, 128, 128))
-        width, height = img.size
 
-    # Step 7: Scale image to have target width (keeping aspect):
+    return img
+
+
+def scale_to_width(img, target_width):
+    """
+    Scales image `img` (PIL Image) to have `target_width` (int) 
+    pixels of width while maintaining its aspect ratio.
+    """
+    width, height = img.size
     new_height = int((target_width / width) * height)
-    img = img.resize((target_width, new_height), Image.LANCZOS)
+    return img.resize((target_width, new_height), Image.LANCZOS)
+
+
+def standardize_image(img, output_path, target_height=293, target_width=523, grayband_factor=1):
+    """
+    Standardizes an image to a target aspect ratio and size.
 
-    # Step 8: Save as PNG
+    Steps:
+    1. Input the PIL RGB image.
+    2. Computes current aspect ratio.
+    3. Crops or pads symmetrically based on deviation from target aspect ratio.
+    4. Scales image to target width while maintaining aspect ratio.
+    5. Saves output as PNG.
+
+    Parameters
+    ----------
+    img : PIL Image 
+        The image to be standardized, in RGB.
+    output_path : str 
+        Path to save transformed PNG image.
+    target_height : int
+        Target height in pixels.
+    target_width : int
+        Target width in pixels.
+    grayband_factor : float
+        Aspect ratio (width / height) factor between the current and target image 
+        up to which a gray band is added to it instead of cropping.  It must be
+        greater than or equal to one. If set to 1, the image is always cropped to 
+        reach the desired aspect ratio.
+    """
+    
+    # Steps 2 and 3: Crop or pad to target aspect ratio:
+    img = fit_aspect_ratio(img, target_height, target_width, grayband_factor)
+
+    # Step 4: Scale image to have target width (keeping aspect):
+    img = scale_to_width(img, target_width)
+
+    # Step 5: Save as PNG
     img.save(output_path, format="PNG")
 
-def standardize_image_from_url(url, output_path, target_height=293, target_width=523, grayband_factor=1):
+
+def available_formats() -> list:
+    """
+    Return the list of image formats used for the banner variants that 
+    can be saved by the installed PIL: PNG and, if supported, WEBP and 
+    AVIF (AVIF may require the `pillow-avif-plugin` package on older
+    PIL versions).
+    """
+    try:
+        import pillow_avif
+    except ImportError:
+        pass
+    Image.init()
+    formats = ['PNG'] + [fmt for fmt in ['WEBP', 'AVIF'] if fmt in Image.SAVE]
+    return formats
+
+
+def standardize_image_variants(img, output_dir, basename, target_height=293, target_width=523, grayband_factor=1,
+                               scales={'': 1, '_thumb': 0.5, '_2x': 2}, formats=None):
+    """
+    Standardizes an image to a target aspect ratio and saves it in multiple 
+    sizes and formats, from a single decoded image. The variant with scale 1 
+    in PNG is the same as the output of `standardize_image()`. Variants larger
+    than the cropped/padded source image are skipped (no upscaling beyond the 
+    target size).
+
+    Parameters
+    ----------
+    img : PIL Image 
+        The image to be standardized, in RGB.
+    output_dir : str or Path
+        Folder where to save the variants.
+    basename : str
+        Filename of the variants, without extension. Each variant adds its
+        scale suffix and format extension (e.g. 'hash_id_123_thumb.webp').
+    target_height : int
+        Target height in pixels for scale 1.
+    target_width : int
+        Target width in pixels for scale 1.
+    grayband_factor : float
+        See `standardize_image()`.
+    scales : dict
+        Filename suffix (str) of each variant mapped to its size relative
+        to the target size (float).
+    formats : list of str or None
+        Image formats to save (e.g. ['PNG', 'WEBP']). If None, use all
+        formats in `available_formats()`.
+
+    Returns
+    -------
+    variants : list of dicts
+        Description of each saved variant: filename, width, height, format
+        and size in bytes.
+    """
+    if formats == None:
+        formats = available_formats()
+    extensions = {'PNG': '.png', 'WEBP': '.webp', 'AVIF': '.avif'}
+
+    # Crop or pad only once:
+    fitted = fit_aspect_ratio(img, target_height, target_width, grayband_factor)
+
+    variants = []
+    for suffix, scale in scales.items():
+        width = int(round(target_width * scale))
+        # Avoid upscaling beyond the target size:
+        if scale > 1 and fitted.size[0] < width:
+            continue
+        scaled = scale_to_width(fitted, width)
+        for fmt in formats:
+            filename = basename + suffix + extensions[fmt]
+            path = Path(output_dir) / Path(filename)
+            scaled.save(path, format=fmt)
+            variants.append({'file': filename, 'width': scaled.size[0], 'height': scaled.size[1], 
+                             'format': fmt, 'bytes': path.stat().st_size})
+
+    return variants
+
+
+def standardize_image_variants_from_file(filename, output_dir, basename, target_height=293, target_width=523, grayband_factor=1,
+                                         scales={'': 1, '_thumb': 0.5, '_2x': 2}, formats=None, max_pixels=MAX_PIXELS):
+    """
+    Decodes an image from a file (with bounded memory, see `decode_image()`)
+    and saves its standardized variants (see `standardize_image_variants()`).
+    Being a module-level function of plain arguments, it can be sent to a 
+    process pool.
+    """
+    max_scale = max(scales.values())
+    img = decode_image(filename, (int(target_width * max_scale), int(target_height * max_scale)), max_pixels)
+    return standardize_image_variants(img, output_dir, basename, target_height, target_width, grayband_factor, scales, formats)
+
+
+def standardize_image_variants_from_bytes(content, output_dir, basename, target_height=293, target_width=523, grayband_factor=1,
+                                          scales={'': 1, '_thumb': 0.5, '_2x': 2}, formats=None, max_pixels=MAX_PIXELS):
+    """
+    Decodes an image from its raw bytes and saves its standardized variants 
+    (see `standardize_image_variants_from_file()`).
+    """
+    return standardize_image_variants_from_file(BytesIO(content), output_dir, basename, target_height, target_width, 
+                                                grayband_factor, scales, formats, max_pixels)
+
+
+def update_variants_manifest(manifest_path, variants_by_id: dict):
+    """
+    Add the variants of standardized images to a JSON manifest mapping
+    each usecase `hash_id` to its image variants, so front-ends can choose 
+    the smallest suitable file.
+
+    Parameters
+    ----------
+    manifest_path : str or Path
+        Path to the JSON manifest. It is created if it does not exist.
+    variants_by_id : dict
+        Usecase hash_id mapped to the list of variants returned by 
+        `standardize_image_variants()`. Existing entries for these
+        IDs are replaced.
+    """
+    manifest_path = Path(manifest_path)
+    if manifest_path.exists():
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    else:
+        manifest = dict()
+
+    # JSON keys are strings:
+    manifest.update({str(k): v for k, v in variants_by_id.items()})
+    
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False)
+
+
+def standardize_image_from_url(url, output_path, target_height=293, target_width=523, grayband_factor=1, max_pixels=MAX_PIXELS):
     """
     Downloads an image from the Web and standardizes it to a target aspect ratio and size.
 
     Steps:
-    1. Downloads JPG, PNG, or GIF image from URL.
+    1. Downloads JPG, PNG, or GIF image from URL (to a temporary file) and
+       decodes it with bounded memory.
     2. Computes current aspect ratio.
     3. Crops or pads symmetrically based on deviation from target aspect ratio.
     4. Scales image to target width while maintaining aspect ratio.
@@ -162,28 +422,60 @@ def standardize_image_from_url(url, output_path, target_height=293, target_width
         up to which a gray band is added to it instead of cropping.  It must be
         greater than or equal to one. If set to 1, the image is always cropped to 
         reach the desired aspect ratio.
+    max_pixels : int
+        Maximum number of pixels (width x height) of the source image.
     """
     # Step 1: Download image from URL
-    response = http_get(url)
+    response = http_get(url, stream=True)
     response.raise_for_status()  # Raises error for invalid response
-    if response.headers.get("Content-Type")[:9] != 'text/html':
-        #print(response.headers.get("Content-Type"))
-        img = Image.open(BytesIO(response.content)).convert("RGB")
+    if response.headers.get("Content-Type", "")[:9] != 'text/html':
+        with stream_to_file(response) as fp:
+            img = decode_image(fp, (target_width, target_height), max_pixels)
     
         standardize_image(img, output_path, target_height, target_width, grayband_factor)
 
         return True
         
     else:
+        response.close()
         return False
 
 
-def standardize_image_from_file(filename, output_path, target_height=293, target_width=523, grayband_factor=1):
+def standardize_image_from_bytes(content, output_path, target_height=293, target_width=523, grayband_factor=1, max_pixels=MAX_PIXELS):
+    """
+    Decodes an image from its raw bytes (e.g. a downloaded file) and 
+    standardizes it to a target aspect ratio and size. Being a module-level 
+    function of plain arguments, it can be sent to a process pool.
+
+    Parameters
+    ----------
+    content : bytes 
+        The encoded JPG, PNG or GIF image.
+    output_path : str 
+        Path to save transformed PNG image.
+    target_height : int
+        Target height in pixels.
+    target_width : int
+        Target width in pixels.
+    grayband_factor : float
+        Aspect ratio (width / height) factor between the current and target image 
+        up to which a gray band is added to it instead of cropping.  It must be
+        greater than or equal to one. If set to 1, the image is always cropped to 
+        reach the desired aspect ratio.
+    max_pixels : int
+        Maximum number of pixels (width x height) of the source image.
+    """
+    img = decode_image(BytesIO(content), (target_width, target_height), max_pixels)
+    standardize_image(img, output_path, target_height, target_width, grayband_factor)
+    return True
+
+
+def standardize_image_from_file(filename, output_path, target_height=293, target_width=523, grayband_factor=1, max_pixels=MAX_PIXELS):
     """
     Loads an image from a file and standardizes it to a target aspect ratio and size.
 
     Steps:
-    1. Loads JPG, PNG, or GIF image from file.
+    1. Loads JPG, PNG, or GIF image from file (with bounded memory).
     2. Computes current aspect ratio.
     3. Crops or pads symmetrically based on deviation from target aspect ratio.
     4. Scales image to target width while maintaining aspect ratio.
@@ -204,8 +496,10 @@ def standardize_image_from_file(filename, output_path, target_height=293, target
         up to which a gray band is added to it instead of cropping.  It must be
         greater than or equal to one. If set to 1, the image is always cropped to 
         reach the desired aspect ratio.
+    max_pixels : int
+        Maximum number of pixels (width x height) of the source image.
     """
-    img = Image.open(filename).convert("RGB")
+    img = decode_image(filename, (target_width, target_height), max_pixels)
     standardize_image(img, output_path, target_height, target_width, grayband_factor)
     return True        
 
@@ -228,8 +522,8 @@ def etl_usecase_image(uc : dict, outfolder='../imagens/', outfile_template='hash
         
         # Set URL for new image:
         if success == True:
+            url_image = f"{url_path}{outfile}"
             if verbose == True:
-                url_image = f"{url_path}{outfile}"
                 print(f'Will set url_image to {url_image}.')
             uc['url_image'] = url_image
         # Keep original URL if new image failed.
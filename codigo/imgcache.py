@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of HTTP validators for the source images of CORDATA's usecases.
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import threading
+from pathlib import Path
+from datetime import datetime
+
+import images as im
+
+
+class ImageCache:
+    """
+    Records, for each source image URL, the `ETag` and `Last-Modified`
+    headers sent by the server, the standardized image created from it,
+    the usecase it belongs to and the processing options used (so the
+    image can be refreshed the same way, see 
+    `imagebatch.refresh_cached_images()`). Later requests for the same 
+    URL are conditional, so an unchanged source (status 304) is neither
+    downloaded nor processed again.
+    """
+    def __init__(self, path='../imagens/image_cache.json'):
+        """
+        Parameters
+        ----------
+        path : str or Path
+            JSON file where the cache is stored. It is loaded
+            if it exists.
+        """
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = dict()
+
+    def request_headers(self, url: str, output_path) -> dict:
+        """
+        Return the conditional request headers for `url` (str).
+        No condition is set if the URL was never seen, if it was
+        standardized to another `output_path` or if the file where
+        its standardized image is stored is missing.
+        """
+        with self.lock:
+            entry = self.entries.get(url)
+        headers = dict()
+        if entry == None or str(output_path) != entry['output_path'] or self.stored_path(url, output_path).exists() == False:
+            return headers
+        if entry.get('etag') != None:
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified') != None:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def stored_path(self, url: str, output_path) -> Path:
+        """
+        Return the path to the file holding the standardized image
+        of `url` (str): the `output_path` requested for it, unless it
+        was stored elsewhere (e.g. as a duplicate of another image).
+        """
+        with self.lock:
+            entry = self.entries.get(url, dict())
+        return Path(entry.get('stored_path', output_path))
+
+    def record(self, url: str, response, output_path, hash_id=None, options=None, stored_path=None):
+        """
+        Update the cache entry for `url` (str) given the HTTP
+        `response`, the path requested for the standardized image,
+        the usecase `hash_id` (int or None), the processing 
+        `options` (dict or None, keyword arguments of 
+        `imagebatch.process_usecase_image()`) and the file where
+        the image is actually stored (`stored_path`, if not the 
+        requested one), and count it as a hit (status 304) or a 
+        miss.
+        """
+        now = datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+        with self.lock:
+            if response.status_code == 304:
+                self.hits += 1
+                self.entries[url]['checked_at'] = now
+            else:
+                self.misses += 1
+                self.entries[url] = {'etag': response.headers.get('ETag'),
+                                     'last_modified': response.headers.get('Last-Modified'),
+                                     'output_path': str(output_path), 
+                                     'stored_path': str(stored_path if stored_path != None else output_path), 'hash_id': hash_id,
+                                     'options': options if options != None else dict(), 
+                                     'checked_at': now, 'updated_at': now}
+
+    def report(self) -> dict:
+        """
+        Return the number of cache hits (unchanged images) and
+        misses (downloaded images) since the cache was loaded,
+        and the hit ratio.
+        """
+        total = self.hits + self.misses
+        ratio = self.hits / total if total > 0 else None
+        return {'hits': self.hits, 'misses': self.misses, 'hit_ratio': ratio}
+
+    def save(self):
+        """
+        Write the cache to its JSON file.
+        """
+        with self.lock:
+            with open(self.path, 'w') as f:
+                json.dump(self.entries, f, indent=1, ensure_ascii=False)
+
+
+def fetch_image(url: str, output_path, cache: ImageCache, timeout=10, **kwargs):
+    """
+    Download the image at `url` (str) unless the cache shows the
+    standardized image at `output_path` is up to date with it.
+    Extra arguments are passed to `images.http_get()` (e.g. 
+    `stream=True`).
+
+    The 304 answers are recorded in the cache right away. The new
+    `ETag` and `Last-Modified` of a changed image are not: the
+    caller must `cache.record()` the response only after the image
+    is saved, otherwise a changed image that fails to be processed
+    would be considered up to date by later requests.
+
+    Returns
+    -------
+    response : Response or None
+        The response with the new image content, or None if the
+        server answered that the image did not change (304).
+    """
+    headers = cache.request_headers(url, output_path)
+    response = im.http_get(url, timeout=timeout, ok_statuses={200, 304}, headers=headers, **kwargs)
+    if response.status_code == 304:
+        cache.record(url, response, output_path)
+        return None
+    return response
+
+
+def standardize_image_from_url_cached(url, output_path, cache: ImageCache, target_height=293, target_width=523, grayband_factor=1,
+                                      max_pixels=im.MAX_PIXELS):
+    """
+    Same as `images.standardize_image_from_url()`, but using
+    conditional requests recorded in `cache` (ImageCache). For
+    images with variants, deduplication or optimization, use
+    `imagebatch.process_usecase_image()`.
+
+    Returns
+    -------
+    status : str
+        'cached' if the source image did not change (nothing is
+        done), 'updated' if the image was (re)generated and
+        'not_image' if the URL points to a Web page.
+    """
+    response = fetch_image(url, output_path, cache, stream=True)
+    if response == None:
+        return 'cached'
+    if response.headers.get("Content-Type", "")[:9] == 'text/html':
+        response.close()
+        return 'not_image'
+    with im.stream_to_file(response) as fp:
+        im.standardize_image_from_file(fp, output_path, target_height, target_width, grayband_factor, max_pixels)
+    cache.record(url, response, output_path, options={'target_height': target_height, 'target_width': target_width,
+                                                      'grayband_factor': grayband_factor})
+    return 'updated'
+
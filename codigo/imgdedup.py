@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Perceptual-hash deduplication of representative images for usecases in CORDATA.
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+import json
+import threading
+from pathlib import Path
+from PIL import Image
+
+import images as im
+
+
+def dhash(img, hash_size=8) -> int:
+    """
+    Compute the difference hash (a perceptual hash) of an image: the image
+    is reduced to (`hash_size` + 1) x `hash_size` gray pixels and each bit
+    tells if a pixel is brighter than its right neighbour. Near-identical
+    images (e.g. the same logo re-encoded or slightly resized) get hashes
+    that differ by few bits.
+
+    Parameters
+    ----------
+    img : PIL Image
+        The image to hash.
+    hash_size : int
+        Number of rows (and comparisons per row) of the hash. The hash
+        has `hash_size` ** 2 bits.
+
+    Returns
+    -------
+    phash : int
+        The perceptual hash.
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+
+    phash = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left  = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            phash = (phash << 1) | int(left > right)
+
+    return phash
+
+
+def hamming(a: int, b: int) -> int:
+    """
+    Number of bits that differ between hashes `a` and `b` (int).
+    """
+    return bin(a ^ b).count('1')
+
+
+def find_similar(phash: int, known_hashes: dict, threshold=4):
+    """
+    Return the filename, among `known_hashes` (dict from perceptual
+    hash to filename), of the image closest to `phash` (int), if it
+    differs by at most `threshold` (int) bits. Otherwise, return None.
+    """
+    best, best_dist = None, threshold + 1
+    for h, filename in known_hashes.items():
+        dist = hamming(phash, h)
+        if dist < best_dist:
+            best, best_dist = filename, dist
+    return best
+
+
+def hash_id_from_filename(filename: str) -> int:
+    """
+    Extract the usecase ID from a standardized image filename
+    (e.g. 'hash_id_1005420252.png'). Return None if absent.
+    """
+    match = re.search(r'hash_id_(\d+)', filename)
+    if match == None:
+        return None
+    return int(match.group(1))
+
+
+class PhashIndex:
+    """
+    Index from the perceptual hash of each stored (canonical) image to
+    its file and to the usecases (hash_ids) that use it as their image.
+    """
+    def __init__(self, path='../imagens/phash_index.json', threshold=4):
+        """
+        Parameters
+        ----------
+        path : str or Path
+            JSON file where the index is stored. It is loaded if
+            it exists.
+        threshold : int
+            Maximum number of different bits between the hashes of
+            images considered the same.
+        """
+        self.path = Path(path)
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = dict()
+
+    def known_hashes(self) -> dict:
+        """
+        Return a dict from perceptual hash (int) to canonical filename.
+        """
+        with self.lock:
+            return {int(e['phash'], 16): filename for filename, e in self.entries.items()}
+
+    def find(self, phash: int):
+        """
+        Return the canonical filename of the image similar to `phash`
+        (int), or None if there is no such image.
+        """
+        return find_similar(phash, self.known_hashes(), self.threshold)
+
+    def _detach(self, hash_id: int, keep):
+        """
+        Remove usecase `hash_id` (int) from all canonical images but
+        `keep` (str, or None for all), since a usecase has a single
+        image. Must be called with the lock held.
+        """
+        for filename, e in self.entries.items():
+            if filename != keep and hash_id in e['hash_ids']:
+                e['hash_ids'].remove(hash_id)
+
+    def add(self, phash: int, filename: str, hash_id: int):
+        """
+        Register `filename` (str) as a canonical image with hash `phash`
+        (int), used by usecase `hash_id` (int).
+        """
+        with self.lock:
+            self._detach(hash_id, filename)
+            self.entries[filename] = {'phash': f'{phash:016x}', 'hash_ids': [hash_id]}
+
+    def link(self, filename: str, hash_id: int):
+        """
+        Register that usecase `hash_id` (int) uses the canonical image
+        `filename` (str).
+        """
+        with self.lock:
+            self._detach(hash_id, filename)
+            if hash_id not in self.entries[filename]['hash_ids']:
+                self.entries[filename]['hash_ids'].append(hash_id)
+
+    def claim(self, filename: str, hash_id: int, folder) -> str:
+        """
+        Return the filename under which usecase `hash_id` (int) may
+        save its new image, requested as `filename` (str): 
+        `filename` itself, unless it is the stored image of other 
+        usecases, in which case a new name in `folder` (str or Path)
+        is returned (e.g. 'hash_id_123_v2.png'), since images in use
+        are never overwritten. The usecase is detached from its 
+        previous image, and an entry for `filename` no other usecase
+        uses is dropped (the file is about to be overwritten).
+        """
+        with self.lock:
+            self._detach(hash_id, None)
+            if len(self.entries.get(filename, {'hash_ids': []})['hash_ids']) == 0:
+                self.entries.pop(filename, None)
+                return filename
+            stem, suffix = Path(filename).stem, Path(filename).suffix
+            k = 2
+            while f'{stem}_v{k}{suffix}' in self.entries or (Path(folder) / f'{stem}_v{k}{suffix}').exists():
+                k += 1
+            return f'{stem}_v{k}{suffix}'
+
+    def add_or_link(self, phash: int, filename: str, hash_id: int):
+        """
+        Register `filename` (str), with hash `phash` (int) and used by
+        usecase `hash_id` (int), as a canonical image, unless a similar 
+        image was stored in the meantime (e.g. by another usecase in the 
+        same batch), in which case the usecase is linked to it. The check
+        and the update are atomic.
+
+        Returns
+        -------
+        canonical : str or None
+            The filename of the similar image the usecase was linked to,
+            or None if `filename` was added.
+        """
+        with self.lock:
+            known = {int(e['phash'], 16): name for name, e in self.entries.items()}
+            canonical = find_similar(phash, known, self.threshold)
+            if canonical == None:
+                self._detach(hash_id, filename)
+                self.entries[filename] = {'phash': f'{phash:016x}', 'hash_ids': [hash_id]}
+            else:
+                self._detach(hash_id, canonical)
+                if hash_id not in self.entries[canonical]['hash_ids']:
+                    self.entries[canonical]['hash_ids'].append(hash_id)
+        return canonical
+
+    def canonical_files(self) -> dict:
+        """
+        Return a dict from usecase hash_id (int) to the canonical
+        filename of its image.
+        """
+        with self.lock:
+            return {hash_id: filename for filename, e in self.entries.items() for hash_id in e['hash_ids']}
+
+    def save(self):
+        """
+        Write the index to its JSON file.
+        """
+        with self.lock:
+            with open(self.path, 'w') as f:
+                json.dump(self.entries, f, indent=1, ensure_ascii=False)
+
+
+def build_index(index: PhashIndex, folder='../imagens/', pattern='hash_id_*.png', remove_duplicates=False, usecases=None,
+                url_path='https://raw.githubusercontent.com/cewebbr/cordata/main/imagens/', verbose=False) -> dict:
+    """
+    Add the standardized images in `folder` to the perceptual hash
+    `index`, in filename order. An image similar to one already in
+    the index is recorded as a duplicate: its usecase is linked to
+    the canonical image.
+
+    Parameters
+    ----------
+    index : PhashIndex
+        The index to update (and save).
+    folder : str or Path
+        Folder containing the standardized images.
+    pattern : str
+        Glob pattern of the images to index.
+    remove_duplicates : bool
+        Whether to delete the duplicated image files. Requires 
+        `usecases`, which are first repointed to the canonical images
+        (see `repoint_usecases()`); files still used by a usecase are
+        kept.
+    usecases : list of dicts or None
+        The usecases whose 'url_image' may point to the duplicated
+        images. Updated in place; saving them is up to the caller.
+    url_path : str
+        URL of the `folder` in CORDATA's github.
+    verbose : bool
+        Whether to print the duplicates found.
+
+    Returns
+    -------
+    duplicates : dict
+        Duplicated filenames mapped to their canonical filenames.
+    """
+    if remove_duplicates == True and usecases == None:
+        raise ValueError('Removing duplicated images requires the usecases, so they can be repointed.')
+    
+    indexed = set(index.entries.keys())
+    duplicates = dict()
+
+    for path in sorted(Path(folder).glob(pattern)):
+        if path.name in indexed:
+            continue
+        with Image.open(path) as img:
+            phash = dhash(img)
+        hash_id = hash_id_from_filename(path.name)
+        canonical = index.find(phash)
+
+        if canonical == None:
+            index.add(phash, path.name, hash_id)
+        else:
+            index.link(canonical, hash_id)
+            duplicates[path.name] = canonical
+            if verbose == True:
+                print(f'{path.name} is a duplicate of {canonical}')
+
+    # Delete duplicated files no usecase points to anymore:
+    if remove_duplicates == True:
+        repoint_usecases(usecases, index, url_path)
+        in_use = {uc['url_image'][len(url_path):] for uc in usecases if uc['url_image'] != None and uc['url_image'].startswith(url_path)}
+        for filename in duplicates:
+            if filename not in in_use:
+                (Path(folder) / filename).unlink()
+
+    index.save()
+    return duplicates
+
+
+def repoint_usecases(usecases: list, index: PhashIndex, url_path='https://raw.githubusercontent.com/cewebbr/cordata/main/imagens/'):
+    """
+    Set, in place, the 'url_image' of the usecases (list of dicts)
+    whose image is in CORDATA's github to the canonical image in the
+    perceptual hash `index`.
+    """
+    canonical = index.canonical_files()
+    for uc in usecases:
+        if uc['hash_id'] in canonical and uc['url_image'] != None and uc['url_image'].startswith(url_path):
+            uc['url_image'] = url_path + canonical[uc['hash_id']]
+
+
+def standardize_image_from_file_dedup(filename, output_path, known_hashes: dict, threshold=4, variants=False,
+                                      target_height=293, target_width=523, grayband_factor=1, max_pixels=im.MAX_PIXELS) -> dict:
+    """
+    Decode and standardize an image from a file (see
+    `images.standardize_image_from_file()`), unless it is similar to an
+    image already stored, in which case nothing is encoded nor saved.
+    Being a module-level function of plain arguments, it can be sent to
+    a process pool.
+
+    Parameters
+    ----------
+    filename : str, Path or file object
+        The source image.
+    output_path : str or Path
+        Path to save the standardized PNG image.
+    known_hashes : dict
+        Perceptual hash (int) of the stored images mapped to their
+        filenames.
+    threshold : int
+        Maximum number of different bits between the hashes of
+        images considered the same.
+    variants : bool
+        Whether to save the image variants (see
+        `images.standardize_image_variants()`) instead of a single PNG.
+    target_height, target_width, grayband_factor, max_pixels
+        See `images.standardize_image_from_file()`.
+
+    Returns
+    -------
+    result : dict
+        The image's perceptual hash ('phash'), the filename of the
+        stored image similar to it ('duplicate_of', None if there is
+        none) and the saved variants ('variants', if requested).
+    """
+    scale = 2 if variants == True else 1
+    img = im.decode_image(filename, (target_width * scale, target_height * scale), max_pixels)
+
+    # Hash the image as it would be stored:
+    phash = dhash(im.fit_aspect_ratio(img, target_height, target_width, grayband_factor))
+    canonical = find_similar(phash, known_hashes, threshold)
+    result = {'phash': phash, 'duplicate_of': canonical, 'variants': None}
+    if canonical != None:
+        return result
+
+    # Save new image:
+    if variants == True:
+        result['variants'] = im.standardize_image_variants(img, Path(output_path).parent, Path(output_path).stem,
+                                                           target_height, target_width, grayband_factor)
+    else:
+        im.standardize_image(img, output_path, target_height, target_width, grayband_factor)
+
+    return result
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+PNG size optimization of representative images for usecases in CORDATA.
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import argparse
+import numpy as np
+from io import BytesIO
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+
+def ssim(img_a, img_b, block=8) -> float:
+    """
+    Structural similarity (SSIM) between two images of the same size,
+    computed on their luminance over non-overlapping square blocks and
+    averaged. It is 1 for identical images and decreases as they differ.
+
+    Parameters
+    ----------
+    img_a, img_b : PIL Image
+        The images to compare.
+    block : int
+        Side of the blocks, in pixels.
+
+    Returns
+    -------
+    score : float
+        The mean SSIM over the blocks.
+    """
+    # Hard-coded constants (for 8-bit images):
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+
+    a = np.asarray(img_a.convert('L'), dtype=np.float64)
+    b = np.asarray(img_b.convert('L'), dtype=np.float64)
+
+    # Split images into blocks (dropping incomplete ones at the borders):
+    h, w = (a.shape[0] // block) * block, (a.shape[1] // block) * block
+    a = a[:h, :w].reshape(h // block, block, w // block, block).swapaxes(1, 2).reshape(-1, block * block)
+    b = b[:h, :w].reshape(h // block, block, w // block, block).swapaxes(1, 2).reshape(-1, block * block)
+
+    # Statistics per block:
+    mu_a, mu_b = a.mean(axis=1), b.mean(axis=1)
+    var_a, var_b = a.var(axis=1), b.var(axis=1)
+    cov = ((a - mu_a[:, None]) * (b - mu_b[:, None])).mean(axis=1)
+
+    score = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(score.mean())
+
+
+def encode_png(img) -> bytes:
+    """
+    Encode `img` (PIL Image) as PNG with maximum (lossless) compression.
+    """
+    buffer = BytesIO()
+    img.save(buffer, format='PNG', optimize=True, compress_level=9)
+    return buffer.getvalue()
+
+
+def optimize_png(path, min_ssim=0.98, colors=256, write=True) -> dict:
+    """
+    Reduce the size of a PNG file. Two encodings are tried: lossless
+    maximum compression and quantization to a palette of `colors`
+    (good for flat graphics such as logos). The palette version is
+    chosen if it is smaller and its SSIM with respect to the original
+    is at least `min_ssim`. The file is only replaced if the chosen
+    encoding is smaller than the original file.
+
+    Parameters
+    ----------
+    path : str or Path
+        The PNG file.
+    min_ssim : float
+        Minimum structural similarity (see `ssim()`) accepted for
+        the palette version. Use a value above 1 to only compress
+        losslessly.
+    colors : int
+        Number of colors in the palette (at most 256).
+    write : bool
+        Whether to replace the file. If False, only report the
+        possible savings.
+
+    Returns
+    -------
+    result : dict
+        The filename, the original and new sizes (in bytes), the
+        encoding chosen ('lossless', 'palette' or 'unchanged') and
+        the SSIM of the palette version (None if it was not smaller
+        than the other options, so no SSIM was needed).
+    """
+    path = Path(path)
+    original_bytes = path.stat().st_size
+    with Image.open(path) as img:
+        img.load()
+
+    # Keep original mode (e.g. transparency) for lossless compression:
+    candidates = {'lossless': encode_png(img)}
+
+    # Palette version (keeping the transparency of palette images):
+    score = None
+    if min_ssim <= 1 and img.mode in {'RGB', 'L', 'P'}:
+        if img.mode == 'P' and 'transparency' in img.info:
+            source = img.convert('RGBA')
+            quantized = source.quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+        else:
+            source = img.convert('RGB')
+            quantized = source.quantize(colors=colors, method=Image.Quantize.MEDIANCUT)
+        content = encode_png(quantized)
+        # The SSIM is only needed if the palette version would be chosen:
+        if len(content) < min(len(candidates['lossless']), original_bytes):
+            score = ssim(source, quantized)
+            if source.mode == 'RGBA':
+                score = min(score, ssim(source.getchannel('A'), quantized.convert('RGBA').getchannel('A')))
+            if score >= min_ssim:
+                candidates['palette'] = content
+
+    # Choose smallest encoding:
+    mode = min(candidates, key=lambda k: len(candidates[k]))
+    content = candidates[mode]
+    if len(content) >= original_bytes:
+        mode, new_bytes = 'unchanged', original_bytes
+    else:
+        new_bytes = len(content)
+        if write == True:
+            path.write_bytes(content)
+
+    return {'file': path.name, 'original_bytes': original_bytes, 'new_bytes': new_bytes, 'mode': mode, 'ssim': score}
+
+
+def optimize_folder(folder='../imagens/', pattern='*.png', min_ssim=0.98, colors=256, write=True,
+                    max_processes=None, report_path=None, verbose=False) -> dict:
+    """
+    Optimize all PNG files in a folder (see `optimize_png()`) using a pool
+    of processes. It can be used as a one-off migration of existing images.
+
+    Parameters
+    ----------
+    folder : str or Path
+        Folder containing the images.
+    pattern : str
+        Glob pattern of the images to optimize.
+    min_ssim : float
+        Minimum SSIM accepted for palette quantization.
+    colors : int
+        Number of colors in the palette.
+    write : bool
+        Whether to replace the files (False for a dry run).
+    max_processes : int or None
+        Number of processes. If None, use the number of CPUs.
+    report_path : str, Path or None
+        If provided, save the report to this JSON file.
+    verbose : bool
+        Whether to print the summary.
+
+    Returns
+    -------
+    report : dict
+        Under 'summary', the number of files, the number of files in
+        each encoding and the total bytes before and after and saved.
+        Under 'files', the result for each file.
+    """
+    paths = sorted(Path(folder).glob(pattern))
+    with ProcessPoolExecutor(max_workers=max_processes) as pool:
+        results = list(pool.map(optimize_png, paths, [min_ssim] * len(paths), [colors] * len(paths), [write] * len(paths)))
+
+    # Summarize:
+    modes = [r['mode'] for r in results]
+    original = sum([r['original_bytes'] for r in results])
+    new = sum([r['new_bytes'] for r in results])
+    summary = {'n_files': len(results), 'n_lossless': modes.count('lossless'), 'n_palette': modes.count('palette'),
+               'n_unchanged': modes.count('unchanged'), 'original_bytes': original, 'new_bytes': new,
+               'bytes_saved': original - new, 'written': write}
+    report = {'summary': summary, 'files': results}
+
+    if report_path != None:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=1, ensure_ascii=False)
+    if verbose == True:
+        print(json.dumps(summary, indent=1))
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Optimize the size of the PNG images of CORDATA usecases.')
+    parser.add_argument('folder', nargs='?', default='../imagens/', help='Folder with the PNG images.')
+    parser.add_argument('--pattern', default='*.png', help='Glob pattern of the images to optimize.')
+    parser.add_argument('--min-ssim', type=float, default=0.98, help='Minimum SSIM accepted for palette quantization.')
+    parser.add_argument('--colors', type=int, default=256, help='Number of colors in the palette.')
+    parser.add_argument('--dry-run', action='store_true', help='Only report the savings, without changing files.')
+    parser.add_argument('--report', default=None, help='JSON file where to save the report.')
+    args = parser.parse_args()
+
+    optimize_folder(args.folder, args.pattern, args.min_ssim, args.colors, write=(not args.dry_run),
+                    report_path=args.report, verbose=True)
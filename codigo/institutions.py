@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Index of institutions' names to CGU IDs, with exact, accent-folded and fuzzy lookup
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+import json
+import argparse
+import unicodedata
+from glob import glob
+from pathlib import Path
+from collections import defaultdict
+
+
+# Hard-coded:
+INDEX_FILE = 'data/institutions_index.json'
+CGU_PATTERN = '../dados/aux/organizacao_*.json'
+MIN_CONFIDENCE = 0.85
+
+# Confidence of each kind of match (fuzzy matches get their similarity, capped 
+# below MIN_CONFIDENCE since similar names may belong to other institutions, 
+# e.g. 'FURG' and 'UFRGS'; acronyms of several institutions are also below it):
+EXACT_CONFIDENCE   = 1.0
+FOLDED_CONFIDENCE  = 0.99
+ACRONYM_CONFIDENCE = 0.9
+FUZZY_CONFIDENCE   = 0.8
+AMBIGUOUS_ACRONYM_CONFIDENCE = 0.5
+# Minimum similarity of fuzzy matches reported for review:
+MIN_REVIEW_SIMILARITY = 0.6
+
+
+def fold(name: str) -> str:
+    """
+    Fold an institution's `name` (str) for comparison: lowercase,
+    remove accents, replace punctuation (including the hyphens in
+    slugs like 'banco-central-do-brasil-bcb') by spaces and collapse
+    whitespace.
+
+    Example input:  'Agência Nacional de Águas - ANA'
+    Example output: 'agencia nacional de aguas ana'
+    """
+    text = unicodedata.normalize('NFKD', name.lower())
+    text = ''.join([c for c in text if not unicodedata.combining(c)])
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def trigrams(folded: str) -> set:
+    """
+    Return the set of character trigrams of a `folded` name (str),
+    padded with spaces so word boundaries count.
+    """
+    padded = f'  {folded} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def acronym(name: str):
+    """
+    Return the folded acronym at the end of an institution's `name`
+    (str), as in 'Arquivo Nacional - AN', or None if there is none.
+    """
+    match = re.search(r'\s[-–]\s*([A-Za-z]{2,})\s*$', name)
+    if match == None:
+        return None
+    return fold(match.group(1))
+
+
+class InstitutionIndex:
+    """
+    Lookup of institutions' names (e.g. usecase authors and dataset
+    institutions) to their IDs in CGU's Portal Brasileiro de Dados
+    Abertos. Names are matched exactly, then accent-folded (with or
+    without their final acronym), then by acronym alone and finally
+    by trigram similarity, each with a confidence score. Fuzzy
+    matches never reach MIN_CONFIDENCE: they are only suggestions,
+    to be reviewed.
+    """
+    def __init__(self, institutions: list):
+        """
+        Parameters
+        ----------
+        institutions : list of dicts
+            The institutions' names ('titulo') and IDs ('id').
+        """
+        self.names = [i['titulo'] for i in institutions]
+        self.ids = [i['id'] for i in institutions]
+        self.folded = [fold(n) for n in self.names]
+
+        self.exact = {n: pos for pos, n in enumerate(self.names)}
+        self.by_folded = dict()
+        self.by_acronym = defaultdict(list)
+        self.postings = defaultdict(set)
+        self.n_trigrams = []
+        for pos, (name, folded) in enumerate(zip(self.names, self.folded)):
+            self.by_folded.setdefault(folded, pos)
+            if acronym(name) != None:
+                self.by_acronym[acronym(name)].append(pos)
+                self.by_folded.setdefault(fold(re.sub(r'\s[-–]\s*[A-Za-z]{2,}\s*$', '', name)), pos)
+            grams = trigrams(folded)
+            self.n_trigrams.append(len(grams))
+            for g in grams:
+                self.postings[g].add(pos)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_cgu_files(cls, json_pattern=CGU_PATTERN):
+        """
+        Build the index from CGU's JSON files matching `json_pattern`
+        (str), each containing a list of institutions with their name
+        ('titulo') and ID ('id').
+        """
+        institutions = []
+        for f in sorted(glob(json_pattern)):
+            with open(f, 'r') as fp:
+                institutions += [{'titulo': i['titulo'], 'id': i['id']} for i in json.load(fp)]
+        institutions = sorted(institutions, key=lambda i: i['titulo'])
+
+        # Security check: no repeated names:
+        assert len({i['titulo'] for i in institutions}) == len(institutions), 'Repeated institution names in CGU files.'
+
+        return cls(institutions)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        """
+        Load the index saved at `path` (str or Path). If the file
+        does not exist, return an empty index (which finds no IDs).
+        """
+        if Path(path).exists() == False:
+            return cls([])
+        with open(path, 'r') as f:
+            return cls(json.load(f)['institutions'])
+
+    def save(self, path=INDEX_FILE):
+        """
+        Save the index's institutions to `path` (str or Path). The
+        lookup tables are rebuilt when loading.
+        """
+        institutions = [{'titulo': n, 'id': i} for n, i in zip(self.names, self.ids)]
+        with open(path, 'w') as f:
+            json.dump({'institutions': institutions}, f, indent=1, ensure_ascii=False)
+
+    def fuzzy(self, folded: str):
+        """
+        Return the position of the institution whose folded name is
+        the most similar to `folded` (str), by the Dice coefficient
+        of their trigrams, and the similarity (float between 0 and 1).
+        Return (None, 0.0) if no name shares a trigram.
+        """
+        grams = trigrams(folded)
+        shared = defaultdict(int)
+        for g in grams:
+            for pos in self.postings.get(g, ()):
+                shared[pos] += 1
+        if len(shared) == 0:
+            return None, 0.0
+        scores = {pos: 2 * n / (len(grams) + self.n_trigrams[pos]) for pos, n in shared.items()}
+        best = max(scores, key=lambda pos: (scores[pos], -pos))
+        return best, scores[best]
+
+    def lookup(self, name: str) -> dict:
+        """
+        Find the institution with `name` (str).
+
+        Returns
+        -------
+        match : dict
+            The institution's 'id' and 'name' (None if not found),
+            the 'method' used ('exact', 'folded', 'acronym', 'fuzzy'
+            or None) and the 'confidence' (float between 0 and 1).
+            Fuzzy matches also have the trigram 'similarity' (float),
+            while their confidence is at most FUZZY_CONFIDENCE. 
+            Acronyms of several institutions are matched to the first
+            one with AMBIGUOUS_ACRONYM_CONFIDENCE, listing all their
+            names in 'candidates'.
+        """
+        no_match = {'id': None, 'name': None, 'method': None, 'confidence': 0.0}
+        if name == None or len(self.names) == 0:
+            return no_match
+
+        def found(pos, method, confidence):
+            return {'id': self.ids[pos], 'name': self.names[pos], 'method': method, 'confidence': confidence}
+
+        name = name.strip()
+        if name in self.exact:
+            return found(self.exact[name], 'exact', EXACT_CONFIDENCE)
+        folded = fold(name)
+        if folded in self.by_folded:
+            return found(self.by_folded[folded], 'folded', FOLDED_CONFIDENCE)
+        candidates = self.by_acronym.get(folded, [])
+        if len(candidates) == 1:
+            return found(candidates[0], 'acronym', ACRONYM_CONFIDENCE)
+        if len(candidates) > 1:
+            match = found(candidates[0], 'acronym', AMBIGUOUS_ACRONYM_CONFIDENCE)
+            match['candidates'] = [self.names[pos] for pos in candidates]
+            return match
+        pos, score = self.fuzzy(folded)
+        if pos == None:
+            return no_match
+        match = found(pos, 'fuzzy', min(score, FUZZY_CONFIDENCE))
+        match['similarity'] = score
+        return match
+
+    def resolve(self, names, min_confidence=MIN_CONFIDENCE) -> dict:
+        """
+        Look up all unique `names` (iterable of str or None) at once.
+
+        Returns
+        -------
+        name2id : InstitutionResolver
+            Map from each name to its institution's ID, or to None
+            if not found with at least `min_confidence` (float).
+            Other names are looked up when first accessed.
+        """
+        name2id = InstitutionResolver(self, min_confidence)
+        for name in set(names):
+            name2id[name]
+        return name2id
+
+
+class InstitutionResolver(dict):
+    """
+    A dict from institutions' names to IDs that looks up each missing
+    name in an `InstitutionIndex` (once) and returns None for names
+    not found with enough confidence. It replaces the exact-match
+    defaultdict formerly used for `inst2id`. Names not assigned but
+    with a fuzzy match of at least `min_review_similarity` or matching
+    an acronym (e.g. of several institutions) are kept, with their 
+    match, in the `review` dict.
+    """
+    def __init__(self, index: InstitutionIndex, min_confidence=MIN_CONFIDENCE, min_review_similarity=MIN_REVIEW_SIMILARITY):
+        super().__init__()
+        self.index = index
+        self.min_confidence = min_confidence
+        self.min_review_similarity = min_review_similarity
+        self.review = dict()
+
+    def __missing__(self, name):
+        match = self.index.lookup(name)
+        self[name] = match['id'] if match['confidence'] >= self.min_confidence else None
+        if self[name] == None and match['method'] == 'acronym':
+            self.review[name] = match
+        elif self[name] == None and match['method'] == 'fuzzy' and match['similarity'] >= self.min_review_similarity:
+            self.review[name] = match
+        return self[name]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the index of institutions' names to CGU IDs.")
+    parser.add_argument('--cgu', default=CGU_PATTERN, help="Glob pattern of CGU's JSON files with institutions.")
+    parser.add_argument('--output', default=INDEX_FILE, help='JSON file where to save the index.')
+    parser.add_argument('--lookup', nargs='*', default=[], help='Names to look up in the index built.')
+    args = parser.parse_args()
+
+    index = InstitutionIndex.from_cgu_files(args.cgu)
+    index.save(args.output)
+    print(f'{len(index)} institutions saved to {args.output}.')
+    for name in args.lookup:
+        print(name, '->', index.lookup(name))
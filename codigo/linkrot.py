@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Asynchronous link-rot checker for the URLs of CORDATA's usecases and datasets
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+from pathlib import Path
+from urllib.parse import urlparse
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import webclient as web
+
+
+# Default configuration:
+DB_FILE = 'data/linkrot.sqlite'
+URL_FIELDS = ['url', 'url_source']           # Usecase fields with URLs (plus the datasets' 'data_url').
+MAX_CONNECTIONS = 32                         # Requests in flight, over all hosts.
+PER_HOST = 2                                 # Requests in flight to the same host.
+DELAY = 1.0                                  # Seconds between the starts of requests to the same host.
+TIMEOUT = 20                                 # Seconds for each request.
+MAX_AGE_DAYS = 7                             # URLs checked more recently than this are skipped.
+MIN_FAILURES = 2                             # Consecutive failed checks for a URL to count as broken.
+HEAD_FALLBACK_STATUSES = {403, 405, 501}     # Statuses after which HEAD is retried as GET.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    url        TEXT NOT NULL,
+    checked_at TEXT NOT NULL,
+    status     INTEGER,
+    ok         INTEGER NOT NULL,
+    error      TEXT,
+    elapsed    REAL,
+    final_url  TEXT
+);
+CREATE INDEX IF NOT EXISTS checks_url ON checks (url, checked_at);
+"""
+
+
+#################
+### Database ###
+#################
+
+def connect(path=DB_FILE) -> sqlite3.Connection:
+    """
+    Open (and create, if needed) the SQLite database at `path`
+    (str) with the history of checks of each URL.
+    """
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def save_checks(con: sqlite3.Connection, results: list):
+    """
+    Append the `results` (list of dicts, see `check_url()`) to the
+    history of checks in the database `con`.
+    """
+    rows = [(r['url'], r['checked_at'], r['status'], int(r['ok']), r['error'], r['elapsed'], r['final_url'])
+            for r in results]
+    with con:
+        con.executemany('INSERT INTO checks VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def last_checked(con: sqlite3.Connection) -> dict:
+    """
+    Return a dict from each URL in the database `con` to the date
+    (str, ISO format) of its last check.
+    """
+    return dict(con.execute('SELECT url, MAX(checked_at) FROM checks GROUP BY url'))
+
+
+def url_history(con: sqlite3.Connection, url: str, limit=10) -> list:
+    """
+    Return the last `limit` (int) checks of `url` (str) in the
+    database `con`, newest first, as a list of dicts.
+    """
+    cur = con.execute('SELECT * FROM checks WHERE url = ? ORDER BY checked_at DESC LIMIT ?', (url, limit))
+    cols = [c[0] for c in cur.description]
+    return [dict(zip(cols, row)) for row in cur]
+
+
+def broken_urls(con: sqlite3.Connection, min_failures=MIN_FAILURES) -> dict:
+    """
+    Find the URLs whose last `min_failures` (int) checks in the
+    database `con` all failed (a single success in between means
+    the failure was temporary).
+
+    Returns
+    -------
+    broken : dict
+        Map from each broken URL to its last check (dict).
+    """
+    query = """
+    SELECT url, checked_at, status, error, ok,
+           ROW_NUMBER() OVER (PARTITION BY url ORDER BY checked_at DESC) AS n
+    FROM checks
+    """
+    last = defaultdict(list)
+    for url, checked_at, status, error, ok, n in con.execute(f'SELECT * FROM ({query}) WHERE n <= ?', (min_failures,)):
+        last[url].append({'checked_at': checked_at, 'status': status, 'error': error, 'ok': bool(ok)})
+    return {url: sorted(checks, key=lambda c: c['checked_at'])[-1] for url, checks in last.items()
+            if len(checks) >= min_failures and not any(c['ok'] for c in checks)}
+
+
+#############
+### Links ###
+#############
+
+def is_checkable(url) -> bool:
+    """
+    Return whether `url` is an HTTP(S) URL with a host (empty
+    placeholders like 'https://' are not).
+    """
+    if isinstance(url, str) == False:
+        return False
+    parsed = urlparse(url.strip())
+    return parsed.scheme in {'http', 'https'} and len(parsed.netloc) > 0
+
+
+def collect_links(usecases: list, url_fields=URL_FIELDS) -> dict:
+    """
+    List the URLs in `usecases` (list of dicts): those in
+    `url_fields` (list of str) and in the datasets' 'data_url'.
+
+    Returns
+    -------
+    links : dict
+        Map from each URL (str) to the set of places where it
+        appears: tuples of usecase hash_id and field.
+    """
+    links = defaultdict(set)
+    for uc in usecases:
+        for field in url_fields:
+            if is_checkable(uc.get(field)):
+                links[uc[field].strip()].add((uc['hash_id'], field))
+        for ds in uc.get('datasets', []):
+            if is_checkable(ds.get('data_url')):
+                links[ds['data_url'].strip()].add((uc['hash_id'], 'data_url'))
+    return dict(links)
+
+
+def stale_first(urls, checked: dict, max_age_days=MAX_AGE_DAYS, now=None) -> list:
+    """
+    Sort `urls` (iterable of str) for checking: never checked first,
+    then from the oldest check to the newest, dropping those checked
+    in the last `max_age_days` (float), according to `checked` (dict
+    from URL to date of its last check, see `last_checked()`).
+    """
+    now = datetime.now() if now == None else now
+    limit = (now - timedelta(days=max_age_days)).isoformat(timespec='seconds')
+    stale = [u for u in urls if checked.get(u, '') <= limit]
+    return sorted(stale, key=lambda u: (checked.get(u, ''), u))
+
+
+#################
+### Checking ###
+#################
+
+class HostThrottle:
+    """
+    Politeness towards each host: at most `per_host` requests in
+    flight and at least `delay` seconds between the starts of
+    requests to the same host.
+    """
+    def __init__(self, per_host=PER_HOST, delay=DELAY):
+        self.per_host = per_host
+        self.delay = delay
+        self.semaphores = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        self.locks = defaultdict(asyncio.Lock)
+        self.last_start = defaultdict(float)
+
+    async def wait_turn(self, host: str, global_limit=None):
+        """
+        Wait until a request to `host` (str) may start. If a
+        `global_limit` (Semaphore) is given, it is acquired only
+        after the host's delay (so no global slot is held while
+        waiting) and must be released by the caller once the
+        request is done.
+        """
+        async with self.locks[host]:
+            wait = self.last_start[host] + self.delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if global_limit != None:
+                await global_limit.acquire()
+            self.last_start[host] = time.monotonic()
+
+
+async def request_status(session, method: str, url: str):
+    """
+    Send a `method` (str) request to `url` (str) through the
+    aiohttp `session`, following redirects and without reading
+    the body. Return the status and the final URL.
+    """
+    async with session.request(method, url, allow_redirects=True) as response:
+        return response.status, str(response.url)
+
+
+async def check_url(session, url: str, throttle: HostThrottle, global_limit: asyncio.Semaphore) -> dict:
+    """
+    Check whether `url` (str) resolves, with a HEAD request (or a GET,
+    if the server refuses HEAD), respecting the limits of `throttle`
+    (HostThrottle) and `global_limit` (Semaphore).
+
+    Returns
+    -------
+    result : dict
+        The URL, the date of the check, the HTTP status (None if the
+        request failed), whether it is ok (status below 400), the
+        error (if any), the time taken and the final URL.
+    """
+    host = urlparse(url).netloc.lower()
+    status, final_url, error = None, None, None
+    checked_at = datetime.now().isoformat(timespec='seconds')
+
+    async with throttle.semaphores[host]:
+        t0 = time.monotonic()
+        try:
+            # Wait for the host's turn first, then hold a global slot just for the request:
+            await throttle.wait_turn(host, global_limit)
+            t0 = time.monotonic()
+            try:
+                status, final_url = await request_status(session, 'HEAD', url)
+            finally:
+                global_limit.release()
+            if status in HEAD_FALLBACK_STATUSES:
+                await throttle.wait_turn(host, global_limit)
+                try:
+                    status, final_url = await request_status(session, 'GET', url)
+                finally:
+                    global_limit.release()
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        elapsed = time.monotonic() - t0
+
+    return {'url': url, 'checked_at': checked_at, 'status': status, 'ok': status != None and status < 400,
+            'error': error, 'elapsed': elapsed, 'final_url': final_url}
+
+
+async def check_urls(urls: list, max_connections=MAX_CONNECTIONS, per_host=PER_HOST, delay=DELAY, timeout=TIMEOUT) -> list:
+    """
+    Check all `urls` (list of str) concurrently, with at most
+    `max_connections` (int) requests in flight, `per_host` (int)
+    per host and `delay` (float) seconds between the starts of
+    requests to the same host. Each request times out after
+    `timeout` (float) seconds. Returns a list of dicts (see
+    `check_url()`), in the same order as `urls`.
+    """
+    import aiohttp
+
+    throttle = HostThrottle(per_host, delay)
+    global_limit = asyncio.Semaphore(max_connections)
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=per_host)
+    headers = {'User-Agent': web.USER_AGENT}
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        return await asyncio.gather(*[check_url(session, u, throttle, global_limit) for u in urls])
+
+
+def run_checks(usecases: list, db_path=DB_FILE, max_age_days=MAX_AGE_DAYS, limit=None, max_connections=MAX_CONNECTIONS,
+               per_host=PER_HOST, delay=DELAY, timeout=TIMEOUT, batch_size=200, verbose=False) -> dict:
+    """
+    Check the URLs of `usecases` (list of dicts) that were not checked
+    in the last `max_age_days` (float), stalest first, and append the
+    results to the database at `db_path` (str). Results are saved every
+    `batch_size` (int) URLs, so an interrupted run keeps its progress.
+
+    Parameters
+    ----------
+    usecases : list of dicts
+        The usecases whose URLs should be checked.
+    db_path : str
+        SQLite database with the history of checks.
+    max_age_days : float
+        URLs checked more recently than this are skipped.
+    limit : int or None
+        Maximum number of URLs to check in this run.
+    max_connections, per_host, delay, timeout
+        See `check_urls()`.
+    batch_size : int
+        Number of URLs checked between saves.
+    verbose : bool
+        Whether to print the progress.
+
+    Returns
+    -------
+    report : dict
+        Number of URLs found, checked and failed, and the time taken.
+    """
+    t0 = time.perf_counter()
+    links = collect_links(usecases)
+    con = connect(db_path)
+    queue = stale_first(links.keys(), last_checked(con), max_age_days)
+    if limit != None:
+        queue = queue[:limit]
+
+    n_failed = 0
+    for start in range(0, len(queue), batch_size):
+        results = asyncio.run(check_urls(queue[start:start + batch_size], max_connections, per_host, delay, timeout))
+        save_checks(con, results)
+        n_failed += sum(1 for r in results if r['ok'] == False)
+        if verbose == True:
+            print(f'{start + len(results)}/{len(queue)} URLs checked, {n_failed} failed.')
+    con.close()
+
+    return {'n_urls': len(links), 'n_checked': len(queue), 'n_failed': n_failed, 'time': time.perf_counter() - t0}
+
+
+def broken_usecases(usecases: list, db_path=DB_FILE, min_failures=MIN_FAILURES) -> dict:
+    """
+    Find the `usecases` (list of dicts) with broken links according
+    to the database at `db_path` (str) (see `broken_urls()`).
+
+    Returns
+    -------
+    broken : dict
+        Map from the hash_id of each usecase with broken links to
+        the list of its broken URLs (dicts with the 'url', the
+        'field' where it appears and its last 'status' or 'error').
+    """
+    if Path(db_path).exists() == False:
+        return dict()
+    con = connect(db_path)
+    bad = broken_urls(con, min_failures)
+    con.close()
+
+    broken = defaultdict(list)
+    for url, places in collect_links(usecases).items():
+        if url in bad:
+            for hash_id, field in sorted(places, key=str):
+                broken[hash_id].append({'url': url, 'field': field, 'status': bad[url]['status'], 'error': bad[url]['error']})
+    return dict(broken)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check whether the URLs of CORDATA's usecases and datasets still resolve.")
+    parser.add_argument('--data', default='data/usecases_current.json', help='JSON file with the usecases.')
+    parser.add_argument('--db', default=DB_FILE, help='SQLite database with the history of checks.')
+    parser.add_argument('--max-age-days', type=float, default=MAX_AGE_DAYS, help='Skip URLs checked more recently.')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum number of URLs to check.')
+    parser.add_argument('--connections', type=int, default=MAX_CONNECTIONS, help='Maximum requests in flight.')
+    parser.add_argument('--per-host', type=int, default=PER_HOST, help='Maximum requests in flight per host.')
+    parser.add_argument('--delay', type=float, default=DELAY, help='Seconds between requests to the same host.')
+    args = parser.parse_args()
+
+    usecases = json.loads(Path(args.data).read_text(encoding='utf-8'))['data']
+    report = run_checks(usecases, args.db, args.max_age_days, args.limit, args.connections, args.per_host, args.delay,
+                        verbose=True)
+    print(json.dumps(report, indent=1))
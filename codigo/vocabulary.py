@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compiled translation tables for CORDATA's controlled vocabularies
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import csv
+import numpy as np
+
+
+# Hard-coded:
+TRANSLATIONS_FILE = 'data/translations.csv'
+SOURCE_LANGUAGE = 'ptbr'
+# Usecase fields with controlled terms and the fields with their translations:
+TRANSLATED_FIELDS = {'type': 'type_es', 'topics': 'topics_es', 'countries': 'countries_es'}
+
+
+class Vocabulary:
+    """
+    A controlled vocabulary: each term (in the source language) gets
+    a small integer code, which indexes arrays with its labels in
+    every language.
+    """
+    def __init__(self, terms: list, labels: dict):
+        """
+        Parameters
+        ----------
+        terms : list of str
+            The controlled terms, in the source language. The code
+            of each term is its position in the list.
+        labels : dict
+            Map from language (str) to the list of labels of the
+            terms (in the same order as `terms`).
+        """
+        self.terms = list(terms)
+        self.codes = {t: i for i, t in enumerate(self.terms)}
+        self.labels = {lang: np.array(l, dtype=object) for lang, l in labels.items()}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def encode(self, terms: list) -> np.ndarray:
+        """
+        Return the codes (array of ints) of the `terms` (list of str).
+        Raise a KeyError if a term is not in the vocabulary.
+        """
+        try:
+            return np.fromiter((self.codes[t] for t in terms), dtype=np.int16, count=len(terms))
+        except KeyError as e:
+            raise KeyError(f'Term {e} is not in the controlled vocabulary.') from None
+
+    def translate(self, terms: list, lang: str) -> list:
+        """
+        Return the labels in language `lang` (str) of the `terms`
+        (list of str).
+        """
+        return self.labels[lang][self.encode(terms)].tolist()
+
+
+def read_translation_table(path=TRANSLATIONS_FILE) -> dict:
+    """
+    Read the CSV file at `path` (str) with one column per language
+    and one row per term, and return a dict from language to the
+    list of labels.
+    """
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    languages = rows[0].keys() if len(rows) > 0 else []
+    return {lang: [row[lang] for row in rows] for lang in languages}
+
+
+def compile_vocabulary(terms: list, table: dict, source=SOURCE_LANGUAGE) -> Vocabulary:
+    """
+    Build the vocabulary of controlled `terms` (list of str, in the
+    `source` language) with their labels in the translation `table`
+    (dict, see `read_translation_table()`).
+
+    Raises a ValueError listing the terms without a translation to
+    every language, or with conflicting translations, so incomplete
+    tables fail when loaded instead of when a usecase is saved.
+    """
+    # Translations of each term (a term may appear more than once in the table):
+    found = dict()
+    for i, term in enumerate(table[source]):
+        found.setdefault(term, set()).add(tuple(table[lang][i] for lang in table))
+
+    missing = [t for t in terms if t not in found or any(len(l.strip()) == 0 for l in list(found[t])[0])]
+    conflicting = [t for t in terms if t in found and len(found[t]) > 1]
+    if len(missing) > 0 or len(conflicting) > 0:
+        raise ValueError(f'Translation table is incomplete. Missing: {missing}. Conflicting: {conflicting}.')
+
+    rows = [list(found[t])[0] for t in terms]
+    labels = {lang: [r[j] for r in rows] for j, lang in enumerate(table)}
+    return Vocabulary(terms, labels)
+
+
+def compile_vocabularies(options: dict, path=TRANSLATIONS_FILE, source=SOURCE_LANGUAGE) -> dict:
+    """
+    Compile the vocabularies of the controlled fields, reading the
+    translation table at `path` (str) only once.
+
+    Parameters
+    ----------
+    options : dict
+        Map from usecase field (str, e.g. 'topics') to its list of
+        controlled terms. If the list is None, all terms in the
+        translation table are accepted for that field.
+    path : str
+        CSV file with one column per language.
+    source : str
+        Language of the terms.
+
+    Returns
+    -------
+    vocabularies : dict
+        Map from field to its `Vocabulary`.
+    """
+    table = read_translation_table(path)
+    all_terms = list(dict.fromkeys(table[source]))
+    return {field: compile_vocabulary(all_terms if terms is None else terms, table, source)
+            for field, terms in options.items()}
+
+
+def translate_usecases(usecases: list, vocabularies: dict, lang='es', fields=TRANSLATED_FIELDS):
+    """
+    Fill, in place, the translated fields of all `usecases` (list of
+    dicts) at once: the terms of each field in all usecases are encoded
+    together, their labels in language `lang` (str) are taken by array
+    indexing and split back into the usecases.
+
+    Parameters
+    ----------
+    usecases : list of dicts
+        The usecases to translate.
+    vocabularies : dict
+        Map from field to its `Vocabulary` (see
+        `compile_vocabularies()`).
+    lang : str
+        Language of the translations.
+    fields : dict
+        Map from the field with controlled terms to the field where
+        to store their translations. Fields set to None remain None.
+    """
+    for field, translated_field in fields.items():
+        term_lists = [uc[field] for uc in usecases]
+        flat = [t for terms in term_lists if terms != None for t in terms]
+        labels = vocabularies[field].labels[lang][vocabularies[field].encode(flat)].tolist()
+
+        # Split the labels back into usecases:
+        start = 0
+        for uc, terms in zip(usecases, term_lists):
+            if terms == None:
+                uc[translated_field] = None
+            else:
+                uc[translated_field] = labels[start:start + len(terms)]
+                start += len(terms)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared HTTP client (pooled connections and retries) for CORDATA.
+Copyright (C) 2026  Henrique S. Xavier
+Contact: contato@henriquexavier.net
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# Default configuration:
+TIMEOUT = (5, 20)           # Seconds to connect and to read.
+MAX_RETRIES = 3             # Retries for connection errors and the statuses below.
+BACKOFF_FACTOR = 0.5        # Wait 0.5s, 1s, 2s... between retries.
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+POOL_SIZE = 32              # Connections kept alive per host.
+USER_AGENT = 'CORDATA/1.0 (+https://cordata.ceweb.br)'
+
+# Shared session (created on first use):
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session(max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR, pool_size=POOL_SIZE) -> requests.Session:
+    """
+    Create a requests Session that keeps connections alive and
+    retries GET and HEAD requests, on both HTTP and HTTPS, with
+    exponential backoff. The `Retry-After` header sent by the
+    server (e.g. along with status 429 or 503) is respected.
+
+    Parameters
+    ----------
+    max_retries : int
+        Maximum number of retries for each request.
+    backoff_factor : float
+        Base waiting time (in seconds) for the exponential backoff.
+    pool_size : int
+        Maximum number of connections kept per host. It should be
+        at least the number of threads sharing the session.
+
+    Returns
+    -------
+    session : Session
+        The configured session.
+    """
+    retry = Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=frozenset(['GET', 'HEAD']), respect_retry_after_header=True,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT})
+
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Return the session shared by the whole process, creating
+    it if needed.
+    """
+    global _session
+    with _session_lock:
+        if _session == None:
+            _session = build_session()
+    return _session
+
+
+def get(url: str, timeout=TIMEOUT, **kwargs) -> requests.Response:
+    """
+    Make an HTTP GET request to `url` (str) with the shared
+    session and return the response. `timeout` (float or tuple)
+    is the time to wait for the connection and the response, in
+    seconds. Other arguments are passed to `Session.get()`.
+    """
+    return get_session().get(url, timeout=timeout, **kwargs)
+
+
+def head(url: str, timeout=TIMEOUT, **kwargs) -> requests.Response:
+    """
+    Make an HTTP HEAD request to `url` (str) with the shared
+    session and return the response. `timeout` (float or tuple)
+    is the time to wait for the connection and the response, in
+    seconds. Other arguments are passed to `Session.head()`.
+    """
+    return get_session().head(url, timeout=timeout, **kwargs)